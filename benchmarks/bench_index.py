@@ -0,0 +1,42 @@
+"""
+容器 indexOf 的耗时， 子控件列表 在前面 插入/去掉 之后 查找后面的子控件
+
+    python benchmarks/bench_index.py
+
+分别统计 indexOf 的时间， 和 包括 insert / remove 的总时间
+"""
+
+import time
+
+N = 5000
+ROUNDS = 1000
+
+
+def run(name, mutate):
+    from PySide6.QtWidgets import QWidget
+    from hyqt import Column
+
+    col = Column([QWidget() for _ in range(N)])
+    spare = [QWidget() for _ in range(ROUNDS)]
+
+    spent = 0
+    total = time.perf_counter()
+    for round in range(ROUNDS):
+        mutate(col, spare[round])
+        target = col.children[-1 - round % 10]
+        start = time.perf_counter()
+        assert col.children[col.indexOf(target)] is target
+        spent += time.perf_counter() - start
+
+    total = time.perf_counter() - total
+    print(f'{name:<28}: indexOf {spent:.3f}s, total {total:.3f}s, {ROUNDS} rounds in {N} children')
+
+
+if __name__ == '__main__':
+    from PySide6.QtWidgets import QApplication
+    app = QApplication([])
+
+    run('no change', lambda col, w: None)
+    run('remove front, look up tail', lambda col, w: col.remove(col.children[0]))
+    run('insert front, look up tail', lambda col, w: col.insert(0, w))
+    run('append, look up tail', lambda col, w: col.append(w))
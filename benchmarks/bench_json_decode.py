@@ -0,0 +1,87 @@
+"""
+比较 NAM 在界面线程解析 JSON、 decodeInThread 模式、
+以及 decodeInThread 加上 pauseGcWhileDecoding 时，
+收到一个很大的列表响应时 界面线程的卡顿
+
+    python benchmarks/bench_json_decode.py
+
+界面线程用一个 16ms 的定时器 模拟刷新帧， 记录从发出请求 到 okHandler 被调用 期间，
+相邻两帧之间的 最大间隔 和 超过 50ms 的帧数。
+每种模式在单独的子进程里运行
+"""
+
+import sys, json, time, threading, subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+N = 200000
+
+BODY = json.dumps({
+    'ret'   : 0,
+    'items' : [{'id': i, 'name': f'item {i}', 'tags': ['a', 'b'], 'score': i * 0.5}
+               for i in range(N)],
+}).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+def run(mode):
+    from PySide6.QtWidgets import QApplication
+    from PySide6 import QtCore
+    from hyqt.utils import NAM
+
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+
+    app = QApplication([])
+    nam = NAM(decodeInThread=mode != 'inline', pauseGcWhileDecoding=mode == 'thread+gc')
+
+    gaps = []
+    last = [time.perf_counter()]
+
+    def tick():
+        now = time.perf_counter()
+        gaps.append(now - last[0])
+        last[0] = now
+
+    timer = QtCore.QTimer()
+    timer.timeout.connect(tick)
+    timer.start(16)
+
+    def ok(retObj):
+        assert len(retObj['items']) == N
+        tick()
+        timer.stop()
+        app.quit()
+
+    def request():
+        gaps.clear()
+        last[0] = time.perf_counter()
+        nam.get(f'http://127.0.0.1:{srv.server_address[1]}/', okHandler=ok)
+
+    QtCore.QTimer.singleShot(100, request)
+    app.exec()
+
+    stalls = sum(1 for gap in gaps if gap > 0.05)
+    print(f'max frame gap {max(gaps)*1000:.0f}ms, frames over 50ms : {stalls}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+        sys.exit()
+
+    print(f'response size {len(BODY)/1024/1024:.1f}MB')
+    for mode in ['inline', 'thread', 'thread+gc']:
+        out = subprocess.run([sys.executable, __file__, mode],
+                             capture_output=True, text=True).stdout.strip()
+        print(f'{mode:>9} : {out}')
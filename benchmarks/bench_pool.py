@@ -0,0 +1,69 @@
+"""
+比较 打开/关闭 WidgetPool 时， 在页面间切换 的耗时
+
+    python benchmarks/bench_pool.py
+
+每次切换 把当前页面的控件 放回回收池（clear(recycle=True)）， 删除页面，
+再创建一个 同样类型、同样样式、不同文本 的新页面， 加入显示中的窗口。
+每种模式在单独的子进程里运行
+"""
+
+import sys, time, subprocess
+
+N = 1000
+ROUNDS = 10
+
+
+def build(round):
+    from hyqt import Column, Label, Button
+
+    children = []
+    for i in range(N):
+        if i % 2:
+            children.append(Label(f'label {round} {i}', color='SteelBlue', fontSize=13))
+        else:
+            children.append(Button(f'button {round} {i}', border='none', hoverColor='teal'))
+    return Column(children)
+
+
+def run(pooled):
+    from PySide6.QtWidgets import QApplication
+    from PySide6 import QtCore
+    from hyqt import Column, WidgetPool
+
+    app = QApplication([])
+    WidgetPool.enable(pooled)
+
+    host = Column([])
+    host.resize(800, 600)
+    host.show()
+
+    page = build(0)
+    host.append(page)
+    QApplication.processEvents()
+
+    start = time.perf_counter()
+    for round in range(1, ROUNDS + 1):
+        page.clear(recycle=True)
+        host.remove(page, deleteAlso=True)
+        # 真正删除 旧页面， 就像回到事件循环时一样
+        QApplication.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+
+        page = build(round)
+        host.append(page)
+        QApplication.processEvents()
+
+    spent = (time.perf_counter() - start) / ROUNDS
+    stats = WidgetPool.stats()
+    print(f'{spent*1000:.0f}ms per switch, pool hits {stats["hits"]} misses {stats["misses"]}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(sys.argv[1] == 'pooled')
+        sys.exit()
+
+    for mode in ['fresh', 'pooled']:
+        out = subprocess.run([sys.executable, __file__, mode], 
+                             capture_output=True, text=True).stdout.strip()
+        print(f'{N} widgets, {mode:>6} : {out}')
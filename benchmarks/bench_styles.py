@@ -0,0 +1,64 @@
+"""
+比较 每个控件单独样式表 和 StyleRegistry 共享样式表 两种模式下，
+创建并显示 一个包含 5000 个控件的 Column 的耗时，
+以及 显示之后 在另一个窗口里 使用一个新样式的耗时
+
+    python benchmarks/bench_styles.py
+
+应用级样式表 会影响之后创建的所有控件，所以每种模式在单独的子进程里运行
+"""
+
+import sys, time, subprocess
+
+N = 5000
+
+
+def build():
+    from hyqt import Column, Label, Button
+
+    children = []
+    for i in range(N):
+        if i % 2:
+            children.append(Label(f'label {i}', color='SteelBlue', fontSize=13))
+        else:
+            children.append(Button(f'button {i}', border='none', hoverColor='teal'))
+    return Column(children)
+
+
+def run(shared):
+    from PySide6.QtWidgets import QApplication
+    from hyqt import StyleRegistry
+
+    app = QApplication([])
+    StyleRegistry.enable(shared)
+
+    start = time.perf_counter()
+    col = build()
+    built = time.perf_counter()
+
+    StyleRegistry.flush()
+    col.show()
+    QApplication.processEvents()
+    shown = time.perf_counter()
+
+    # 显示之后 出现的新样式， 不应该让 已经显示的窗口 重新 polish
+    from hyqt import Label
+    lateStart = time.perf_counter()
+    other = Label('new style', color='Crimson', fontSize=15)
+    StyleRegistry.flush()
+    other.show()
+    QApplication.processEvents()
+    late = time.perf_counter() - lateStart
+
+    print(f'build {built-start:.3f}s, total {shown-start:.3f}s, late new style {late*1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(sys.argv[1] == 'shared')
+        sys.exit()
+
+    for mode in ['per-widget', 'shared']:
+        out = subprocess.run([sys.executable, __file__, mode], 
+                             capture_output=True, text=True).stdout.strip()
+        print(f'{N} widgets, {mode:>10} : {out}')
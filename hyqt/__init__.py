@@ -1,11 +1,14 @@
 from PySide6.QtWidgets import *
 from PySide6 import QtCore, QtGui
+from shiboken6 import isValid
 
-import random, string
+import random, string, bisect
 from .utils import *
 
 from dataclasses import dataclass
 from collections.abc import Callable
+from contextlib import contextmanager
+from functools import lru_cache
 
 from typing import TypedDict, Unpack, Required, NotRequired
 
@@ -15,6 +18,314 @@ def _randomString():
 
 
 
+class StyleRegistry:
+    """
+    共享样式表注册中心
+
+    缺省情况下，每个控件都有一个随机 objectName 和 自己的 styleSheet，
+    控件很多时，每个控件都要单独解析、polish 一次样式表。
+
+    调用 StyleRegistry.enable() 后，相同的样式只生成一条规则，
+    使用动态属性选择器 *[hyStyle="hyN"] ，
+    安装到 控件所在的 顶层窗口（没有上级的控件） 的样式表上，
+    样式表解析的开销 只和 不同样式的数量相关，而和控件数量无关。
+
+    一个顶层窗口 只安装 它里面的控件 用到的规则， 新的规则 追加在后面，
+    不会修改 QApplication 的样式表， 也就不会影响 其他窗口 和 不是 hyqt 创建的控件。
+
+    注意： 
+
+    - 安装在顶层窗口上的规则，优先级低于 控件及其上级容器 自己的 styleSheet
+    - 控件移到 另一个顶层窗口 后， 要调用 StyleRegistry.adopt(控件)， 
+      比如从 WidgetPool 取出的控件
+    """
+
+    enabled = False
+
+    # 动态属性名
+    propName = 'hyStyle'
+
+    # (style, hoverStyle) -> 样式类名
+    _classes : dict[tuple[str,str], str] = {}
+    # 样式类名 -> 规则
+    _rules : dict[str, str] = {}
+
+    # 顶层窗口样式表中 本注册中心 规则 的开始标记
+    _marker = '/* hyqt-shared-styles */'
+
+    # 还没有安装规则的 (控件, 是否包括里面的控件)
+    _pending : list = []
+    _installPending = False
+
+    @classmethod
+    def enable(cls, enabled=True):
+        """
+        打开/关闭 共享样式表模式，只影响之后创建的控件
+        """
+        cls.enabled = enabled
+
+    @classmethod
+    def classOf(cls, style:str, hoverStyle:str='') -> str:
+        """
+        返回该样式对应的样式类名，如果是新的样式，生成规则
+        """
+        key = (style, hoverStyle)
+        clsName = cls._classes.get(key)
+        if clsName is not None:
+            return clsName
+
+        clsName = f'hy{len(cls._classes)}'
+        cls._classes[key] = clsName
+
+        selector = f'*[{cls.propName}="{clsName}"]'
+        rule = ''
+        if style:
+            rule += f'{selector} {{\n{style}\n}}\n'
+        if hoverStyle:
+            rule += f'{selector}:hover {{\n{hoverStyle}\n}}\n'
+        cls._rules[clsName] = rule
+
+        return clsName
+
+    @classmethod
+    def apply(cls, widget:QWidget, style:str, hoverStyle:str=''):
+        """
+        设置控件的样式类， 并安排 把规则安装到它所在的顶层窗口上
+        """
+        widget.setProperty(cls.propName, cls.classOf(style, hoverStyle))
+        cls._schedule(widget, False)
+
+    @classmethod
+    def adopt(cls, widget:QWidget):
+        """
+        控件 移到另一个顶层窗口后， 安排 把它和它里面控件的规则 安装到新的顶层窗口上
+        """
+        cls._schedule(widget, True)
+
+    @classmethod
+    def _schedule(cls, widget, withChildren):
+        cls._pending.append((widget, withChildren))
+
+        # 同一轮事件循环里 新增的控件， 一起安装， 这时 它们通常已经加到了 上级容器里
+        if not cls._installPending:
+            cls._installPending = True
+            QtCore.QTimer.singleShot(0, cls.flush)
+
+    @classmethod
+    def flush(cls):
+        """
+        立即把 待安装的规则 安装到 各控件所在的顶层窗口上
+        """
+        cls._installPending = False
+        pending, cls._pending = cls._pending, []
+
+        # 顶层窗口 -> 需要的样式类名
+        needed = {}
+        for widget, withChildren in pending:
+            if not isValid(widget):
+                continue
+            names = needed.setdefault(widget.window(), set())
+            widgets = [widget] + widget.findChildren(QWidget) if withChildren else [widget]
+            for w in widgets:
+                clsName = w.property(cls.propName)
+                if clsName:
+                    names.add(clsName)
+
+        for window, names in needed.items():
+            sheet = window.styleSheet()
+            # 已经安装了的规则 不再重复
+            missing = [n for n in names if f'="{n}"]' not in sheet]
+            if not missing:
+                continue
+
+            if cls._marker not in sheet:
+                sheet += '\n' + cls._marker + '\n'
+            # 按生成的次序追加， 样式类名 是 hy + 序号
+            missing.sort(key=lambda n: int(n[2:]))
+            window.setStyleSheet(sheet + ''.join(cls._rules[n] for n in missing))
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {'classes': len(cls._classes), 'rules': len(cls._rules)}
+
+
+class _BatchBuild:
+    """
+    batch() 上下文 的状态
+    """
+    depth = 0
+
+    # 创建过程中 暂停了 布局和刷新 的容器
+    containers : list = []
+
+    # 延迟设置的 (widget, styleSheet)
+    styleSheets : list = []
+
+    @classmethod
+    def active(cls):
+        return cls.depth > 0
+
+    @classmethod
+    def finish(cls):
+        containers, cls.containers = cls.containers, []
+        styleSheets, cls.styleSheets = cls.styleSheets, []
+
+        # 先一次性设置样式，后面布局计算时 使用的是最终的 sizeHint
+        for widget, styleSheet in styleSheets:
+            if isValid(widget):
+                widget.setStyleSheet(styleSheet)
+
+        if StyleRegistry._installPending:
+            StyleRegistry.flush()
+
+        containers = [c for c in containers if isValid(c)]
+        batched = set(containers)
+
+        for c in containers:
+            c.lo.setEnabled(True)
+            c.setUpdatesEnabled(True)
+
+        # 只需要 激活 最外层容器的布局， 内层布局 会被递归激活
+        for c in containers:
+            if c.parentWidget() not in batched:
+                c.lo.activate()
+
+
+@contextmanager
+def batch():
+    """
+    批量创建界面，比如
+
+    with hyqt.batch():
+        page = Column(
+            Row(...),
+            Row(...),
+        )
+
+    在 with 里面创建的 Row/Column 容器，暂停 刷新 和 布局激活，
+    ss() 和 容器 的样式表 也延迟设置，
+    退出 with 时 统一设置样式，再一次性计算布局。
+
+    可以嵌套使用，只有最外层退出时才统一处理。
+    """
+    _BatchBuild.depth += 1
+    try:
+        yield
+    finally:
+        _BatchBuild.depth -= 1
+        if _BatchBuild.depth == 0:
+            _BatchBuild.finish()
+
+
+def _setStyleSheet(widget:QWidget, styleSheet:str):
+    if _BatchBuild.active():
+        _BatchBuild.styleSheets.append((widget, styleSheet))
+    else:
+        widget.setStyleSheet(styleSheet)
+
+
+def _applyStyle(widget:QWidget, style:str, hoverStyle:str='', 
+                styleSheet:str='', name:str|None=None):
+    """
+    把 ss() 和 容器 生成的 样式 设置到控件上
+    """
+    
+    if name:
+        widget.setObjectName(name)
+
+    # 共享样式表模式，相同样式 共用 一条规则
+    if StyleRegistry.enabled and (style or hoverStyle) and not name:
+        StyleRegistry.apply(widget, style, hoverStyle)
+        if styleSheet:
+            _setStyleSheet(widget, styleSheet)
+        return
+
+    if not name:
+        name = _randomString()   
+        widget.setObjectName(name)
+
+    totalStyleSheet = ''
+
+    if style:
+        totalStyleSheet += f'#{name} {{\n{style}\n}}\n\n'
+    
+    if hoverStyle:
+        totalStyleSheet += f'#{name}:hover {{\n{hoverStyle}\n}}\n\n'
+
+    if styleSheet:
+        totalStyleSheet += styleSheet
+
+    # 如果需要设置样式
+    if totalStyleSheet:  
+        _setStyleSheet(widget, totalStyleSheet)        
+
+
+def _buildStyleText(border=None, color=None, bgColor=None, 
+                    hoverColor=None, hoverBgColor=None,
+                    fontSize=None, fontWeight=None, fontFamily=None, padding=None,
+                    hExpanding=False, vExpanding=False):
+    """
+    根据样式参数 生成 (style, hoverStyle, 横向扩展策略, 纵向扩展策略)
+    """
+    style = ''
+    hoverStyle = ''
+
+    if border is not None:
+        style += f'  border: {border};\n'
+        
+    if color is not None:
+        style += f'  color: {color};\n'
+    
+    if bgColor is not None:
+        style += f'  background-color: {bgColor};\n'
+
+    if hoverColor is not None:
+        hoverStyle += f'  color: {hoverColor};\n'
+    
+    if hoverBgColor is not None:
+        hoverStyle += f'  background-color: {hoverBgColor};\n'
+
+    if fontSize is not None:
+        style += f'  font-size: {fontSize}px;\n'
+
+    if fontWeight is not None:
+        style += f'  font-weight: {fontWeight};\n'
+
+    if fontFamily is not None:
+        style += f'  font-family: {fontFamily};\n'
+    
+    if padding is not None:
+        style += f'  padding: {padding};\n'
+
+    hp = QSizePolicy.Expanding if hExpanding else QSizePolicy.Maximum
+    vp = QSizePolicy.Expanding if vExpanding else QSizePolicy.Maximum
+
+    return style, hoverStyle, hp, vp
+
+
+_cachedStyleText = lru_cache(maxsize=1024)(_buildStyleText)
+
+def setStyleCacheSize(maxsize:int):
+    """
+    设置 样式参数 到 样式文本 缓存的最大条数， 会清空原来的缓存
+    """
+    global _cachedStyleText
+    _cachedStyleText = lru_cache(maxsize=maxsize)(_buildStyleText)
+
+def _styleText(*args, **kwargs):
+    try:
+        return _cachedStyleText(*args, **kwargs)
+    # 参数不能 hash 时，不使用缓存
+    except TypeError:
+        return _buildStyleText(*args, **kwargs)
+
+def styleCacheInfo():
+    """
+    返回 样式文本 缓存的统计信息 (hits, misses, maxsize, currsize)
+    """
+    return _cachedStyleText.cache_info()
+
+
 # set style to widget 
 def ss(widget:QWidget,     
     size:tuple[int,int]|None=None,        
@@ -136,58 +447,12 @@ def ss(widget:QWidget,
     if align is not None:
         widget._hy_align = align
 
-    style = ''
-    hoverStyle = ''
-
-    if border is not None:
-        style += f'  border: {border};\n'
-        
-    if color is not None:
-        style += f'  color: {color};\n'
-    
-    if bgColor is not None:
-        style += f'  background-color: {bgColor};\n'
-
-    if hoverColor is not None:
-        hoverStyle += f'  color: {hoverColor};\n'
-    
-    if hoverBgColor is not None:
-        hoverStyle += f'  background-color: {hoverBgColor};\n'
-
-    if fontSize is not None:
-        style += f'  font-size: {fontSize}px;\n'
-
-    if fontWeight is not None:
-        style += f'  font-weight: {fontWeight};\n'
-
-    if fontFamily is not None:
-        style += f'  font-family: {fontFamily};\n'
-    
-    if padding is not None:
-        style += f'  padding: {padding};\n'
-    
-    if not name:
-        name = _randomString()   
-    
-    widget.setObjectName(name)
-
-    totalStyleSheet = ''
-
-    if style:
-        totalStyleSheet += f'#{name} {{\n{style}\n}}\n\n'
+    style, hoverStyle, hp, vp = _styleText(
+        border, color, bgColor, hoverColor, hoverBgColor,
+        fontSize, fontWeight, fontFamily, padding, hExpanding, vExpanding)
     
-    if hoverStyle:
-        totalStyleSheet += f'#{name}:hover {{\n{hoverStyle}\n}}\n\n'
-
-    if styleSheet:
-        totalStyleSheet += styleSheet
-
-    # 如果需要设置样式
-    if totalStyleSheet:  
-        widget.setStyleSheet(totalStyleSheet)        
+    _applyStyle(widget, style, hoverStyle, styleSheet, name)
     
-    hp = QSizePolicy.Expanding if hExpanding else QSizePolicy.Maximum
-    vp = QSizePolicy.Expanding if vExpanding else QSizePolicy.Maximum
     widget.setSizePolicy(hp, vp)
 
     return widget
@@ -287,11 +552,16 @@ class _WidgetArgs(TypedDict):
 
 
 
+# 样式参数名，只计算一次
+_styleArgNames = tuple(_WidgetArgs.__annotations__)
+_styleArgSet = frozenset(_styleArgNames)
+
+
 def _custom_widget_init(self, parentType, args, kwargs):
     def _popStyleArgs(kwargs:dict):
         retDict = {}
-        for name in _WidgetArgs.__annotations__.keys():
-            val = kwargs.pop(name,None)
+        for name in _styleArgSet.intersection(kwargs):
+            val = kwargs.pop(name)
             if val is not None:
                 retDict[name] = val
         return retDict
@@ -300,7 +570,159 @@ def _custom_widget_init(self, parentType, args, kwargs):
     parentType.__init__(self, *args, **kwargs)
     ss(self, **styleArgs)
 
-class Label(QLabel):
+class WidgetPool:
+    """
+    Label, Button, ButtonF, ButtonNB, Input 控件的 回收池
+
+    调用 WidgetPool.enable() 后， 
+    容器的 remove(child, recycle=True) / clear(recycle=True) 会把这些控件放回回收池，
+    之后 用相同的类 和 相同的样式参数 创建控件时，直接从回收池里取出，
+    只重置 文本、回调、图标、位置 等， 保留已经设置好的样式表，不需要再次生成和设置。
+
+    回收池里的控件 脱离原来的容器， 原来的页面被删除后 还可以复用，
+    取出的控件 和新建的一样， 加入显示中的容器时 才显示。
+
+    benchmarks/bench_pool.py 比较了 页面切换时 打开/关闭 回收池 的耗时
+
+    带有 样式参数 和 控件自己的参数（文本、回调、图标等） 以外的参数， 比如 Qt 属性 wordWrap=True，
+    创建的控件 不放入回收池， 也不从回收池里取， 因为这些设置 不能重置
+
+    注意： 复用的控件 上 后来自己添加的属性、信号连接 不会被重置
+    """
+
+    enabled = False
+
+    # 每一种 (类, 样式参数) 最多保留的控件数量
+    maxSize = 500
+
+    hits = 0
+    misses = 0
+
+    _pools : dict[tuple, list] = {}
+    _holderWidget = None
+
+    @classmethod
+    def enable(cls, enabled=True):
+        """
+        打开/关闭 回收池
+        """
+        cls.enabled = enabled
+
+    @classmethod
+    def key(cls, widgetClass, args:tuple, kwargs:dict):
+        """
+        返回 回收池的 key， 不能回收的 返回 None
+        """
+        if widgetClass not in _poolableClasses or kwargs.get('name'):
+            return None
+        
+        # 只有 文本参数， 和 _hy_reset 能重置的参数
+        if len(args) > 1 or any(k not in _styleArgSet and k not in widgetClass._hy_resetArgs 
+                                for k in kwargs):
+            return None
+        
+        key = (widgetClass, tuple((k, kwargs[k]) 
+                for k in _styleArgNames if kwargs.get(k) is not None))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    @classmethod
+    def acquire(cls, key):
+        pool = cls._pools.get(key)
+        while pool:
+            widget = pool.pop()
+            if isValid(widget):
+                cls.hits += 1
+                # 和新建的控件一样， 加入显示中的容器时 由布局来显示， 不在这里 show
+                widget.setAttribute(QtCore.Qt.WA_WState_ExplicitShowHide, False)
+                if widget.property(StyleRegistry.propName):
+                    StyleRegistry.adopt(widget)
+                return widget
+        
+        cls.misses += 1
+        return None
+
+    @classmethod
+    def release(cls, widget) -> bool:
+        """
+        把控件放回回收池， 不能回收的（不是从回收池模式下创建的，或者池已满） 返回 False
+
+        放回的控件 脱离原来的上级控件， 由回收池持有，
+        这样 原来的页面 被删除时， 回收池里的控件 不会跟着被删除
+        """
+        key = getattr(widget, '_hy_poolKey', None)
+        if key is None:
+            return False
+        
+        pool = cls._pools.setdefault(key, [])
+        if len(pool) >= cls.maxSize:
+            return False
+        
+        widget.hide()
+        widget.setParent(cls._holder())
+        pool.append(widget)
+        return True
+
+    @classmethod
+    def _holder(cls):
+        if cls._holderWidget is None or not isValid(cls._holderWidget):
+            cls._holderWidget = QWidget()
+        return cls._holderWidget
+
+    @classmethod
+    def size(cls) -> int:
+        return sum(len(pool) for pool in cls._pools.values())
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {'hits': cls.hits, 'misses': cls.misses, 'size': cls.size()}
+
+    @classmethod
+    def clear(cls):
+        """
+        删除回收池里的所有控件
+        """
+        for pool in cls._pools.values():
+            for widget in pool:
+                widget.deleteLater()
+        cls._pools = {}
+
+
+class _PooledWidgetType(type(QWidget)):
+    """
+    可回收控件的 metaclass， 回收池打开时， 创建控件 先从回收池里取
+    """
+    def __call__(cls, *args, **kwargs):
+        if not WidgetPool.enabled:
+            return super().__call__(*args, **kwargs)
+        
+        key = WidgetPool.key(cls, args, kwargs)
+        if key is None:
+            return super().__call__(*args, **kwargs)
+        
+        widget = WidgetPool.acquire(key)
+        if widget is None:
+            widget = super().__call__(*args, **kwargs)
+            widget._hy_poolKey = key
+            return widget
+        
+        widget.move(0, 0)
+        widget.setEnabled(True)
+        widget._hy_reset(*args, **{k:v for k,v in kwargs.items() 
+                                   if k not in _styleArgSet})
+        return widget
+
+
+def _disconnectAll(obj:QtCore.QObject, signal, signature:str):
+    # 没有连接时 disconnect() 会产生警告，所以先检查
+    if obj.receivers(QtCore.SIGNAL(signature)) > 0:
+        signal.disconnect()
+
+
+class Label(QLabel, metaclass=_PooledWidgetType):
 
     
     def __init__(self, *args, 
@@ -310,14 +732,27 @@ class Label(QLabel):
 
         _custom_widget_init(self, QLabel, args, kwargs)
 
+        self._setLabelImg(labelImg, labelImgSize)
+
+    def _setLabelImg(self, labelImg, labelImgSize):
         if labelImg is not None:
             if labelImgSize is not None:
                 self.setPixmap(QtGui.QPixmap(labelImg).scaledToWidth(labelImgSize, QtCore.Qt.SmoothTransformation))
             else:
                 self.setPixmap(QtGui.QPixmap(labelImg))
 
+    # _hy_reset 能重置的参数
+    _hy_resetArgs = frozenset({'labelImg', 'labelImgSize'})
 
-class Button(QPushButton):
+    def _hy_reset(self, *args, labelImg=None, labelImgSize=None):
+        # 从回收池取出时调用
+        self.clear()
+        if args:
+            self.setText(args[0])
+        self._setLabelImg(labelImg, labelImgSize)
+
+
+class Button(QPushButton, metaclass=_PooledWidgetType):
     """
     按钮
     """
@@ -336,6 +771,18 @@ class Button(QPushButton):
         if iconImg:
             self.setIcon(QtGui.QIcon(iconImg))
 
+    _hy_resetArgs = frozenset({'onClick', 'iconImg'})
+
+    def _hy_reset(self, *args, onClick=None, iconImg=None):
+        # 从回收池取出时调用
+        _disconnectAll(self, self.clicked, 'clicked(bool)')
+
+        self.setText(args[0] if args else '')
+        self.setIcon(QtGui.QIcon(iconImg) if iconImg else QtGui.QIcon())
+
+        if onClick:
+            self.clicked.connect(onClick)
+
 
 
 class ButtonF(Button):
@@ -387,7 +834,7 @@ class ButtonNB(ButtonF):
         
 
 
-class Input(QLineEdit):
+class Input(QLineEdit, metaclass=_PooledWidgetType):
     
     AlignTable = {
         'center': QtCore.Qt.AlignHCenter,
@@ -437,6 +884,11 @@ class Input(QLineEdit):
         
         _custom_widget_init(self, QLineEdit, args, kwargs)
 
+        self._setOptions(placeholder, textAlign, echoMode, leadingActionIcon,
+                         trailingActionIcon, intOnly, onChange)
+
+    def _setOptions(self, placeholder, textAlign, echoMode, leadingActionIcon,
+                    trailingActionIcon, intOnly, onChange):
         if placeholder is not None:
             self.setPlaceholderText(placeholder)
 
@@ -464,6 +916,30 @@ class Input(QLineEdit):
         if onChange is not None:
             self.textChanged.connect(onChange)
 
+    _hy_resetArgs = frozenset({'placeholder', 'textAlign', 'echoMode', 'leadingActionIcon',
+                               'trailingActionIcon', 'intOnly', 'onChange'})
+
+    def _hy_reset(self, *args, placeholder=None, textAlign=None, echoMode=None,
+                  leadingActionIcon=None, trailingActionIcon=None, 
+                  intOnly=None, onChange=None):
+        # 从回收池取出时调用，先恢复缺省设置
+        _disconnectAll(self, self.textChanged, 'textChanged(QString)')
+
+        self.setText(args[0] if args else '')
+        self.setPlaceholderText('')
+        self.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter)
+        self.setEchoMode(QLineEdit.Normal)
+        self.setValidator(None)
+        for action in self.actions():
+            self.removeAction(action)
+
+        self._setOptions(placeholder, textAlign, echoMode, leadingActionIcon,
+                         trailingActionIcon, intOnly, onChange)
+
+# 可以使用 WidgetPool 回收的控件类， 它们的子类可能有自己的状态， 不回收
+_poolableClasses = {Label, Button, ButtonF, ButtonNB, Input}
+
+
 class TextArea(QTextEdit):
     def __init__(self, *args, 
         placeholder:str|None=None,
@@ -630,27 +1106,70 @@ def spacing(value:int):
 
 stretch = 'stretch'
 
-class _Container(QFrame):    
-    def __init__(self, *children ):   
+def _ssContainer(widget:QWidget, s:s__):
+    """
+    按照 s__ 设置 容器控件 自身的 尺寸、样式、扩展策略
+    """
+    widget._hy_stretchFactor = s.stretchFactor
+    
+    if s.align is not None:
+        widget._hy_align = s.align
 
-        if len(children) == 0:
-            s = s__()
-        elif isinstance(children[0], s__):
-            s = children[0]
-            children = children[1:]
-        else:
-            s = s__()
-        
-        
-        # pass list of widgets as children
-        if len(children)==1 and isinstance(children[0], list):
-            children = children[0]
+    if s.windowTitle is not None:
+        widget.setWindowTitle(s.windowTitle)
+
+    if s.size:
+        widget.resize(*s.size)
             
-        self.itemsJustify = 'even' if s.spacing < 0 else s.itemsJustify
-        self._hy_stretchFactor = s.stretchFactor
+    if s.width is not None:
+        widget.setFixedWidth(s.width)
+
+    if s.height is not None:
+        widget.setFixedHeight(s.height)
+
+    if s.minWidth is not None:
+        widget.setMinimumWidth(s.minWidth)
+
+    if s.minHeight is not None:
+        widget.setMinimumHeight(s.minHeight)
+
+    if s.maxWidth is not None:
+        widget.setMaximumWidth(s.maxWidth)
+
+    if s.maxHeight is not None:
+        widget.setMaximumHeight(s.maxHeight)
+
+    style = _styleText(border=s.border, color=s.color, bgColor=s.bgColor, 
+                       fontSize=s.fontSize, fontFamily=s.fontFamily)[0]
+    
+    if s.name:
+        widget.setObjectName(s.name)
+
+    if style or s.styleSheet:    
+        _applyStyle(widget, style, '', s.styleSheet, s.name)
+
+    hp = QSizePolicy.Expanding if s.hExpanding else QSizePolicy.Fixed
+    vp = QSizePolicy.Expanding if s.vExpanding else QSizePolicy.Fixed
+    widget.setSizePolicy(hp, vp)
+
+
+class _Container(QFrame):    
+    def __init__(self, *children ):   
+
+        if len(children) == 0:
+            s = s__()
+        elif isinstance(children[0], s__):
+            s = children[0]
+            children = children[1:]
+        else:
+            s = s__()
         
-        if s.align is not None:
-            self._hy_align = s.align
+        
+        # pass list of widgets as children
+        if len(children)==1 and isinstance(children[0], list):
+            children = children[0]
+            
+        self.itemsJustify = 'even' if s.spacing < 0 else s.itemsJustify
         
         if self.itemsJustify not in ['start', 'center', 'end', 'even', None]:
             raise ValueError("justify must be 'start', 'center', 'end', 'even', None")
@@ -668,31 +1187,13 @@ class _Container(QFrame):
 
         super().__init__()
 
-        if s.windowTitle is not None:
-            self.setWindowTitle(s.windowTitle)
-
         self.lo :QBoxLayout = self.LayoutBox(self)
 
-        if s.size:
-            self.resize(*s.size)
-                
-        if s.width is not None:
-            self.setFixedWidth(s.width)
-
-        if s.height is not None:
-            self.setFixedHeight(s.height)
-
-        if s.minWidth is not None:
-            self.setMinimumWidth(s.minWidth)
-
-        if s.minHeight is not None:
-            self.setMinimumHeight(s.minHeight)
-
-        if s.maxWidth is not None:
-            self.setMaximumWidth(s.maxWidth)
-
-        if s.maxHeight is not None:
-            self.setMaximumHeight(s.maxHeight)
+        # 批量创建时，暂停刷新和布局激活，退出 batch() 时统一处理
+        if _BatchBuild.active():
+            self.setUpdatesEnabled(False)
+            self.lo.setEnabled(False)
+            _BatchBuild.containers.append(self)
 
         if isinstance(s.paddings, int):
             self.lo.setContentsMargins(s.paddings, s.paddings, s.paddings, s.paddings)
@@ -702,91 +1203,13 @@ class _Container(QFrame):
 
         self.lo.setSpacing(0 if s.spacing < 0 else s.spacing)    
 
+        _ssContainer(self, s)
 
-
-        style = ''
-
-        if s.border is not None:
-            style += f'  border: {s.border};\n'
-        
-        if s.color is not None:
-            style += f'  color: {s.color};\n'
-        
-        if s.bgColor is not None:
-            style += f'  background-color: {s.bgColor};\n'
-
-        if s.fontSize is not None:
-            style += f'  font-size: {s.fontSize}px;\n'
-
-        if s.fontFamily is not None:
-            style += f'  font-family: {s.fontFamily};\n'
-        
-        
-        if s.name:
-            self.setObjectName(s.name)
-
-        if style or s.styleSheet:    
-            oid = s.name
-            if not s.name:
-                oid = _randomString()   
-                self.setObjectName(oid)
-            self.setStyleSheet(f'#{oid} {{\n{style}\n}}\n\n{s.styleSheet}')    
-               
-
-        hp = QSizePolicy.Expanding if s.hExpanding else QSizePolicy.Fixed
-        vp = QSizePolicy.Expanding if s.vExpanding else QSizePolicy.Fixed
-        self.setSizePolicy(hp, vp)
-
-        
         # 添加一个children属性，方便遍历子控件
         self.children = list(children)  # 因为 children 一般是 tuple 类型，所以需要转换
+        self._resetChildIndex()
 
-        lastIdx = len(children) - 1    
-
-        if self.itemsJustify in ['end','center']:
-            self.lo.addStretch()
-        
-        for idx, child in enumerate(children):
-            if child == 'stretch':
-                self.lo.addStretch()
-                continue
-
-            if isinstance(child, str) and  child.startswith('spacing:'):
-                value = int(child.split(':')[1])
-                self.lo.addSpacing(value)
-                continue
-            
-            stretchFactor = 0
-            if hasattr(child, '_hy_stretchFactor'):
-                stretchFactor = child._hy_stretchFactor
-
-            # if stretchFactor > 0:
-            #     print('===', child, 'stretchFactor:', stretchFactor)
-
-            if isinstance(child, QLayout):
-                self.lo.addLayout(child, stretchFactor)
-            else:
-                self.lo.addWidget(child, stretchFactor)
-
-            # 设置子控件的对齐, 注意会阻止子控件的 sizepolicy Expanding，如果不需要，不要设置
-            # 参考 https://stackoverflow.com/q/25512664/2602410
-            if self.alignValue is not None:
-                # 对于分割线，不设置，否则分割线扩展策略不生效，会看不见
-                if isinstance(child, VerticalLine) or isinstance(child, HorizontalLine):
-                    continue
-                self.lo.setAlignment(child, self.alignValue)
-            if hasattr(child, '_hy_align'):
-                alignValue =  self.AlignTable.get(child._hy_align)
-                if alignValue is None:
-                    raise ValueError(f'align `{child._hy_align}` not in {self.AlignTable.keys()}')
-                self.lo.setAlignment(child, alignValue)
-
-            # 类似 css flex justify space-between 的效果
-            if self.itemsJustify == 'even' and idx != lastIdx:
-                self.lo.addStretch()
-
-        if self.itemsJustify in ['start','center']:
-            self.lo.addStretch()
+        self._fillLayout(self.children)
 
 
 
@@ -867,6 +1290,7 @@ class _Container(QFrame):
             _add(child)
 
         # children属性里面不包含 spacerItem
+        self._childPos[id(child)] = (len(self.children), len(self._childShifts))
         self.children.append(child)
 
     def insert(self, index, child, *args, **kwargs):
@@ -945,14 +1369,17 @@ class _Container(QFrame):
 
         # children属性里面不包含 spacerItem
         self.children.insert(index, child)
+        self._shiftChildIndex(index, 1)
+        self._childPos[id(child)] = (index, len(self._childShifts))
 
 
-    def remove(self,  child, deleteAlso=False):
+    def remove(self,  child, deleteAlso=False, recycle=False):
         """
         去掉内部指定子控件
 
         :param child: 子控件
         :param deleteAlso: 是否删除该子控件
+        :param recycle: 是否放回 WidgetPool 回收池， 不能回收的控件 按照 deleteAlso 处理
         """
         def _deleteStretch(index):
             itemToRemove = self.lo.takeAt(index)
@@ -960,10 +1387,7 @@ class _Container(QFrame):
                 self.lo.removeItem(itemToRemove);
                 del itemToRemove
 
-        # if child not in self.children:
-        #     return
-        
-        index = self.children.index(child)
+        index = self.indexOf(child)
 
         # 不存在，直接返回
         if index == -1:
@@ -1000,10 +1424,14 @@ class _Container(QFrame):
         else:
             self.lo.removeWidget(child)
 
-        if deleteAlso:    
+        if recycle and WidgetPool.release(child):
+            pass
+        elif deleteAlso:    
             child.deleteLater()
                 
-        self.children.remove(child)
+        del self.children[index]
+        self._childPos.pop(id(child), None)
+        self._shiftChildIndex(index + 1, -1)
 
 
     def delete(self, child):
@@ -1014,14 +1442,29 @@ class _Container(QFrame):
         """
         self.remove(child, deleteAlso=True)
 
-    def clear(self):
+    def clear(self, recycle=False, incremental=False, budgetMs=5, onFinished=None):
         """
         清空所有内部子控件
+
+        :param recycle: 是否把可以回收的子控件 放回 WidgetPool 回收池， 其它的子控件删除
+        :param incremental: 是否在后面的事件循环里 分批删除子控件， 参考 clearLayout
+        :param budgetMs: incremental 模式下， 每次事件循环 最多用于删除控件的时间，单位毫秒
+        :param onFinished: incremental 模式下， 全部删除完成后 调用的函数
         """
-        clearLayout(self.lo, )
+        # 放回回收池之前 检查， 不要清空到一半 才出错
+        if incremental and budgetMs <= 0:
+            raise ValueError(f'budgetMs `{budgetMs}` must be greater than 0')
+
+        if recycle:
+            for child in self.children:
+                if WidgetPool.release(child):
+                    self.lo.removeWidget(child)
+
+        clearLayout(self.lo, incremental, budgetMs, onFinished)
         # self.lo.deleteLater()
         
         self.children = []
+        self._resetChildIndex()
 
         # 再 补充 SpacerItem
 
@@ -1043,6 +1486,244 @@ class _Container(QFrame):
 
 
 
+    def _fillLayout(self, children):
+        """
+        按照 children 依次添加 布局的 item 和 justify 需要的 SpacerItem
+        """
+        lastIdx = len(children) - 1    
+
+        if self.itemsJustify in ['end','center']:
+            self.lo.addStretch()
+        
+        for idx, child in enumerate(children):
+            if child == 'stretch':
+                self.lo.addStretch()
+                continue
+
+            if isinstance(child, str) and  child.startswith('spacing:'):
+                value = int(child.split(':')[1])
+                self.lo.addSpacing(value)
+                continue
+            
+            stretchFactor = 0
+            if hasattr(child, '_hy_stretchFactor'):
+                stretchFactor = child._hy_stretchFactor
+
+            # if stretchFactor > 0:
+            #     print('===', child, 'stretchFactor:', stretchFactor)
+
+            if isinstance(child, QLayout):
+                self.lo.addLayout(child, stretchFactor)
+            else:
+                self.lo.addWidget(child, stretchFactor)
+
+            # 设置子控件的对齐, 注意会阻止子控件的 sizepolicy Expanding，如果不需要，不要设置
+            # 参考 https://stackoverflow.com/q/25512664/2602410
+            if self.alignValue is not None:
+                # 对于分割线，不设置，否则分割线扩展策略不生效，会看不见
+                if isinstance(child, VerticalLine) or isinstance(child, HorizontalLine):
+                    continue
+                self.lo.setAlignment(child, self.alignValue)
+            if hasattr(child, '_hy_align'):
+                alignValue =  self.AlignTable.get(child._hy_align)
+                if alignValue is None:
+                    raise ValueError(f'align `{child._hy_align}` not in {self.AlignTable.keys()}')
+                self.lo.setAlignment(child, alignValue)
+
+            # 类似 css flex justify space-between 的效果
+            if self.itemsJustify == 'even' and idx != lastIdx:
+                self.lo.addStretch()
+
+        if self.itemsJustify in ['start','center']:
+            self.lo.addStretch()
+
+    def _setChildren(self, children, removed=(), deleteAlso=False):
+        """
+        一次性 把子控件 设置为 children， 
+        布局的 item 和 SpacerItem 序列 只重新生成一次，最后才重新布局
+        """
+        children = list(children)
+
+        if self.itemsJustify and 'stretch' in children:
+            raise ValueError('stretch as child must with justify set as None')
+
+        # 批量创建过程中 布局本来就是暂停的， 由 batch() 负责恢复
+        layoutEnabled = self.lo.isEnabled()
+        self.lo.setEnabled(False)
+        self.setUpdatesEnabled(False)
+
+        # 取出所有 item， 子控件本身不删除， 后面重新加入
+        while self.lo.count():
+            self.lo.takeAt(0)
+
+        for child in removed:
+            if isinstance(child, QLayout):
+                clearLayout(child)
+            elif deleteAlso and isinstance(child, QWidget):
+                child.deleteLater()
+
+        self.children = children
+        self._resetChildIndex()
+        self._fillLayout(children)
+
+        if layoutEnabled:
+            self.lo.setEnabled(True)
+            self.setUpdatesEnabled(True)
+            self.lo.invalidate()
+
+    def extend(self, children):
+        """
+        在最后 添加多个子控件， 只重新布局一次
+
+        :param children: 子控件列表
+        """
+        children = list(children)
+
+        # 'stretch' / 'spacing:' 这样的特殊子项 很少见， 整体重新生成
+        if any(isinstance(child, str) for child in children):
+            self._setChildren(self.children + children)
+            return
+
+        # 原有的 item 不动， 只在最后 （justify 需要的 SpacerItem 之前） 加入新的 item
+        layoutEnabled = self.lo.isEnabled()
+        self.lo.setEnabled(False)
+        self.setUpdatesEnabled(False)
+
+        for child in children:
+            self.append(child)
+
+        if layoutEnabled:
+            self.lo.setEnabled(True)
+            self.setUpdatesEnabled(True)
+            self.lo.invalidate()
+
+    def removeMany(self, children, deleteAlso=False):
+        """
+        去掉多个子控件， 只重新布局一次
+
+        :param children: 子控件列表， 不存在的子控件被忽略
+        :param deleteAlso: 是否删除这些子控件
+        """
+        ids = {id(child) for child in children}
+        removed = [child for child in self.children if id(child) in ids]
+        if not removed:
+            return
+        
+        self._setChildren([child for child in self.children if id(child) not in ids],
+                          removed, deleteAlso)
+
+    def replaceAll(self, children, deleteOld=True):
+        """
+        把所有子控件 替换为 children， 只重新布局一次
+
+        :param children: 新的子控件列表， 可以包含原来的子控件
+        :param deleteOld: 是否删除 不在新列表中的原来的子控件
+        """
+        children = list(children)
+        ids = {id(child) for child in children}
+        removed = [child for child in self.children if id(child) not in ids]
+
+        self._setChildren(children, removed, deleteOld)
+
+    def reconcile(self, items, key:Callable, build:Callable, 
+                  update:Callable|None=None, deleteRemoved=True):
+        """
+        按照 新的数据列表 items 更新子控件， 类似 React 的 keyed diff
+
+        key 相同的原有子控件 被保留复用（有 update 就调用 update 更新内容），并按照新的次序排列，
+        只有 新增的数据 才调用 build 创建控件， 不再存在的 子控件被去掉
+
+        比如
+
+            col.reconcile(rows, key=lambda r: r['id'], 
+                build=lambda r: Label(r['name']),
+                update=lambda label, r: label.setText(r['name']))
+
+        :param items: 新的数据列表
+        :param key: 参数为数据，返回该数据的唯一标识
+        :param build: 参数为数据，返回新创建的子控件
+        :param update: 参数为 (复用的子控件, 数据)， 用来更新复用的子控件
+        :param deleteRemoved: 是否删除 去掉的子控件
+        """
+        existing = {}
+        for child in self.children:
+            if hasattr(child, '_hy_key'):
+                existing[child._hy_key] = child
+
+        newChildren = []
+        keys = set()
+        for item in items:
+            k = key(item)
+            if k in keys:
+                raise ValueError(f'duplicate key `{k}` in reconcile items')
+            keys.add(k)
+
+            child = existing.pop(k, None)
+            if child is None:
+                child = build(item)
+                child._hy_key = k
+            elif update is not None:
+                update(child, item)
+
+            newChildren.append(child)
+
+        # 次序和成员都没有变化， 不需要重新布局
+        if len(newChildren) == len(self.children) and \
+                all(a is b for a, b in zip(newChildren, self.children)):
+            return
+
+        ids = {id(child) for child in newChildren}
+        removed = [child for child in self.children if id(child) not in ids]
+
+        self._setChildren(newChildren, removed, deleteRemoved)
+
+    def _resetChildIndex(self):
+        # id(child) -> (child 在 children 里的位置, 记录时 _childShifts 的长度)
+        # 插入/去掉 子控件时 不修改所有的位置， 只在 _childShifts 里 记录一次 (起始位置, 变化量)，
+        # 查找时 再把 记录之后的变化 加到位置上
+        self._childPos = {id(child): (idx, 0) for idx, child in enumerate(self.children)}
+        self._childShifts = []
+
+    def _shiftChildIndex(self, start, delta):
+        # 位置 >= start 的子控件， 位置都变化 delta
+        self._childShifts.append((start, delta))
+
+        # 记录太多时 全部重新计算， 分摊到每次 插入/去掉 是 O(1)
+        if len(self._childShifts) > max(64, len(self.children)):
+            self._resetChildIndex()
+
+    def indexOf(self, child):
+        """
+        返回子控件在 children 里的位置， 不存在返回 -1
+
+        :param child: 子控件
+        """
+        children = self.children
+        shifts = self._childShifts
+        entry = self._childPos.get(id(child))
+
+        if entry is not None:
+            pos, version = entry
+            for start, delta in shifts[version:]:
+                if pos >= start:
+                    pos += delta
+
+            if 0 <= pos < len(children) and children[pos] is child:
+                if version != len(shifts):
+                    self._childPos[id(child)] = (pos, len(shifts))
+                return pos
+        
+        # 位置不对，说明 children 被直接修改过，在列表里查找
+        try:
+            pos = children.index(child)
+        except ValueError:
+            return -1
+        if children[pos] is not child:
+            return -1
+        
+        self._childPos[id(child)] = (pos, len(shifts))
+        return pos
+
     def preSibling(self, child):        
         """
         Return the previous sibling widget of the given widget.
@@ -1053,7 +1734,7 @@ class _Container(QFrame):
         Returns:
             QWidget or None: the previous sibling widget, or None if the given widget is the first one
         """
-        idx = self.children.index(child)
+        idx = self.indexOf(child)
         if idx == -1 or idx == 0:    
             return None
         return self.children[idx-1]
@@ -1068,7 +1749,7 @@ class _Container(QFrame):
         Returns:
             QWidget or None: the next sibling widget, or None if the given widget is the last one
         """
-        idx = self.children.index(child)
+        idx = self.indexOf(child)
         if idx == -1 or idx == len(self.children)-1:
             return None
         return self.children[idx+1]
@@ -1129,20 +1810,355 @@ class Column(_Container):
 
 
 
+# VirtualColumn 是 只创建可见行控件 的 纵向滚动列表
+class VirtualColumn(QScrollArea):
+    """
+    虚拟滚动的 Column， 适合几万行的数据列表
+
+    子元素不是控件，而是数据，
+    只有在可视区域（加上 overscan 缓冲行）里的数据才调用 build 创建行控件，
+    滚出可视区域的行控件 放回回收池，给后面滚入的数据 调用 update 复用。
+
+    比如
+
+        VirtualColumn(s__(spacing=2), records,
+            build  = lambda r: Label(r['name']),
+            update = lambda label, r: label.setText(r['name']))
+
+    s__ 中的 itemsJustify/itemsAlign 对 VirtualColumn 无效
+
+    Parameters
+    ----------
+    items : list, optional
+        数据列表
+    build : Callable
+        参数为数据，返回新创建的行控件
+    update : Callable | None, optional
+        参数为 (行控件, 数据)，用来把回收的行控件更新为新数据，
+        为 None 时不回收，滚出的行控件直接删除
+    rowHeight : int, optional
+        行高的估计值，行控件创建后 使用其实际的 sizeHint 高度
+    overscan : int, optional
+        可视区域上下 额外创建的行数
+    """
+
+    def __init__(self, *args, build:Callable, update:Callable|None=None,
+                 rowHeight:int=30, overscan:int=5):
+
+        if args and isinstance(args[0], s__):
+            s = args[0]
+            args = args[1:]
+        else:
+            s = s__()
+
+        items = args[0] if args else []
+
+        super().__init__()
+
+        _ssContainer(self, s)
+
+        if isinstance(s.paddings, int):
+            self._paddings = (s.paddings, s.paddings, s.paddings, s.paddings)
+        else:
+            self._paddings = tuple(s.paddings)
+        self._spacing = max(s.spacing, 0)
+
+        self._build = build
+        self._update = update
+        self._rowHeight = rowHeight
+        self._overscan = overscan
+
+        self.setWidgetResizable(False)
+        self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.setFrameShape(QFrame.NoFrame)
+
+        self._canvas = QWidget()
+        self.setWidget(self._canvas)
+
+        # 当前显示的行  index -> 行控件
+        self._visible : dict[int, QWidget] = {}
+        # 回收池
+        self._pool : list[QWidget] = []
+
+        self.items = list(items)
+        # 每行的实际高度， None 表示还没有测量过，使用 rowHeight 估计
+        self._heights : list[int|None] = [None] * len(self.items)
+        self._offsets : list[int] | None = None
+
+        self.verticalScrollBar().valueChanged.connect(self._refresh)
+
+        self._relayout()
+
+    def append(self, item):
+        """
+        在最后添加一条数据
+        """
+        self.items.append(item)
+        self._heights.append(None)
+        if self._offsets is not None:
+            self._offsets.append(self._offsets[-1] + self._rowHeight + self._spacing)
+        self._refresh()
+
+    def insert(self, index, item):
+        """
+        在 index 处插入一条数据， index 为负数或者超过范围 视为添加在最后
+        """
+        if index < 0 or index >= len(self.items):
+            return self.append(item)
+        
+        self.items.insert(index, item)
+        self._heights.insert(index, None)
+
+        # 后面的行 下移一个估计行高， 可见的行控件 保留， 序号加 1
+        if self._offsets is not None:
+            delta = self._rowHeight + self._spacing
+            offsets = self._offsets
+            self._offsets = offsets[:index+1] + [o + delta for o in offsets[index:]]
+        self._visible = {(i + 1 if i >= index else i): w for i, w in self._visible.items()}
+        self._refresh()
+
+    def remove(self, item):
+        """
+        去掉一条数据， 不存在 直接返回
+        """
+        # 通常去掉的是 可视区域里的行， 先在里面找
+        for index in self._visible:
+            if self.items[index] is item:
+                break
+        else:
+            for index, one in enumerate(self.items):
+                if one is item:
+                    break
+            else:
+                return
+        
+        self.removeAt(index)
+
+    def removeAt(self, index):
+        """
+        去掉第 index 行的数据
+        """
+        height = self._heights[index]
+        del self.items[index]
+        del self._heights[index]
+
+        # 后面的行 上移， 可见的行控件 保留， 序号减 1
+        if self._offsets is not None:
+            delta = (self._rowHeight if height is None else height) + self._spacing
+            offsets = self._offsets
+            self._offsets = offsets[:index] + [o - delta for o in offsets[index+1:]]
+        widget = self._visible.pop(index, None)
+        if widget is not None:
+            self._release(widget)
+        self._visible = {(i - 1 if i > index else i): w for i, w in self._visible.items()}
+        self._refresh()
+
+    def clear(self):
+        """
+        清空所有数据
+        """
+        self.items = []
+        self._heights = []
+        self._releaseAll()
+        self._relayout()
+
+    def setItems(self, items):
+        """
+        替换所有数据
+        """
+        self.items = list(items)
+        self._heights = [None] * len(self.items)
+        self._releaseAll()
+        self._relayout()
+
+    def rowWidget(self, index):
+        """
+        返回第 index 行 当前的行控件， 不在可视区域 返回 None
+        """
+        return self._visible.get(index)
+
+    def scrollToIndex(self, index):
+        """
+        滚动到第 index 行
+        """
+        offsets = self._getOffsets()
+        if 0 <= index < len(self.items):
+            self.verticalScrollBar().setValue(offsets[index])
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # 宽度变化，行控件的高度可能变化（比如自动换行），可见的行需要重新测量
+        for index in self._visible:
+            self._heights[index] = None
+        self._relayout()
+
+    def _getOffsets(self):
+        # 每行的起始纵坐标， 最后多一个元素 是总高度
+        if self._offsets is None:
+            top = self._paddings[1]
+            est = self._rowHeight
+            spacing = self._spacing
+            offsets = [top]
+            for h in self._heights:
+                top += (est if h is None else h) + spacing
+                offsets.append(top)
+            self._offsets = offsets
+        return self._offsets
+
+    def _relayout(self):
+        self._offsets = None
+        self._refresh()
+
+    def _releaseAll(self):
+        for widget in self._visible.values():
+            self._release(widget)
+        self._visible = {}
+
+    def _release(self, widget):
+        if self._update is None:
+            widget.deleteLater()
+        else:
+            widget.hide()
+            self._pool.append(widget)
+
+    def _acquire(self, item):
+        if self._pool:
+            widget = self._pool.pop()
+            self._update(widget, item)
+        else:
+            widget = self._build(item)
+            widget.setParent(self._canvas)
+        return widget
+
+    def _refresh(self, *args):
+        count = len(self.items)
+        offsets = self._getOffsets()
+
+        left, top, right, bottom = self._paddings
+        width = self.viewport().width()
+        rowWidth = max(width - left - right, 0)
+
+        viewTop = self.verticalScrollBar().value()
+        viewBottom = viewTop + self.viewport().height()
+
+        # 可见范围 是按估计行高 算出来的， 测量了实际高度后 要重新计算，
+        # 比如 行比估计的矮， 原来的范围 填不满可视区域， 直到范围不再变化
+        first = last = None
+        while True:
+            newFirst = max(bisect.bisect_right(offsets, viewTop) - 1 - self._overscan, 0)
+            newLast = min(bisect.bisect_left(offsets, viewBottom) + self._overscan, count)
+            if (newFirst, newLast) == (first, last):
+                break
+            first, last = newFirst, newLast
+
+            # 回收 可视范围外的行， 给下面 滚入的行 复用
+            for index in [i for i in self._visible if i < first or i >= last]:
+                self._release(self._visible.pop(index))
+
+            # 创建/复用 可视范围内的行， 并测量实际高度
+            heightChanged = False
+            for index in range(first, last):
+                widget = self._visible.get(index)
+                if widget is None:
+                    widget = self._acquire(self.items[index])
+                    self._visible[index] = widget
+
+                if self._heights[index] is None:
+                    if widget.hasHeightForWidth():
+                        h = widget.heightForWidth(rowWidth)
+                    else:
+                        h = widget.sizeHint().height()
+                    self._heights[index] = h
+                    if h != self._rowHeight:
+                        heightChanged = True
+
+            if not heightChanged:
+                break
+            self._offsets = None
+            offsets = self._getOffsets()
+
+        for index in range(first, last):
+            widget = self._visible[index]
+            widget.setGeometry(left, offsets[index], rowWidth, self._heights[index])
+            if widget.isHidden():
+                widget.show()
+
+        totalHeight = offsets[-1] - (self._spacing if count else 0) + bottom
+        if self._canvas.height() != totalHeight or self._canvas.width() != width:
+            self._canvas.resize(width, totalHeight)
+
+
 # 达到类似HTML中 flexbox 的效果
 class FlowLayout(QLayout):
-    def __init__(self, parent=None, margin=-1, hspacing=-1, vspacing=-1):
+    """
+    流式布局，子控件从左到右排列，一行放不下时自动换行
+
+    Parameters
+    ----------
+    itemsJustify : str | None, optional
+        每行里子控件的主轴对齐
+        取值为 start, center, end， even, None（同 start）
+
+        如果为 even， 表示平均间隔，类似 css flex justify space-between 的效果
+
+    itemsAlign : str | None, optional
+        每行里子控件的从轴对齐， 取值为 top, center, bottom, None（同 top）
+
+    子控件如果 设置了 stretchFactor， 并且 hExpanding=True （水平 sizePolicy 为 Expanding），
+    会按照比例 占据所在行的剩余宽度， 该行的 itemsJustify 设置无效，
+    只设置了 stretchFactor 的 不扩展， 和 Row 里一样
+    """
+
+    JustifyValues = ['start', 'center', 'end', 'even', None]
+    AlignValues = ['top', 'center', 'bottom', None]
+
+    # 最多缓存 多少种宽度 的分行结果
+    MaxCachedWidths = 16
+
+    def __init__(self, parent=None, margin=-1, hspacing=-1, vspacing=-1,
+                 itemsJustify:str|None=None, itemsAlign:str|None=None):
         super().__init__(parent)
+
+        if itemsJustify not in self.JustifyValues:
+            raise ValueError(f'itemsJustify `{itemsJustify}` not in {self.JustifyValues}')
+        if itemsAlign not in self.AlignValues:
+            raise ValueError(f'itemsAlign `{itemsAlign}` not in {self.AlignValues}')
+
         self._hspacing = hspacing
         self._vspacing = vspacing
+        self._justify = itemsJustify
+        self._align = itemsAlign
         self._items = []
         self.setContentsMargins(margin, margin, margin, margin)
 
+        # 每个 item 的 (宽, 高, 横向间距, 纵向间距, 扩展权重)
+        self._itemHints = []
+        self._hintsStale = True
+
+        # 分行索引  内容宽度 -> [(起始item, 结束item(不含), 占用宽度, 行高, 行的纵坐标), ...]
+        # 某个 item 的尺寸变化时，只有它所在的行 及后面的行 需要重新计算
+        self._lines = {}
+
+        self._minSize = None
+        # 上次设置位置的 内容区域（去掉了边距）
+        self._lastRect = None
+        self._lastWidth = None
+        # 在 _lastRect 下 已经设置好位置的行数
+        self._placedLines = 0
+
     def __del__(self):
         del self._items[:]
 
+    def invalidate(self):
+        # 不知道是哪个 item 变化了，下次使用时 比较新旧 sizeHint 找出来
+        self._hintsStale = True
+        self._minSize = None
+        super().invalidate()
+
     def addItem(self, item):
         self._items.append(item)
+        self._hintsStale = True
+        self._minSize = None
 
     def horizontalSpacing(self):
         if self._hspacing >= 0:
@@ -1167,9 +2183,14 @@ class FlowLayout(QLayout):
 
     def takeAt(self, index):
         if 0 <= index < len(self._items):
+            self._hintsStale = True
+            self._minSize = None
             return self._items.pop(index)
 
     def expandingDirections(self):
+        if self._justify not in ['start', None] or \
+                any(hint[4] > 0 for hint in self._getItemHints()):
+            return QtCore.Qt.Horizontal
         return QtCore.Qt.Orientations(0)
 
     def hasHeightForWidth(self):
@@ -1186,43 +2207,159 @@ class FlowLayout(QLayout):
         return self.minimumSize()
 
     def minimumSize(self):
-        size = QtCore.QSize()
-        for item in self._items:
-            size = size.expandedTo(item.minimumSize())
-        left, top, right, bottom = self.getContentsMargins()
-        size += QtCore.QSize(left + right, top + bottom)
-        return size
-
-    def doLayout(self, rect, testonly):
-        left, top, right, bottom = self.getContentsMargins()
-        effective = rect.adjusted(+left, +top, -right, -bottom)
-        x = effective.x()
-        y = effective.y()
-        lineheight = 0
+        if self._minSize is None:
+            size = QtCore.QSize()
+            for item in self._items:
+                size = size.expandedTo(item.minimumSize())
+            left, top, right, bottom = self.getContentsMargins()
+            size += QtCore.QSize(left + right, top + bottom)
+            self._minSize = size
+        return QtCore.QSize(self._minSize)
+
+    def _getItemHints(self):
+        if not self._hintsStale:
+            return self._itemHints
+        
+        hspacing = self.horizontalSpacing()
+        vspacing = self.verticalSpacing()
+        itemHints = []
         for item in self._items:
             widget = item.widget()
-            hspace = self.horizontalSpacing()
-            if hspace == -1:
+            hspace = hspacing
+            if hspace == -1 and widget is not None:
                 hspace = widget.style().layoutSpacing(
                     QSizePolicy.PushButton,
                     QSizePolicy.PushButton, QtCore.Qt.Horizontal)
-            vspace = self.verticalSpacing()
-            if vspace == -1:
+            vspace = vspacing
+            if vspace == -1 and widget is not None:
                 vspace = widget.style().layoutSpacing(
                     QSizePolicy.PushButton,
                     QSizePolicy.PushButton, QtCore.Qt.Vertical)
-            nextX = x + item.sizeHint().width() + hspace
-            if nextX - hspace > effective.right() and lineheight > 0:
-                x = effective.x()
-                y = y + lineheight + vspace
-                nextX = x + item.sizeHint().width() + hspace
-                lineheight = 0
-            if not testonly:
-                item.setGeometry(
-                    QtCore.QRect(QtCore.QPoint(x, y), item.sizeHint()))
-            x = nextX
-            lineheight = max(lineheight, item.sizeHint().height())
-        return y + lineheight - rect.y() + bottom
+            hint = item.sizeHint()
+            grow = 0
+            if widget is not None and item.expandingDirections() & QtCore.Qt.Horizontal:
+                grow = getattr(widget, '_hy_stretchFactor', 0)
+            itemHints.append((hint.width(), hint.height(), hspace, vspace, grow))
+
+        # 找出第一个变化的 item， 前面的分行结果仍然有效
+        oldHints = self._itemHints
+        changed = 0
+        for old, new in zip(oldHints, itemHints):
+            if old != new:
+                break
+            changed += 1
+
+        if changed < len(oldHints) or changed < len(itemHints):
+            self._truncateLines(changed)
+
+        self._itemHints = itemHints
+        self._hintsStale = False
+        return itemHints
+
+    def _truncateLines(self, changed):
+        # 一行的换行位置 由行内的 item 和 下一行的第一个 item 决定，
+        # 所以只保留 结束位置 在 changed 之前的行
+        for width, lines in self._lines.items():
+            keep = 0
+            while keep < len(lines) and lines[keep][1] < changed:
+                keep += 1
+            del lines[keep:]
+
+            if width == self._lastWidth:
+                self._placedLines = min(self._placedLines, keep)
+
+    def _getLines(self, width):
+        hints = self._getItemHints()
+
+        lines = self._lines.get(width)
+        if lines is None:
+            if len(self._lines) >= self.MaxCachedWidths:
+                self._lines = {}
+            lines = self._lines[width] = []
+
+        count = len(hints)
+        i = lines[-1][1] if lines else 0
+        limit = width - 1
+
+        while i < count:
+            start = i
+            x = used = lineheight = 0
+            while i < count:
+                w, h, hspace, vspace, grow = hints[i]
+                if i > start and x + w > limit:
+                    break
+                used = x + w
+                x = used + hspace
+                lineheight = max(lineheight, h)
+                i += 1
+
+            if lines:
+                _, _, _, prevHeight, prevY = lines[-1]
+                y = prevY + prevHeight + hints[start][3]
+            else:
+                y = 0
+            lines.append((start, i, used, lineheight, y))
+
+        return lines
+
+    def doLayout(self, rect, testonly):
+        left, top, right, bottom = self.getContentsMargins()
+        effective = rect.adjusted(+left, +top, -right, -bottom)
+        width = effective.width()
+
+        lines = self._getLines(width)
+        
+        if not testonly:
+            # 内容区域变化了（包括 边距变化）， 所有的行都需要重新设置位置
+            if effective != self._lastRect:
+                self._lastRect = QtCore.QRect(effective)
+                self._lastWidth = width
+                self._placedLines = 0
+            
+            for line in lines[self._placedLines:]:
+                self._placeLine(effective, line)
+            self._placedLines = len(lines)
+
+        if not lines:
+            return top + bottom
+        
+        _, _, _, lineheight, y = lines[-1]
+        return top + y + lineheight + bottom
+
+    def _placeLine(self, effective, line):
+        start, end, used, lineheight, y = line
+        hints = self._itemHints
+        free = max(effective.width() - used, 0)
+
+        totalGrow = sum(hints[i][4] for i in range(start, end))
+
+        x = 0
+        gap = 0
+        if totalGrow == 0:
+            if self._justify == 'center':
+                x = free // 2
+            elif self._justify == 'end':
+                x = free
+            elif self._justify == 'even' and end - start > 1:
+                gap = free / (end - start - 1)
+
+        left = effective.x()
+        top = effective.y() + y
+        for n, i in enumerate(range(start, end)):
+            w, h, hspace, vspace, grow = hints[i]
+            if grow:
+                w += free * grow // totalGrow
+
+            if self._align == 'center':
+                dy = (lineheight - h) // 2
+            elif self._align == 'bottom':
+                dy = lineheight - h
+            else:
+                dy = 0
+
+            self._items[i].setGeometry(
+                QtCore.QRect(left + int(x + gap * n), top + dy, w, h))
+            x += w + hspace
 
     def smartSpacing(self, pm):
         parent = self.parent()
@@ -1,8 +1,9 @@
-import os,re,time
+import os,re,time,json,asyncio,hashlib
+from collections import OrderedDict
 
 from PySide6.QtWidgets import QApplication, QMainWindow,  \
  QTextEdit, QWidget,QVBoxLayout,QSizePolicy, \
-    QToolBar,QFrame,QMessageBox,QTextBrowser
+    QToolBar,QFrame,QTextBrowser
 
 from PySide6 import QtCore,QtGui
 from PySide6.QtNetwork import QNetworkAccessManager, \
@@ -10,17 +11,454 @@ from PySide6.QtNetwork import QNetworkAccessManager, \
 
 import re
 
-from .utils import NAM
+from .utils import NAM, _DecodeBridge
+from shiboken6 import isValid
+from concurrent.futures import ThreadPoolExecutor
 
 from functools import partial
 
+
+def readImage(source, maxWidth=None):
+    """
+    用 QImageReader 读取图片， 宽度大于 maxWidth 的 直接按 maxWidth 等比缩小解码，
+    比先解码原图 再缩小 快很多， 也不占用原图大小的内存。 可以在工作线程中调用
+
+    :param source: 图片文件路径， 或者 图片数据 bytes
+    :param maxWidth: 最大宽度， 单位为像素， None 表示原图大小
+    :return: (QImage, 原图宽度)， 失败时 QImage 为 None
+    """
+    if isinstance(source, str):
+        reader = QtGui.QImageReader(source)
+    else:
+        buffer = QtCore.QBuffer()
+        buffer.setData(source)
+        buffer.open(QtCore.QIODevice.ReadOnly)
+        reader = QtGui.QImageReader(buffer)
+
+    # 按 EXIF 方向 旋转， scaledSize 是旋转前的尺寸
+    reader.setAutoTransform(True)
+    size = reader.size()
+    rotated = bool(reader.transformation() & QtGui.QImageIOHandler.TransformationRotate90)
+    fullWidth = size.height() if rotated else size.width()
+
+    if maxWidth and size.isValid() and fullWidth > maxWidth:
+        ratio = maxWidth / fullWidth
+        reader.setScaledSize(QtCore.QSize(max(1, round(size.width() * ratio)), 
+                                          max(1, round(size.height() * ratio))))
+
+    image = reader.read()
+    if image.isNull():
+        return None, 0
+    return image, fullWidth if size.isValid() else image.width()
+
+
+class ImageCache:
+    """
+    进程内共享的 图片缓存， RichTextBrowser 和 BaseTextEdit 显示网络图片时 先查这里
+
+    - 内存： 解码后的 QImage， 以 (url, 设备像素比) 为 key， 超过字节数上限时 按 LRU 淘汰
+    - 磁盘： 下载的原始图片数据， 以 url 为 key， 超过字节数上限时 按 LRU 淘汰
+
+    图片在工作线程中 用 QImageReader 解码， 并且直接解码为 显示的宽度， 
+    大图片 解码更快， 占用内存也少很多
+
+    :param directory: 磁盘缓存目录， 为 None 时 使用系统的缓存目录， 为空字符串时 不使用磁盘
+    :param maxMemoryBytes: 内存缓存的字节数上限
+    :param maxDiskBytes: 磁盘缓存的字节数上限
+    """
+
+    single_instance = None
+
+    # 控件还没有布局时 宽度不准， 至少按这个宽度（逻辑像素） 解码
+    minDecodeWidth = 800
+
+    @classmethod
+    def getInstance(cls):
+        if cls.single_instance is None:
+            cls.single_instance = ImageCache()
+        return cls.single_instance
+
+    def __init__(self, directory=None, maxMemoryBytes=100*1024*1024, maxDiskBytes=500*1024*1024):
+        if directory is None:
+            directory = os.path.join(QtCore.QStandardPaths.writableLocation(
+                QtCore.QStandardPaths.CacheLocation), 'hyqt_images')
+        self.directory = directory
+        self.maxMemoryBytes = maxMemoryBytes
+        self.maxDiskBytes = maxDiskBytes
+
+        # (url, dpr) -> (QImage, 原图宽度)， LRU 次序
+        self._images = OrderedDict()
+        self.memoryBytes = 0
+
+        # 文件名 -> 字节数， LRU 次序， 第一次使用磁盘时 加载
+        self._files = None
+        self.diskBytes = 0
+
+        # 正在解码的 (url, dpr, maxWidth) -> [(callback, owner), ...]
+        self._decoding = {}
+        self._pool = None
+        self._bridge = None
+        self._placeholders = {}
+
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        # 加入了 正在进行的下载 的请求， 没有从缓存获取， 不计入 hitRate
+        self.coalesced = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.diskHits + self.misses + self.coalesced
+        return {
+            'hits'        : self.hits,
+            'diskHits'    : self.diskHits,
+            'misses'      : self.misses,
+            'coalesced'   : self.coalesced,
+            'hitRate'     : (self.hits + self.diskHits) / total if total else 0,
+            'images'      : len(self._images),
+            'memoryBytes' : self.memoryBytes,
+            'diskFiles'   : len(self._files) if self._files is not None else 0,
+            'diskBytes'   : self.diskBytes,
+        }
+
+    def get(self, url, dpr=1.0, maxWidth=None):
+        """
+        返回内存中缓存的图片， 没有 或者 缓存的图片比需要的小， 返回 None
+
+        :param maxWidth: 显示的最大宽度， 单位为设备像素， None 表示原图大小
+        """
+        image = self._lookup(url, dpr, maxWidth)
+        if image is not None:
+            self.hits += 1
+        return image
+
+    def _lookup(self, url, dpr, maxWidth):
+        # 同 get， 但不计入统计
+        key = (url, dpr)
+        entry = self._images.get(key)
+        if entry is None:
+            return None
+        
+        image, fullWidth = entry
+        needWidth = fullWidth if maxWidth is None else min(maxWidth, fullWidth)
+        if image.width() < needWidth:
+            return None
+        
+        self._images.move_to_end(key)
+        return image
+
+    def fetch(self, url, dpr, callback, nam=None, owner=None, maxWidth=None):
+        """
+        从磁盘缓存 或者 网络 获取图片， 在工作线程中解码后 放入缓存， 然后调用 callback(image, error)
+
+        同时下载的相同 url， NAM 会合并为一个请求， 只解码一次
+
+        :param nam: 使用的 NAM， 缺省为 NAM.getInstance()
+        :param owner: 所属的 QObject， 被删除时 取消下载， 不再回调
+        :param maxWidth: 显示的最大宽度， 单位为设备像素， 更大的图片 按这个宽度解码
+        """
+        if nam is None:
+            nam = NAM.getInstance()
+
+        def downloaded(data, error):
+            if error is not None:
+                callback(None, error)
+                return
+            
+            # 合并的请求， 前面的回调 已经解码了
+            image = self._lookup(url, dpr, maxWidth)
+            if image is not None:
+                self.coalesced += 1
+                callback(image, None)
+                return
+            
+            # 合并的请求， 前面的回调 正在解码， 只需要等待结果
+            data = bytes(data)
+            if (url, dpr, maxWidth) in self._decoding:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                self._writeFile(url, data)
+            self._decodeFor(url, dpr, maxWidth, data, callback, owner)
+
+        def fromDisk(image, error):
+            if image is not None:
+                self.diskHits += 1
+                callback(image, None)
+            else:
+                # 磁盘文件 读取或解码失败， 重新下载， 图片下载 优先级低于 接口请求
+                nam.fetch(url, downloaded, owner=owner)
+
+        path = self._filePath(url)
+        if path is not None:
+            self._decodeFor(url, dpr, maxWidth, path, fromDisk, owner)
+        else:
+            nam.fetch(url, downloaded, owner=owner)
+
+    def decode(self, source, dpr, callback, owner=None, maxWidth=None):
+        """
+        在工作线程中解码图片， 不放入缓存， 完成后 在界面线程中调用 callback(image, error)
+
+        :param source: 图片文件路径， 或者 图片数据 bytes
+        """
+        self._submitDecode(source, dpr, maxWidth, 
+                           lambda image, fullWidth, error: callback(image, error), owner)
+
+    def placeholder(self, dpr, width=32, height=32):
+        """
+        图片还没有准备好时 显示的占位图片， width, height 为逻辑像素
+        """
+        key = (dpr, width, height)
+        image = self._placeholders.get(key)
+        if image is None:
+            image = QtGui.QImage(max(1, int(width * dpr)), max(1, int(height * dpr)), 
+                                 QtGui.QImage.Format_RGB32)
+            image.fill(QtGui.QColor('#eeeeee'))
+            image.setDevicePixelRatio(dpr)
+            self._placeholders[key] = image
+        return image
+
+    def _submitDecode(self, source, dpr, maxWidth, callback, owner):
+        # 完成后 在界面线程中调用 callback(image, 原图宽度, error)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(2, thread_name_prefix='hyqt-image')
+            self._bridge = _DecodeBridge()
+
+        def done(future):
+            # 在工作线程中调用， 把结果送回界面线程
+            def deliver():
+                if owner is not None and not isValid(owner):
+                    return
+                image, fullWidth = future.result()
+                if image is None:
+                    callback(None, 0, 'image decode error')
+                    return
+                image.setDevicePixelRatio(dpr)  # 否则 scale的屏幕，图片会放大模糊 blurry
+                callback(image, fullWidth, None)
+
+            self._bridge.decoded.emit(deliver)
+
+        self._pool.submit(readImage, source, maxWidth).add_done_callback(done)
+
+    def _decodeFor(self, url, dpr, maxWidth, source, callback, owner):
+        # 相同的图片 正在解码， 等待它的结果
+        key = (url, dpr, maxWidth)
+        waiters = self._decoding.get(key)
+        if waiters is not None:
+            waiters.append((callback, owner))
+            return
+        
+        waiters = self._decoding[key] = [(callback, owner)]
+
+        def decoded(image, fullWidth, error):
+            del self._decoding[key]
+            if image is not None:
+                self._remember((url, dpr), image, fullWidth)
+            for callback, owner in waiters:
+                if owner is None or isValid(owner):
+                    callback(image, error)
+
+        # 解码的结果 所有等待者共用， 不因为第一个 owner 被删除而丢弃
+        self._submitDecode(source, dpr, maxWidth, decoded, None)
+
+    def clear(self):
+        self._images.clear()
+        self.memoryBytes = 0
+
+    def _remember(self, key, image, fullWidth):
+        size = image.sizeInBytes()
+        if size > self.maxMemoryBytes:
+            return
+        
+        old = self._images.pop(key, None)
+        if old is not None:
+            self.memoryBytes -= old[0].sizeInBytes()
+
+        self._images[key] = (image, fullWidth)
+        self.memoryBytes += size
+        while self.memoryBytes > self.maxMemoryBytes:
+            _, (one, _) = self._images.popitem(last=False)
+            self.memoryBytes -= one.sizeInBytes()
+
+    def _loadFiles(self):
+        # 按文件修改时间 作为 LRU 次序
+        self._files = OrderedDict()
+        if not self.directory:
+            return
+        
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), name, os.path.getsize(path)))
+            except OSError:
+                continue
+
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self.diskBytes += size
+
+    def _filePath(self, url):
+        # 磁盘缓存的文件路径， 没有返回 None
+        if self._files is None:
+            self._loadFiles()
+
+        name = hashlib.sha1(url.encode()).hexdigest()
+        if name not in self._files:
+            return None
+        
+        path = os.path.join(self.directory, name)
+        try:
+            os.utime(path)
+        except OSError:
+            self.diskBytes -= self._files.pop(name)
+            return None
+        
+        self._files.move_to_end(name)
+        return path
+
+    def _writeFile(self, url, data):
+        if self._files is None:
+            self._loadFiles()
+        if not self.directory:
+            return
+        
+        name = hashlib.sha1(url.encode()).hexdigest()
+        try:
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            print('image cache write error:', e)
+            return
+        
+        self.diskBytes += len(data) - self._files.pop(name, 0)
+        self._files[name] = len(data)
+
+        while self.diskBytes > self.maxDiskBytes and self._files:
+            name, size = self._files.popitem(last=False)
+            self.diskBytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+def _decodeWidth(textEdit):
+    # 图片按 显示宽度 解码， 单位为设备像素
+    width = max(textEdit.viewport().width(), ImageCache.minDecodeWidth)
+    return int(width * textEdit.DPR)
+
+
+def _hasImage(block):
+    it = block.begin()
+    while not it.atEnd():
+        if it.fragment().charFormat().isImageFormat():
+            return True
+        it += 1
+    return False
+
+
+class _ImagePatcher:
+    """
+    把下载完成的图片 加入文档资源， 只重新布局 用到这些图片的片段，
+    同一帧内到达的图片 合并为一次， 不用每个图片都 setHtml 重新解析整个文档
+    """
+    def __init__(self, textEdit):
+        self.textEdit = textEdit
+        self.pending = set()
+
+        self.timer = QtCore.QTimer(textEdit)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(16)
+        self.timer.timeout.connect(self.flush)
+
+    def add(self, name, image):
+        self.textEdit.document().addResource(QtGui.QTextDocument.ImageResource, name, image)
+        self.pending.add(name)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        names, self.pending = self.pending, set()
+        doc = self.textEdit.document()
+
+        block = doc.begin()
+        while block.isValid():
+            it = block.begin()
+            while not it.atEnd():
+                fragment = it.fragment()
+                charFormat = fragment.charFormat()
+                if charFormat.isImageFormat() and charFormat.toImageFormat().name() in names:
+                    doc.markContentsDirty(fragment.position(), fragment.length())
+                it += 1
+            block = block.next()
+
+        # markContentsDirty 不会触发 contentsChanged
+        self.textEdit.adjustHeight()
+
+
+class UploadedImages:
+    """
+    记录已经上传过的图片 (uploadUrl, 内容的sha1) -> 服务端返回的 url，
+    内容相同的图片 不再重复上传， 超过数量上限时 按 LRU 淘汰
+
+    :param maxSize: 最多记录的图片数量
+    """
+
+    def __init__(self, maxSize=1000):
+        self.maxSize = maxSize
+        self._urls = OrderedDict()
+
+    def __len__(self):
+        return len(self._urls)
+
+    def get(self, key):
+        url = self._urls.get(key)
+        if url is not None:
+            self._urls.move_to_end(key)
+        return url
+
+    def put(self, key, url):
+        self._urls[key] = url
+        self._urls.move_to_end(key)
+        while len(self._urls) > self.maxSize:
+            self._urls.popitem(last=False)
+
+    def clear(self):
+        self._urls.clear()
+
+
 class BaseTextEdit(QTextEdit):
     IMAGE_EXTENSIONS = ['.jpg','.png','.bmp']
     DPR = None
 
-    def __init__(self, rte=None, html=None):
+    # saveTmpResourcesToServer 的进度， 参数为 (已完成的图片数, 总数)
+    uploadProgress = QtCore.Signal(int, int)
+    # saveTmpResourcesToServer 结束， 参数为 是否全部上传成功
+    uploadFinished = QtCore.Signal(bool)
+    # saveTmpResourcesToServer 失败， 参数为 错误信息， 在 uploadFinished 之前发出，
+    # 由调用者决定 怎样提示用户
+    uploadFailed = QtCore.Signal(str)
+
+    # 上传图片的接口， 参数 file_name 为文件名， 返回 {'ret':0, 'url':图片的url}
+    uploadUrl = 'http://localhost/api/upload'
+    # 上传的图片格式， 'PNG' 或者 'WEBP'
+    uploadFormat = 'PNG'
+    # 编码质量 0-100， -1 为缺省值， WEBP 为 100 时 是无损压缩
+    uploadQuality = -1
+    # 同时上传的图片数量上限
+    uploadLimit = 4
+    # 已经上传过的图片， 缺省所有编辑框共用一个
+    uploadedImages = UploadedImages()
+
+    def __init__(self, rte=None, html=None, uploadedImages=None):
+        """
+        :param uploadedImages: 记录已经上传过的图片的 UploadedImages， None 使用共用的
+        """
         super().__init__()
         self.rte = rte
+        if uploadedImages is not None:
+            self.uploadedImages = uploadedImages
 
         self.setObjectName('RichTextEdit')
 
@@ -28,12 +466,19 @@ class BaseTextEdit(QTextEdit):
             BaseTextEdit.DPR = QApplication.primaryScreen().devicePixelRatio()
             print("Device Pixel Ratio:", BaseTextEdit.DPR)
 
+        self.nam = NAM.getInstance()
+        self.imagePatcher = _ImagePatcher(self)
+        # 拖入的本地图片 正在后台解码的， 解码完成前 不能上传
+        self.imagesDecoding = set()
+        # 拖入的本地图片 tmp 图片名 -> 文件路径
+        self.tmpFiles = {}
+        # 每次保存 加 1， 重新保存时， 之前还没结束的那次 不再处理结果
+        self._uploadRun = 0
+
         if html:
             self.setHtml2(html)
 
         self.document().contentsChanged.connect(self.adjustHeight)
-
-        self.nam = NAM.getInstance()
     
     def onSelect(self):
         self.rte.bold_action.setChecked(self.fontWeight() == QtGui.QFont.Bold) 
@@ -45,25 +490,21 @@ class BaseTextEdit(QTextEdit):
         
         :param html: HTML 文本
         """
-        
-        self.setHtml(html)
 
         self.imagesHandled = {}
 
-        def oneImgDownloaded(imgUrl, reply) :
-            if reply.error() != QNetworkReply.NoError:
-                print("Error loading image:", reply.errorString())
+        def oneImgDownloaded(imgUrl, image, error) :
+            if error is not None:
+                print("Error loading image:", error)
                 return   
                       
             # print(imgUrl,' downloaded.')
-
-            image = QtGui.QImage()
-            image.loadFromData(reply.readAll())
-            image.setDevicePixelRatio(self.DPR)  # 否则 scale的屏幕，图片会放大模糊 blurry
             
-            self.document().addResource(QtGui.QTextDocument.ImageResource, imgUrl, image)
-            self.setHtml(html) # 会触发contentsChanged，显示已经加载的图片
+            self.imagePatcher.add(imgUrl, image)
 
+        imageCache = ImageCache.getInstance()
+        maxWidth = _decodeWidth(self)
+        toDownload = []
 
         for imgUrl in re.findall(r'<img src="(.+?)"', html):
             
@@ -73,10 +514,21 @@ class BaseTextEdit(QTextEdit):
 
             self.imagesHandled[imgUrl] = 1
 
+            # 缓存里有的图片， 在 setHtml 之前加入文档资源， 没有的 先显示占位图片
+            image = imageCache.get(imgUrl, self.DPR, maxWidth)
+            if image is not None:
+                self.document().addResource(QtGui.QTextDocument.ImageResource, imgUrl, image)
+            else:
+                self.document().addResource(QtGui.QTextDocument.ImageResource, imgUrl, 
+                                            imageCache.placeholder(self.DPR))
+                toDownload.append(imgUrl)
 
-            reply = self.nam.get(QNetworkRequest(QtCore.QUrl(imgUrl)))
-            reply.finished.connect(
-                lambda imgUrl=imgUrl,reply=reply: oneImgDownloaded(imgUrl,reply)) 
+        self.setHtml(html)
+
+        # 控件删除后 还在排队的下载自动取消
+        for imgUrl in toDownload:
+            imageCache.fetch(imgUrl, self.DPR, partial(oneImgDownloaded, imgUrl), 
+                             self.nam, owner=self, maxWidth=maxWidth)
 
 
     def adjustHeight(self):
@@ -125,14 +577,46 @@ class BaseTextEdit(QTextEdit):
             # 后面可以这样获取图片数据
             # self.document().resource(QtGui.QTextDocument.ImageResource, url)
 
+        def addImageFile(localPath):
+            # 大图片 解码很慢， 先插入占位图片， 在工作线程中 按显示宽度解码，完成后替换
+            url = f'tmp_{time.time()}'
+            maxWidth = _decodeWidth(self)
+
+            # 只读取文件头， 得到图片大小， 占位图片和显示的大小相同， 替换时 不用重新排版，
+            # 和 readImage 一样 按 EXIF 方向 旋转
+            reader = QtGui.QImageReader(localPath)
+            reader.setAutoTransform(True)
+            size = reader.size()
+            if reader.transformation() & QtGui.QImageIOHandler.TransformationRotate90:
+                size.transpose()
+            if size.isValid() and size.width() > maxWidth:
+                size = QtCore.QSize(maxWidth, round(size.height() * maxWidth / size.width()))
+            if not size.isValid():
+                size = QtCore.QSize(32, 32)
+
+            imageCache = ImageCache.getInstance()
+            self.document().addResource(QtGui.QTextDocument.ImageResource, url, 
+                imageCache.placeholder(self.DPR, size.width() / self.DPR, size.height() / self.DPR))
+            self.textCursor().insertImage(url)
+
+            def decoded(image, error):
+                self.imagesDecoding.discard(url)
+                if error is not None:
+                    print('image decode error:', localPath)
+                    return
+                self.imagePatcher.add(url, image)
+
+            self.imagesDecoding.add(url)
+            # 按显示宽度解码的 只用于显示， 上传时 从原文件 按原图大小 重新解码
+            self.tmpFiles[url] = localPath
+            imageCache.decode(localPath, self.DPR, decoded, owner=self, maxWidth=maxWidth)
+
         if source.hasUrls():
             for u in source.urls():
                 file_ext = splitext(str(u.toLocalFile()))
                 # 本地文件拖拽
                 if u.isLocalFile() and file_ext in self.IMAGE_EXTENSIONS:
-                    localPath = u.toLocalFile()
-                    image = QtGui.QImage(localPath)          
-                    addImage(image)
+                    addImageFile(u.toLocalFile())
                     
                 # 网络图片拖拽，比如从浏览器拖拽图片
                 else:
@@ -151,101 +635,180 @@ class BaseTextEdit(QTextEdit):
 
         super().insertFromMimeData(source)
 
-    def saveTmpResourcesToServer(self):        
-        
+    def saveTmpResourcesToServer(self, limit=None, timeout=None):
         """
         保存当前文档里的临时图片资源到服务端，并更新html里的img标签
         
         1. 找到文档里的临时图片资源，都是 tmp_ 开头的
-        2. 上传到服务端，得到url
-        3. 更新html里的img标签
-        4. 如果所有图片都上传成功，后续调用者可以上传更新后的HTML
+        2. 在工作线程中 编码为 uploadFormat 格式， 内容相同的图片 只上传一份
+        3. 编码好的图片 马上上传， 同时上传的数量 不超过 limit
+        4. 全部上传成功后， 一次性更新html里的img标签
+        
+        上传过程中 发出 uploadProgress 信号， 结束时 发出 uploadFinished 信号，
+        如果所有图片都上传成功，后续调用者可以上传更新后的HTML，
+        失败时 先发出 uploadFailed 信号， 这里不弹出对话框， 由调用者提示用户
+
+        :param limit: 同时上传的图片数量上限， None 使用 uploadLimit
+        :param timeout: 每个图片上传的超时时间，单位秒， None 使用 NAM 的设置
         """
 
-        self.html = self.toCleanHtml()
-        
         self.saveTmpResourcesStatus = 'ongoing'
+        self._uploadRun += 1
+        run = self._uploadRun
+
+        # 拖入的图片 还在解码， 稍后再上传
+        if self.imagesDecoding:
+            def retry():
+                if run == self._uploadRun:
+                    self.saveTmpResourcesToServer(limit, timeout)
+
+            QtCore.QTimer.singleShot(50, retry)
+            return
+
+        self.html = self.toCleanHtml()
         
-        # 需要上传的图片，都是 tmp命名的
-        self.toUploadImgs = set(re.findall(r'<img src="(tmp_.+?)"', self.html))  
+        # 需要上传的图片，都是 tmp命名的， 复制了多份的图片 只需要处理一份
+        imgUrls = list(dict.fromkeys(re.findall(r'<img src="(tmp_.+?)"', self.html)))
 
-        if len(self.toUploadImgs) == 0:     
-            self.saveTmpResourcesStatus = 'finished'      
+        if len(imgUrls) == 0:
+            self.saveTmpResourcesStatus = 'finished'
+            self.uploadFinished.emit(True)
             return
 
-        self.uploadedImgs = set()
-        self.uploadFailedImgs = []
+        limit = limit or self.uploadLimit
+        uploadUrl = self.uploadUrl
+        fmt = self.uploadFormat.lower()
+
+        images   = {}   # tmp 图片名 -> QImage
+        newUrls  = {}   # tmp 图片名 -> 服务端返回的 url
+        waiting  = {}   # 内容的sha1 -> 等待这次上传结果的 tmp 图片名列表
+        queue    = []   # 等待上传的 (sha1, 文件名, 图片内容)
+        inflight = [0]  # 正在上传的数量
 
-        def oneImgUploaded(imageName, image, retObj) :
-            if retObj['ret'] != 0:
-                print(retObj['msg'])
+        def finish(ok, error=None):
+            # 结束后 还在进行的上传 不再处理结果
+            self._uploadRun += 1
+
+            if not ok:
+                print(error)
                 self.saveTmpResourcesStatus = 'failed'
-                self.uploadFailedImgs.append(imageName)
-                QMessageBox.critical(
-                    self, '错误',
-                    f'上传图片错误: {retObj["msg"]}'
-                )
+                self.uploadFailed.emit(str(error))
+                self.uploadFinished.emit(False)
                 return
-            
-            self.uploadedImgs.add(imageName)          
-            print(imageName,' uploaded.')
-
 
-            # 修改 html里面 的img标签src 为 服务端返回的 图片 url
-            newUrl = retObj['url']
-            oldName = imageName[:-4] # 原来的文档里面图片资源的src名字是 没有后缀 .png 的
-            self.html = self.html.replace(f'src="{oldName}"', f'src="{newUrl}"')
+            # 一次性修改 html里面 的img标签src 为 服务端返回的 图片 url
+            self.html = re.sub(r'<img src="(tmp_.+?)"', 
+                               lambda m: f'<img src="{newUrls[m.group(1)]}"', self.html)
 
             # 更新文档资源， 以新url为key, 这样后面 setHtml2 / setHtml 时，就不用重新下载服务端的图片
-            self.document().addResource(QtGui.QTextDocument.ImageResource, newUrl, image)
+            for imgUrl, newUrl in newUrls.items():
+                self.document().addResource(QtGui.QTextDocument.ImageResource, newUrl, images[imgUrl])
+                self.tmpFiles.pop(imgUrl, None)
             self.setHtml(self.html)
-            
-            # 图片全部上传成功
-            if len(self.toUploadImgs) == len(self.uploadedImgs):   
-                print('**** all uploaded')      
-                self.saveTmpResourcesStatus = 'finished'       
-        
 
+            print('**** all uploaded')
+            self.saveTmpResourcesStatus = 'finished'
+            self.uploadFinished.emit(True)
+
+        def resolved(imgUrl, newUrl):
+            newUrls[imgUrl] = newUrl
+            self.uploadProgress.emit(len(newUrls), len(imgUrls))
+            if len(newUrls) == len(imgUrls):
+                finish(True)
+
+        def startUploads():
+            while queue and inflight[0] < limit:
+                digest, fileName, data = queue.pop(0)
+                inflight[0] += 1
+                print(fileName, ' uploading...')
+                self.nam.send('POST', f'{uploadUrl}?file_name={fileName}', data, 
+                    f'image/{fmt}', partial(oneImgUploaded, digest, fileName), 
+                    owner=self, timeout=timeout)
+
+        def oneImgUploaded(digest, fileName, data, error):
+            if run != self._uploadRun:
+                return
+            inflight[0] -= 1
 
-        self.imagesHandled = {}
+            if error is None:
+                try:
+                    retObj = json.loads(bytes(data))
+                except ValueError as e:
+                    error = f'json decode error: {e}'
+                else:
+                    if retObj.get('ret') != 0:
+                        error = retObj.get('msg', retObj)
 
-        # 把未上传的图片，上传到服务端
-        for imgUrl in self.toUploadImgs:
-            
-            if self.uploadFailedImgs:               
-                break
+            if error is not None:
+                finish(False, error)
+                return
 
-            # 如果这个图片复制了多份， 只需要上传一份
-            if imgUrl in self.imagesHandled:
-                continue
+            print(fileName, ' uploaded.')
+            self.uploadedImages.put((uploadUrl, digest), retObj['url'])
+            for imgUrl in waiting.pop(digest):
+                resolved(imgUrl, retObj['url'])
+                if run != self._uploadRun:
+                    return
+            startUploads()
 
+        def encoded(imgUrl, data, digest):
+            if run != self._uploadRun:
+                return
 
-            self.imagesHandled[imgUrl] = 1
+            if data is None:
+                finish(False, f'image encode error: {imgUrl}')
+                return
 
-            image = self.document().resource(QtGui.QTextDocument.ImageResource, imgUrl)
-           
-            # 所有拖拽，剪贴板 复制的图片，都会变成 bmp 格式
+            # 内容相同的图片 以前上传过
+            newUrl = self.uploadedImages.get((uploadUrl, digest))
+            if newUrl is not None:
+                resolved(imgUrl, newUrl)
+                return
 
-            imageName = imgUrl + '.png'
+            # 内容相同的图片 正在上传， 等它的结果
+            if digest in waiting:
+                waiting[digest].append(imgUrl)
+                return
 
-            print(imageName,' uploading...')
- 
+            waiting[digest] = [imgUrl]
+            queue.append((digest, f'{imgUrl}.{fmt}', data))
+            startUploads()
 
-            uploadData = qimage_to_png_bytearray(image)
+        # 在工作线程中编码， 编码好一个 就开始上传一个
+        for imgUrl in imgUrls:
+            image = self.document().resource(QtGui.QTextDocument.ImageResource, imgUrl)
+            images[imgUrl] = image
+            _encodeInThread(image, self.uploadFormat, self.uploadQuality, 
+                            partial(encoded, imgUrl), owner=self, path=self.tmpFiles.get(imgUrl))
 
-          
-            # self.nam.post('http://localhost/api/upload?file_name='+imageName, 
-            #     uploadData, contentType="image/image", okHandler=
-            #     lambda retObj, reply=reply,imageName=imageName, image=image: \
-            #         oneImgUploaded(imageName,image,reply)) 
+    async def asaveTmpResourcesToServer(self, limit=None, timeout=60):
+        """
+        saveTmpResourcesToServer 的 asyncio 版本， 全部完成后返回
+        
+        需要 asyncio 事件循环 运行在 Qt 事件循环之上， 比如 QtAsyncio
 
+        :param limit: 同时上传的图片数量上限， None 使用 uploadLimit
+        :param timeout: 每个图片上传的超时时间，单位秒
+        :return: 全部上传成功 返回 True
+        """
+
+        future = asyncio.get_running_loop().create_future()
 
-            self.nam.post('http://localhost/api/upload?file_name='+imageName, 
-                uploadData, contentType="image/image", 
-                okHandler=partial(oneImgUploaded,imageName,image),
-                errHandler=partial(oneImgUploaded,imageName,image),
-                ) 
+        def finished(ok):
+            if not future.done():
+                future.set_result(ok)
 
+        self.uploadFinished.connect(finished)
+        try:
+            self.saveTmpResourcesToServer(limit, timeout)
+            return await future
+        except asyncio.CancelledError:
+            # 取消时， 还在进行的上传 不再处理结果
+            self._uploadRun += 1
+            self.saveTmpResourcesStatus = 'failed'
+            raise
+        finally:
+            self.uploadFinished.disconnect(finished)
 
     def toCleanHtml(self):
         def subFunc(match):
@@ -275,7 +838,65 @@ def qimage_to_png_bytearray(qimage):
     return byte_array
 
 
+def encodeImage(image, fmt='PNG', quality=-1):
+    """
+    把 QImage 编码为 图片文件的内容， 可以在工作线程中调用
+
+    :param fmt: 图片格式， 比如 'PNG'、'WEBP'
+    :param quality: 编码质量 0-100， -1 为缺省值
+    :return: (图片内容 bytes, 内容的 sha1)， 失败时为 (None, None)
+    """
+    byte_array = QtCore.QByteArray()
+    buffer = QtCore.QBuffer(byte_array)
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    ok = image.save(buffer, fmt, quality)
+    buffer.close()
+
+    if not ok:
+        return None, None
+    data = byte_array.data()
+    return data, hashlib.sha1(data).hexdigest()
+
+
+_encodePool = None
+_encodeBridge = None
+
+def _encodeFile(path, image, fmt, quality):
+    # 按原图大小 解码本地文件 再编码， 文件读取失败时 编码 image
+    full, _ = readImage(path)
+    return encodeImage(image if full is None else full, fmt, quality)
+
+
+def _encodeInThread(image, fmt, quality, callback, owner=None, path=None):
+    # 编码完成后 在界面线程中调用 callback(data, sha1)
+    # path 为图片的本地文件时， 编码原图， 而不是 按显示宽度解码的 image
+    global _encodePool, _encodeBridge
+    if _encodePool is None:
+        _encodePool = ThreadPoolExecutor(2, thread_name_prefix='hyqt-encode')
+        _encodeBridge = _DecodeBridge()
+
+    def done(future):
+        # 在工作线程中调用， 把结果送回界面线程
+        def deliver():
+            if owner is not None and not isValid(owner):
+                return
+            callback(*future.result())
+
+        _encodeBridge.decoded.emit(deliver)
+
+    if path is None:
+        future = _encodePool.submit(encodeImage, image, fmt, quality)
+    else:
+        future = _encodePool.submit(_encodeFile, path, image, fmt, quality)
+    future.add_done_callback(done)
+
+
 class RichTextEdit(QFrame):
+
+    # 参见 BaseTextEdit
+    uploadProgress = QtCore.Signal(int, int)
+    uploadFinished = QtCore.Signal(bool)
+    uploadFailed = QtCore.Signal(str)
      
     my_css = '''
 QTextEdit {
@@ -286,7 +907,11 @@ QTextEdit {
 '''
 
 
-    def __init__(self, html=None):
+    def __init__(self, html=None, uploadedImages=None):
+        """
+        :param html: HTML 文本
+        :param uploadedImages: 参见 BaseTextEdit
+        """
         super().__init__()
 
         self.setStyleSheet(self.my_css)
@@ -298,7 +923,10 @@ QTextEdit {
         self.setupToolsBar()
 
         # 编辑框
-        self._te = BaseTextEdit(self, html=html)
+        self._te = BaseTextEdit(self, html=html, uploadedImages=uploadedImages)
+        self._te.uploadProgress.connect(self.uploadProgress)
+        self._te.uploadFinished.connect(self.uploadFinished)
+        self._te.uploadFailed.connect(self.uploadFailed)
         lo.addWidget(self._te)
 
         # 结尾 addStretch， 可以让该layout后面尽量空白占据，
@@ -340,8 +968,11 @@ QTextEdit {
         # action.triggered.connect(
         #    lambda: print('------',self._te.toCleanHtml(),'------',sep='\n'))
 
-    def saveTmpResourcesToServer(self):
-        self._te.saveTmpResourcesToServer()
+    def saveTmpResourcesToServer(self, limit=None, timeout=None):
+        self._te.saveTmpResourcesToServer(limit, timeout)
+
+    async def asaveTmpResourcesToServer(self, limit=None, timeout=60):
+        return await self._te.asaveTmpResourcesToServer(limit, timeout)
         
     def saveTmpResourcesStatus(self):
         return self._te.saveTmpResourcesStatus
@@ -352,7 +983,14 @@ QTextEdit {
 class RichTextBrowser(QTextBrowser):
     DPR = None
 
-    def __init__(self, html=None, nam=None):
+    def __init__(self, html=None, nam=None, lazyImages=False, lazyMargin=300):
+        """
+        :param html: HTML 文本
+        :param nam: 下载图片使用的 NAM， 缺省为 NAM.getInstance()
+        :param lazyImages: 为 True 时， 只下载 显示出来的区域 附近的图片， 
+            滚动 或者 展开后 再下载其它的， 适合很长的文档
+        :param lazyMargin: lazyImages 模式下， 显示区域 上下左右 扩展这么多像素 内的图片 也会下载
+        """
         
         super().__init__()
 
@@ -372,6 +1010,20 @@ class RichTextBrowser(QTextBrowser):
         # 已经放到处理队列的图片
         self.imagesHandled = {}
 
+        if nam is None:
+            nam = NAM.getInstance()
+        self.nam = nam  
+        self.imagePatcher = _ImagePatcher(self)
+
+        self.lazyImages = lazyImages
+        self.lazyMargin = lazyMargin
+        # lazyImages 模式下， 还没有下载的图片 imgUrl -> realUrl
+        self.lazyPending = {}
+        # 文档资源还是占位图片的 imgUrl， 下载失败的 下次 setHtml2 时重新下载
+        self.placeholders = set()
+        # 正在下载的 imgUrl， 完成后 会替换占位图片， 不用再次下载
+        self.imagesLoading = set()
+
 
         if html is not None:
             self.setHtml2(html)
@@ -383,18 +1035,23 @@ class RichTextBrowser(QTextBrowser):
 
         self.document().contentsChanged.connect(self.adjustHeight)
 
-        # 设置 行距
-        cursor = self.textCursor()
-        cursor.select(QtGui.QTextCursor.Document)
+        self._applyLineHeight()
 
+    def _applyLineHeight(self):
+        # 设置 行距， 包含图片的段落 不设置，
+        # 图片是后来 加入文档资源的， 按比例的行距 会把图片所在的行 压扁， 图片互相重叠
         block_format = QtGui.QTextBlockFormat()
-        # Set line spacing to 1.5 (150%)
-        block_format.setLineHeight(40.0, 1)
-        cursor.setBlockFormat(block_format)
-
-        if nam is None:
-            nam = NAM.getInstance()
-        self.nam = nam  
+        block_format.setLineHeight(40.0, QtGui.QTextBlockFormat.LineHeightTypes.ProportionalHeight.value)
+
+        cursor = QtGui.QTextCursor(self.document())
+        cursor.beginEditBlock()
+        block = self.document().begin()
+        while block.isValid():
+            if not _hasImage(block):
+                cursor.setPosition(block.position())
+                cursor.setBlockFormat(block_format)
+            block = block.next()
+        cursor.endEditBlock()
         
 
     def setHtml2(self,html): 
@@ -403,23 +1060,10 @@ class RichTextBrowser(QTextBrowser):
         
         :param html: HTML 文本
         """
-        def oneImgDownloaded(imgUrl, reply) :
-            if reply.error() != QNetworkReply.NoError:
-                print("Error loading image:", reply.errorString())
-                return   
-                      
-            # print(imgUrl,' downloaded.')
-
-            image = QtGui.QImage()
-            image.loadFromData(reply.readAll())
-            image.setDevicePixelRatio(self.DPR)  # 否则 scale的屏幕，图片会放大模糊 blurry
-
-            self.document().addResource(QtGui.QTextDocument.ImageResource, imgUrl, image)
-            self.setHtml(html) # 会触发contentsChanged，显示已经加载的图片
-        
-        self.setHtml(html)
-
         self.imagesHandled = {}
+        imageCache = ImageCache.getInstance()
+        maxWidth = _decodeWidth(self)
+        toDownload = []
               
         for imgUrl in re.findall(r'<img src=\"(.+?)\"', html):
 
@@ -430,12 +1074,13 @@ class RichTextBrowser(QTextBrowser):
             
             self.imagesHandled[imgUrl] = 1
 
-            # 已经存在的图片资源，不再重复下载
+            # 已经存在的图片资源，不再重复下载， 占位图片 不算
             image = self.document().resource(QtGui.QTextDocument.ImageResource, imgUrl)
-            if image is not None:                
+            if image is not None and imgUrl not in self.placeholders:
                 continue
 
-            print('img downloading:', imgUrl)
+            if imgUrl in self.imagesLoading:
+                continue
 
             # 外站图片， 使用绝对路径  
             if imgUrl.startswith('http'):
@@ -449,10 +1094,78 @@ class RichTextBrowser(QTextBrowser):
                 print('img Url error:', imgUrl)
                 continue
 
+            # 缓存里有的图片， 在 setHtml 之前加入文档资源， 没有的 先显示占位图片
+            image = imageCache.get(realUrl, self.DPR, maxWidth)
+            if image is not None:
+                self.document().addResource(QtGui.QTextDocument.ImageResource, imgUrl, image)
+                self.placeholders.discard(imgUrl)
+            else:
+                # 占位图片 按 img 标签的 width/height 属性 显示， 有这两个属性时， 图片到达后 不用重新排版
+                self.document().addResource(QtGui.QTextDocument.ImageResource, imgUrl, 
+                                            imageCache.placeholder(self.DPR))
+                self.placeholders.add(imgUrl)
+                toDownload.append((imgUrl, realUrl))
+
+        self.setHtml(html)
+
+        # 显示的时候 在 paintEvent 里 下载 显示区域附近的图片，
+        # 之前的 setHtml2 还没有下载的 保留
+        if self.lazyImages:
+            self.lazyPending.update(toDownload)
+            self.viewport().update()
+            return
+
+        for imgUrl, realUrl in toDownload:
+            self._fetchImage(imgUrl, realUrl)
+
+    def _fetchImage(self, imgUrl, realUrl):
+        def oneImgDownloaded(image, error) :
+            self.imagesLoading.discard(imgUrl)
+            if error is not None:
+                print("Error loading image:", error)
+                return   
+                      
+            # print(imgUrl,' downloaded.')
+
+            self.placeholders.discard(imgUrl)
+            self.imagePatcher.add(imgUrl, image)
+
+        print('img downloading:', imgUrl)
+        self.imagesLoading.add(imgUrl)
 
-            reply = self.nam.get(QNetworkRequest(QtCore.QUrl(realUrl)))
-            reply.finished.connect(
-                lambda imgUrl=imgUrl,reply=reply: oneImgDownloaded(imgUrl,reply)) 
+        # 控件删除后 还在排队的下载自动取消
+        ImageCache.getInstance().fetch(realUrl, self.DPR, oneImgDownloaded, 
+                                       self.nam, owner=self, maxWidth=_decodeWidth(self))
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        
+        # 滚动 或者 展开时， 新显示出来的区域 会重绘
+        if self.lazyPending:
+            self._loadImagesIn(event.rect())
+
+    def _loadImagesIn(self, rect):
+        # 下载 viewport 中 rect 区域附近的图片
+        margin = self.lazyMargin
+        area = QtCore.QRectF(rect.adjusted(-margin, -margin, margin, margin)).translated(
+            self.horizontalScrollBar().value(), self.verticalScrollBar().value())
+
+        doc = self.document()
+        docLayout = doc.documentLayout()
+
+        block = doc.begin()
+        while block.isValid() and self.lazyPending:
+            if docLayout.blockBoundingRect(block).intersects(area):
+                it = block.begin()
+                while not it.atEnd():
+                    charFormat = it.fragment().charFormat()
+                    if charFormat.isImageFormat():
+                        imgUrl = charFormat.toImageFormat().name()
+                        realUrl = self.lazyPending.pop(imgUrl, None)
+                        if realUrl is not None:
+                            self._fetchImage(imgUrl, realUrl)
+                    it += 1
+            block = block.next()
         
         
     def adjustHeight(self):
@@ -2,9 +2,13 @@ from PySide6.QtNetwork import QNetworkAccessManager,  QNetworkProxy, \
     QNetworkRequest,QNetworkReply
 
 from PySide6 import QtCore
-from PySide6.QtWidgets import QLayoutItem, QMessageBox
+from PySide6.QtWidgets import QLayoutItem, QMessageBox, QWidget
+import shiboken6
 
-import json
+import json, time, heapq, os, hashlib, re, gc, threading, asyncio, random
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
 
 
 from datetime import datetime
@@ -14,7 +18,25 @@ def isodate2str(isodateStr):
           .astimezone().strftime('%Y-%m-%d %H:%M:%S') 
 
 
-def clearLayout(layout):
+def clearLayout(layout, incremental=False, budgetMs=5, onFinished=None):
+    """
+    清空 layout 里的所有内容，并删除其中的控件
+
+    :param layout: 要清空的 layout
+    :param incremental: 为 True 时，立即把控件从 layout 里取出并隐藏，
+        然后在后面的事件循环里 分批删除， 避免一次删除大量控件 导致界面卡顿
+    :param budgetMs: incremental 模式下， 每次事件循环 最多用于删除控件的时间，单位毫秒，
+        必须大于 0， 每次 至少删除一个控件
+    :param onFinished: incremental 模式下， 全部删除完成后 调用的函数
+    """
+    if incremental:
+        if budgetMs <= 0:
+            raise ValueError(f'budgetMs `{budgetMs}` must be greater than 0')
+        widgets = []
+        _detachLayout(layout, widgets)
+        _IncrementalDeleter(widgets, budgetMs, onFinished).start()
+        return
+    
     while layout.count():
         # takeAt will take the item out of the layout
         child:QLayoutItem = layout.takeAt(0)
@@ -35,8 +57,733 @@ def clearLayout(layout):
 
         del child
 
+def _detachLayout(layout, widgets):
+    # 从后往前取， takeAt 不需要移动后面的 item
+    while layout.count():
+        child:QLayoutItem = layout.takeAt(layout.count()-1)
+
+        if child.widget():
+            widget = child.widget()
+            widget.hide()
+            widgets.append(widget)
+
+        elif child.layout():
+            _detachLayout(child.layout(), widgets)
+            child.layout().deleteLater()
+
+
+class _IncrementalDeleter:
+    """
+    在多次事件循环中 分批删除控件， 每次最多用 budgetMs 毫秒
+    """
+
+    # 正在进行的删除任务，保持引用
+    running = set()
+
+    def __init__(self, widgets, budgetMs=5, onFinished=None):
+        # 后面 pop 从最后开始， 所以倒序， 先删除前面的控件
+        self.queue = widgets[::-1]
+        self.budget = budgetMs / 1000
+        self.onFinished = onFinished
+
+        self.timer = QtCore.QTimer()
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.step)
+
+    def start(self):
+        _IncrementalDeleter.running.add(self)
+        self.timer.start()
+
+    def step(self):
+        deadline = time.perf_counter() + self.budget
+        queue = self.queue
+        deleted = False
+
+        # 预算很小时 也至少删除一个， 保证能结束
+        while queue and (not deleted or time.perf_counter() < deadline):
+            widget = queue.pop()
+
+            # 可能已经随上级控件一起被删除了
+            if not shiboken6.isValid(widget):
+                continue
+
+            # 子控件很多的控件， 先把子控件放到队列里，分批删除
+            descendants = widget.findChildren(QWidget, options=QtCore.Qt.FindDirectChildrenOnly)
+            if descendants:
+                queue.append(widget)
+                queue.extend(descendants)
+                continue
+
+            shiboken6.delete(widget)
+            deleted = True
+
+        if not queue:
+            self.timer.stop()
+            _IncrementalDeleter.running.discard(self)
+            if self.onFinished:
+                self.onFinished()
+
+
+class ResponseCache:
+    """
+    NAM 的 GET 响应缓存， 内存 + 磁盘（可选） 两级
+
+    遵守响应的 Cache-Control （no-store, no-cache, max-age） 和 Expires，
+    保存 ETag / Last-Modified， 过期后 发送条件请求，服务端返回 304 时 使用缓存内容。
+    超过字节数上限时， 按 LRU 淘汰。
+
+    :param directory: 磁盘缓存目录， 为 None 时只使用内存
+    :param maxBytes: 磁盘缓存的字节数上限
+    :param maxMemoryBytes: 内存缓存的字节数上限
+    """
+
+    def __init__(self, directory=None, maxBytes=50*1024*1024, maxMemoryBytes=10*1024*1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.maxMemoryBytes = maxMemoryBytes
+
+        # url -> 元信息 {'etag', 'lastModified', 'expires', 'mustRevalidate', 'size'}， LRU 次序
+        self._index = OrderedDict()
+        self._indexBytes = 0
+
+        # url -> 响应内容 bytes， LRU 次序
+        self._memory = OrderedDict()
+        self._memoryBytes = 0
+
+        self.hits = 0          # 直接使用缓存，没有请求
+        self.revalidated = 0   # 条件请求 返回 304
+        self.misses = 0
+        self.bytesSaved = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._loadIndex()
+
+    def stats(self) -> dict:
+        return {
+            'hits'        : self.hits,
+            'revalidated' : self.revalidated,
+            'misses'      : self.misses,
+            'bytesSaved'  : self.bytesSaved,
+            'entries'     : len(self._index),
+            'bytes'       : self._indexBytes,
+            'memoryBytes' : self._memoryBytes,
+        }
+
+    def lookup(self, url):
+        """
+        返回 (元信息, 内容)， 没有缓存 返回 (None, None)
+        """
+        meta = self._index.get(url)
+        if meta is None:
+            return None, None
+        
+        body = self._readBody(url)
+        if body is None:
+            self._remove(url)
+            return None, None
+        
+        self._index.move_to_end(url)
+        return meta, body
+
+    def has(self, url):
+        """
+        是否有 url 的缓存， 可能已经过期
+        """
+        return url in self._index
+
+    def isFresh(self, meta):
+        return not meta['mustRevalidate'] and time.time() < meta['expires']
+
+    def store(self, url, body:bytes, headers:dict):
+        """
+        根据响应头 保存响应内容
+
+        :param headers: 响应头， key 为小写
+        """
+        meta = self._parseHeaders(headers)
+        if meta is None:
+            self._remove(url)
+            return
+        
+        self._remove(url)
+        meta['size'] = len(body)
+
+        if self.directory:
+            with open(self._path(url, '.body'), 'wb') as f:
+                f.write(body)
+            with open(self._path(url, '.json'), 'w', encoding='utf8') as f:
+                json.dump({'url': url, **meta}, f)
+
+        self._index[url] = meta
+        self._indexBytes += meta['size']
+        self._remember(url, body)
+        self._evict()
+
+    def refresh(self, url, headers:dict):
+        """
+        收到 304 后， 按照新的响应头 更新过期时间
+        """
+        meta = self._index.get(url)
+        newMeta = self._parseHeaders(headers)
+        if meta is None or newMeta is None:
+            return
+        
+        newMeta['etag'] = newMeta['etag'] or meta['etag']
+        newMeta['lastModified'] = newMeta['lastModified'] or meta['lastModified']
+        meta.update(newMeta)
+
+        if self.directory:
+            with open(self._path(url, '.json'), 'w', encoding='utf8') as f:
+                json.dump({'url': url, **meta}, f)
+
+    def clear(self):
+        for url in list(self._index):
+            self._remove(url)
+
+    def _parseHeaders(self, headers):
+        # 不能缓存的响应 返回 None
+        cacheControl = headers.get('cache-control', '').lower()
+        directives = [one.strip() for one in cacheControl.split(',')]
+
+        if 'no-store' in directives:
+            return None
+        
+        expires = None
+        for one in directives:
+            if one.startswith('max-age='):
+                try:
+                    expires = time.time() + int(one[8:])
+                except ValueError:
+                    pass
+
+        if expires is None and 'expires' in headers:
+            try:
+                expires = parsedate_to_datetime(headers['expires']).timestamp()
+            except (TypeError, ValueError):
+                expires = 0
+
+        etag = headers.get('etag')
+        lastModified = headers.get('last-modified')
+
+        # 既没有有效期，也没有校验信息，缓存也用不上
+        if expires is None and not etag and not lastModified:
+            return None
+        
+        return {
+            'etag'           : etag,
+            'lastModified'   : lastModified,
+            'expires'        : expires or 0,
+            'mustRevalidate' : 'no-cache' in directives,
+        }
+
+    def _path(self, url, ext):
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + ext)
+
+    def _readBody(self, url):
+        body = self._memory.get(url)
+        if body is not None:
+            self._memory.move_to_end(url)
+            return body
+        
+        if not self.directory:
+            return None
+        
+        try:
+            with open(self._path(url, '.body'), 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        
+        self._remember(url, body)
+        return body
+
+    def _remember(self, url, body):
+        if len(body) > self.maxMemoryBytes:
+            return
+        
+        old = self._memory.pop(url, None)
+        if old is not None:
+            self._memoryBytes -= len(old)
+
+        self._memory[url] = body
+        self._memoryBytes += len(body)
+
+        while self._memoryBytes > self.maxMemoryBytes:
+            _, one = self._memory.popitem(last=False)
+            self._memoryBytes -= len(one)
+
+    def _remove(self, url):
+        meta = self._index.pop(url, None)
+        if meta is None:
+            return
+        
+        self._indexBytes -= meta['size']
+        body = self._memory.pop(url, None)
+        if body is not None:
+            self._memoryBytes -= len(body)
+
+        if self.directory:
+            for ext in ('.body', '.json'):
+                try:
+                    os.remove(self._path(url, ext))
+                except OSError:
+                    pass
+
+    def _evict(self):
+        # 只有内存缓存时， 内存上限 就是总上限
+        maxBytes = self.maxBytes if self.directory else self.maxMemoryBytes
+        while self._indexBytes > maxBytes and self._index:
+            self._remove(next(iter(self._index)))
+
+    def _loadIndex(self):
+        # 从磁盘恢复索引， 按文件访问时间 作为 LRU 次序
+        metas = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding='utf8') as f:
+                    meta = json.load(f)
+                metas.append((os.path.getatime(path), meta))
+            except (OSError, ValueError):
+                continue
+
+        for _, meta in sorted(metas, key=lambda one: one[0]):
+            url = meta.pop('url')
+            self._index[url] = meta
+            self._indexBytes += meta['size']
+
+        self._evict()
+
+
+_wsRe = re.compile(r'[ \t\n\r]*')
+
+def decodeJsonStreaming(text, decoder=json.JSONDecoder(), collectEvery=0):
+    """
+    解析 JSON 字符串，结果和 json.loads 相同
+
+    顶层的数组， 以及 顶层对象里 值为数组的， 逐个元素解析，
+    这样 在工作线程中解析 很大的数组时， 每个元素之间 都可以让出 GIL，
+    界面线程 不会因为等待 GIL 而卡住。
+    json.loads 一次解析整个字符串， 期间一直持有 GIL
+
+    :param collectEvery: 大于 0 时， 每解析这么多个数组元素， 执行一次 gc.collect(1)，
+        配合暂停自动垃圾回收 使用， 把新对象的回收 分成小段
+    """
+    pos = _wsRe.match(text, 0).end()
+    if text.startswith('[', pos):
+        value, pos = _decodeArray(text, pos, decoder, collectEvery)
+
+    elif text.startswith('{', pos):
+        value = {}
+        pos = _wsRe.match(text, pos + 1).end()
+        if text.startswith('}', pos):
+            pos += 1
+        else:
+            while True:
+                key, pos = decoder.raw_decode(text, pos)
+                pos = _wsRe.match(text, pos).end()
+                if not text.startswith(':', pos):
+                    raise json.JSONDecodeError("Expecting ':' delimiter", text, pos)
+                pos = _wsRe.match(text, pos + 1).end()
+
+                if text.startswith('[', pos):
+                    value[key], pos = _decodeArray(text, pos, decoder, collectEvery)
+                else:
+                    value[key], pos = decoder.raw_decode(text, pos)
+
+                pos = _wsRe.match(text, pos).end()
+                if text.startswith('}', pos):
+                    pos += 1
+                    break
+                if not text.startswith(',', pos):
+                    raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+                pos = _wsRe.match(text, pos + 1).end()
+
+    else:
+        value, pos = decoder.raw_decode(text, pos)
+
+    pos = _wsRe.match(text, pos).end()
+    if pos != len(text):
+        raise json.JSONDecodeError('Extra data', text, pos)
+    return value
+
+def _decodeArray(text, pos, decoder, collectEvery):
+    # text[pos] 是 '['， 返回 (列表, 结束位置)
+    items = []
+    pos = _wsRe.match(text, pos + 1).end()
+    if text.startswith(']', pos):
+        return items, pos + 1
+    
+    while True:
+        item, pos = decoder.raw_decode(text, pos)
+        items.append(item)
+        if collectEvery and len(items) % collectEvery == 0:
+            gc.collect(1)
+        pos = _wsRe.match(text, pos).end()
+        if text.startswith(']', pos):
+            return items, pos + 1
+        if not text.startswith(',', pos):
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+        pos = _wsRe.match(text, pos + 1).end()
+
+
+_gcLock = threading.Lock()
+_gcPausers = 0
+_gcWasEnabled = False
+
+def _pauseGc():
+    # 解析 JSON 产生大量对象， 会多次触发 完整的垃圾回收，
+    # 回收期间持有 GIL， 界面线程 也会卡住。
+    # 暂停自动回收， 由 decodeJsonStreaming 分段回收新对象。
+    # 整个进程的自动回收 都会暂停， 多个解析同时进行时 计数， 最后一个结束时 恢复
+    global _gcPausers, _gcWasEnabled
+    with _gcLock:
+        if _gcPausers == 0:
+            _gcWasEnabled = gc.isenabled()
+            gc.disable()
+        _gcPausers += 1
+
+def _resumeGc():
+    global _gcPausers
+    with _gcLock:
+        _gcPausers -= 1
+        if _gcPausers == 0 and _gcWasEnabled:
+            gc.enable()
+
+
+class _DecodeBridge(QtCore.QObject):
+    # 工作线程 解析完成后， 通过信号 回到界面线程
+    decoded = QtCore.Signal(object)
+
+    def __init__(self):
+        super().__init__()
+        self.decoded.connect(self._onDecoded)
+
+    @QtCore.Slot(object)
+    def _onDecoded(self, callback):
+        callback()
+
+
+class RequestError(Exception):
+    """
+    NAM asyncio 接口的请求错误
+
+    网络错误时 retObj 为 None， 
+    服务端返回的 ret 不为 0 时， retObj 是返回的 JSON 对象， 错误信息为其中的 msg
+    """
+    def __init__(self, msg, retObj=None):
+        super().__init__(msg)
+        self.retObj = retObj
+
+
+class _Download:
+    """
+    NAM.download 的流式下载状态
+    """
+    def __init__(self, sink, offset, resume, maxBytes, onProgress):
+        self.sink = sink
+        self.resume = resume
+        self.file = None
+        if isinstance(sink, str):
+            # 文件路径， 由 NAM 在请求开始时 打开， 结束时关闭
+            self.write = None
+        elif hasattr(sink, 'write'):
+            self.write = sink.write
+            # 服务端不支持 Range 时， 可以从头重新写
+            if hasattr(sink, 'seek') and hasattr(sink, 'truncate'):
+                self.file = sink
+        else:
+            self.write = sink
+
+        self.ownFile = isinstance(sink, str)
+        self.offset = offset
+        self.maxBytes = maxBytes
+        self.onProgress = onProgress
+
+        self.received = offset   # 包括 offset 之前 已有的部分
+        self.total = -1          # 未知为 -1
+        self.started = False
+        self.discard = False     # 错误响应的内容 不写入 sink
+        self.error = None
+
+    def open(self):
+        # 请求开始前调用， 排队中 就取消的下载 不会创建或者清空文件
+        if not self.ownFile or self.file is not None:
+            return
+        
+        if self.resume and os.path.exists(self.sink):
+            self.offset = self.received = os.path.getsize(self.sink)
+            self.file = open(self.sink, 'ab')
+        else:
+            self.file = open(self.sink, 'wb')
+        self.write = self.file.write
+
+    def restart(self):
+        # 服务端忽略了 Range， 返回了完整内容
+        if self.file is None:
+            return False
+        
+        self.file.seek(0)
+        self.file.truncate()
+        self.offset = self.received = 0
+        return True
+
+    def close(self):
+        if self.ownFile and self.file is not None:
+            self.file.close()
+
+
+class _HostBreaker:
+    """
+    一个 host 的熔断器
+
+    连续失败 threshold 次后 打开， cooldown 秒内的请求 直接失败，
+    之后 每 cooldown 秒 放行一个试探请求， 成功则关闭
+    """
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.openUntil = 0
+
+    def allow(self):
+        if self.failures < self.threshold:
+            return True
+        
+        now = time.monotonic()
+        if now < self.openUntil:
+            return False
+        
+        # 放行这个试探请求， 在它结束之前 其它请求 仍然直接失败
+        self.openUntil = now + self.cooldown
+        return True
+
+    def record(self, ok):
+        if ok:
+            self.failures = 0
+            return
+        
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.openUntil = time.monotonic() + self.cooldown
+
+
+class JsonBatchCodec:
+    """
+    NAM 批量请求的 缺省格式
+
+    请求 ::
+
+        {"requests": [{"method": "GET", "path": "/api/x?id=1", "body": null}, ...]}
+
+    响应， 按请求的次序， 每一项是 该请求本来的返回 ::
+
+        {"ret": 0, "responses": [{"ret": 0, ...}, ...]}
+
+    其他格式， 实现同样的 contentType, encode, decode 即可
+    """
+    contentType = 'application/json'
+
+    def encode(self, requests:list) -> bytes:
+        """
+        :param requests: [{'method', 'path', 'body'}, ...]， body 是 bytes 或者 None
+        """
+        return json.dumps({'requests': [{
+            'method' : one['method'],
+            'path'   : one['path'],
+            'body'   : json.loads(one['body']) if one['body'] else None,
+        } for one in requests]}).encode()
+
+    def decode(self, data:bytes) -> list:
+        """
+        返回 和请求次序相同的 retObj 列表，
+        整个批量请求失败时 返回 retObj， 比如 {"ret": 1, "msg": "..."}
+        """
+        retObj = json.loads(data)
+        if retObj['ret'] != 0:
+            return retObj
+        return retObj['responses']
+
+
+class _Batcher:
+    """
+    收集 windowMs 毫秒内 同一 url 前缀的请求， 合并成一个请求 发给批量接口
+    """
+    def __init__(self, nam, prefix, endpoint, windowMs, maxBatch, methods, codec):
+        self.nam = nam
+        self.prefix = prefix
+        self.endpoint = endpoint
+        self.maxBatch = maxBatch
+        self.methods = methods
+        self.codec = codec
+
+        # [(method, url, data, okHandler, errHandler, priority, owner), ...]
+        self.pending = []
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(windowMs)
+        self.timer.timeout.connect(self.flush)
+
+    def accepts(self, method, url, contentType):
+        return method in self.methods and url.startswith(self.prefix) \
+            and (method == 'GET' or contentType == self.codec.contentType)
+
+    def add(self, *item):
+        self.pending.append(item)
+        if len(self.pending) >= self.maxBatch:
+            self.flush()
+        elif not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        self.timer.stop()
+        items = [one for one in self.pending if one[6] is None or shiboken6.isValid(one[6])]
+        self.pending = []
+        if not items:
+            return
+        
+        # 只有一个请求， 不需要合并
+        if len(items) == 1:
+            method, url, data, okHandler, errHandler, priority, owner = items[0]
+            self.nam._requestJson(method, url, data, 
+                                  None if method == 'GET' else self.codec.contentType,
+                                  okHandler, errHandler, priority, owner, batch=False)
+            return
+        
+        # 相同的 GET 只发送一次
+        groups = {}
+        for one in items:
+            key = (one[1],) if one[0] == 'GET' else (one[1], id(one))
+            groups.setdefault(key, []).append(one)
+        groups = list(groups.values())
+
+        body = self.codec.encode([{
+            'method' : group[0][0],
+            'path'   : group[0][1][len(self.prefix):],
+            'body'   : group[0][2],
+        } for group in groups])
+
+        self.nam.batches += 1
+        self.nam.batched += len(items)
+        self.nam._submit(_Job('POST', self.endpoint, body, self.codec.contentType,
+            handler=lambda data, error: self.onReply(groups, data, error),
+            priority=min(one[5] for one in items)))
+
+    def onReply(self, groups, data, error):
+        if error is not None:
+            # 网络错误 提示一次， 每个请求 都收到这个错误
+            self.nam._handleJson(None, error, None, None)
+            results = {'ret': 1, 'msg': error}
+        else:
+            try:
+                results = self.codec.decode(bytes(data))
+            except (ValueError, KeyError) as e:
+                results = {'ret': 1, 'msg': f'batch response decode error: {e}'}
+
+        if isinstance(results, list) and len(results) != len(groups):
+            results = {'ret': 1, 'msg': f'batch response has {len(results)} items, expected {len(groups)}'}
+
+        for i, group in enumerate(groups):
+            # 整个批量请求失败时， 每个请求 都收到这个错误
+            retObj = results if isinstance(results, dict) else results[i]
+            for method, url, data, okHandler, errHandler, priority, owner in group:
+                if owner is None or shiboken6.isValid(owner):
+                    self.nam._handleRet(retObj, okHandler, errHandler)
+
+
+class _NamSignals(QtCore.QObject):
+    # 请求最终失败 （重试之后）， 参数为 (url, 错误信息)
+    requestFailed = QtCore.Signal(str, str)
+    # 请求耗时 超过 NAM.slowThreshold， 参数为 该请求的记录， 参见 NAM.records
+    slowRequest = QtCore.Signal(dict)
+
+
+_idSegmentRe = re.compile(r'^(\d+|[0-9a-fA-F]{16,}|[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12})$')
+
+def urlTemplate(url):
+    """
+    把 url 归类为模板， 用于 按接口统计
+
+    路径中的 数字、长十六进制串、UUID 替换为 {id}， 去掉查询参数的值， 比如 ::
+
+        https://host/api/user/123?id=5&name=x  ->  host/api/user/{id}?id=&name=
+    """
+    qurl = QtCore.QUrl(url)
+    path = '/'.join('{id}' if _idSegmentRe.match(one) else one 
+                    for one in qurl.path().split('/'))
+    
+    template = qurl.host() + path
+    query = qurl.query()
+    if query:
+        template += '?' + '&'.join(sorted(one.split('=')[0] + '=' for one in query.split('&')))
+    return template
+
+
+def _percentile(values, p):
+    # values 已排序， 最近秩 百分位数
+    return values[max(0, int(len(values) * p / 100 + 0.5) - 1)]
+
+
+class _Job:
+    """
+    NAM 里的一个请求
+    """
+    def __init__(self, method, url, data=None, contentType=None, 
+                 handler=None, priority=1, owner=None, timeout=None):
+        self.method = method
+        self.url = url
+        self.data = data
+        self.contentType = contentType
+        # 回调列表 [[handler, owner], ...]， 相同的 GET 请求合并时 会有多个
+        # handler 参数为 (data, error)， data 是响应的 QByteArray， error 为 None 表示成功
+        self.handlers = [[handler, owner]]
+        self.priority = priority
+        qurl = QtCore.QUrl(url)
+        self.host = qurl.host()
+        # 熔断器 按 scheme://host:port 区分
+        self.origin = f'{qurl.scheme()}://{self.host}:{qurl.port()}'
+        self.reply = None
+        self.queued = False
+        self.cancelled = False
+        # 条件请求时， 缓存中的 (元信息, 内容)
+        self.cached = None
+        # 流式下载时， _Download 对象
+        self.stream = None
+        # 传输超时，单位秒， None 使用 NAM 的设置
+        self.timeout = timeout
+        # 已经重试的次数
+        self.attempt = 0
+        # 计时， time.perf_counter()
+        self.submitted = None   # 提交 或者 安排重试的时间
+        self.started = None     # 发出请求的时间
+        self.firstByte = None   # 收到响应头的时间
+        self.startedAt = None   # 发出请求的时间， time.time()
+
+
+class _JsonWaiter:
+    """
+    JSON 请求的回调， 相同的 GET 合并时， _dispatch 把响应 只解析一次， 交给所有的 _JsonWaiter
+    """
+    def __init__(self, nam, okHandler, errHandler, owner):
+        self.nam = nam
+        self.okHandler = okHandler
+        self.errHandler = errHandler
+        self.owner = owner
+
+    def __call__(self, data, error):
+        self.nam._handleJson(data, error, self.okHandler, self.errHandler, self.owner)
+
+
 class NAM:
 
+    # 请求的优先级， 数字越小越优先
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_NORMAL      = 1
+    PRIORITY_BACKGROUND  = 2   # 比如 图片下载
+
     single_instance = None
 
     @classmethod
@@ -45,64 +792,973 @@ class NAM:
             cls.single_instance = NAM()
         return cls.single_instance
 
-    def __init__(self, proxy=None):
+    # decodeInThread 模式下， 超过这个字节数的响应 使用 decodeJsonStreaming 解析
+    streamThreshold = 256*1024
+
+    # 可以重试的请求方法
+    IDEMPOTENT_METHODS = ('GET', 'PUT')
+
+    # 可以重试的 网络错误， 和 HTTP 状态码
+    TRANSIENT_ERRORS = (
+        QNetworkReply.ConnectionRefusedError,
+        QNetworkReply.RemoteHostClosedError,
+        QNetworkReply.TimeoutError,
+        QNetworkReply.OperationCanceledError,   # 传输超时
+        QNetworkReply.TemporaryNetworkFailureError,
+        QNetworkReply.NetworkSessionFailedError,
+        QNetworkReply.UnknownNetworkError,
+        QNetworkReply.ProxyConnectionRefusedError,
+        QNetworkReply.ProxyConnectionClosedError,
+        QNetworkReply.ProxyTimeoutError,
+    )
+    TRANSIENT_STATUS = (502, 503, 504)
+
+    def __init__(self, proxy=None, maxPerHost=6, cache:ResponseCache|None=None,
+                 decodeInThread=False, timeout=30, retries=2, retryDelay=0.5,
+                 breakerThreshold=5, breakerCooldown=30, pauseGcWhileDecoding=False):
         
-        self.nam  = QNetworkAccessManager(None)
+        # QNetworkAccessManager 由 C++ 持有， NAM 被回收时 用 deleteLater 删除，
+        # 最后一个 NAM 引用 可能在 reply 的回调或者析构中 释放，
+        # 这时 立即删除 reply 的上级 QNetworkAccessManager 会崩溃
+        self.nam  = QNetworkAccessManager(QtCore.QCoreApplication.instance())
         
         if proxy:
             proxy = QNetworkProxy(QNetworkProxy.HttpProxy, "127.0.0.1", 8888)
             self.nam.setProxy(proxy)
 
+        # 每个 host 同时进行的请求数 上限， 超过的 按优先级排队
+        self.maxPerHost = maxPerHost
+
+        # host -> 正在进行的请求数
+        self._active = {}
+        # host -> 排队的请求 堆 [(priority, seq, job), ...]
+        self._queues = {}
+        self._queued = 0
+        self._seq = 0
+
+        # id(owner) -> 该 owner 的 [(job, handler项), ...]
+        self._ownerJobs = {}
+
+        # url -> 排队中或进行中的 GET 请求， 相同的 GET 请求 合并为一个
+        self._gets = {}
+        # 被合并的请求数
+        self.coalesced = 0
+
+        # GET 响应缓存
+        self.cache = cache
+
+        # 为 True 时， get/post/put 的响应 在工作线程中解析 JSON，
+        # 然后在界面线程中 调用 okHandler/errHandler
+        self.decodeInThread = decodeInThread
+        # 为 True 时， decodeInThread 模式下 解析很大的响应期间， 暂停自动垃圾回收，
+        # 每解析 2000 个数组元素 回收一次新对象， 界面线程 卡顿更少。
+        # 注意 这会影响整个进程： 解析期间 所有线程 都没有自动垃圾回收，
+        # 期间 其他代码 调用 gc.enable/gc.disable 的效果， 解析结束时 可能被覆盖
+        self.pauseGcWhileDecoding = pauseGcWhileDecoding
+        self._decodePool = None
+        self._decodeBridge = None
+
+        # 缺省的传输超时， 单位秒， 这么长时间 没有收发数据 就中止请求， 0 表示不限制
+        self.timeout = timeout
+
+        # GET/PUT 请求 遇到网络错误 或者 502/503/504， 最多重试的次数，
+        # 第 n 次重试前 等待 retryDelay * 2**(n-1) 秒， 再随机乘以 0.5 ~ 1.5
+        self.retries = retries
+        self.retryDelay = retryDelay
+        self.maxRetryDelay = 10
+        
+        # scheme://host:port -> _HostBreaker， 连续失败 breakerThreshold 次后，
+        # breakerCooldown 秒内 该 host 的请求 直接失败
+        self._breakers = {}
+        self.breakerThreshold = breakerThreshold
+        self.breakerCooldown = breakerCooldown
+        self.retried = 0
+        self.rejected = 0
+
+        # 请求失败的通知， 界面可以连接 signals.requestFailed 自行提示
+        self.signals = _NamSignals()
+        # 为 True 时， get/post/put 的网络错误 用一个 非模态的消息框 提示， 
+        # 多个错误 共用这个消息框
+        self.showErrorBox = True
+        self._errorBox = None
+        self._errorCount = 0
+
+        # 最近的请求记录， 每一项是 dict， 参见 _record
+        self.records = deque(maxlen=1000)
+        # 耗时超过这个秒数的请求， 发出 signals.slowRequest 信号
+        self.slowThreshold = 2
+
+        # 批量请求， 参见 enableBatching
+        self._batchers = []
+        self.batches = 0
+        self.batched = 0
+
+    def __del__(self):
+        if shiboken6.isValid(self.nam):
+            self.nam.deleteLater()
+
     def post(self, url, data, contentType='application/json', 
-             okHandler=None, errHandler=None):
-        self.postOrPut(url, data, contentType, okHandler, errHandler, self.nam.post)
+             okHandler=None, errHandler=None, 
+             priority=PRIORITY_INTERACTIVE, owner=None, timeout=None):
+        self.postOrPut(url, data, contentType, okHandler, errHandler, 'POST',
+                       priority, owner, timeout)
 
     def put(self, url, data, contentType='application/json', 
-             okHandler=None, errHandler=None):
-        self.postOrPut(url, data, contentType, okHandler, errHandler, self.nam.put)
+             okHandler=None, errHandler=None, 
+             priority=PRIORITY_INTERACTIVE, owner=None, timeout=None):
+        self.postOrPut(url, data, contentType, okHandler, errHandler, 'PUT',
+                       priority, owner, timeout)
 
 
     def postOrPut(self, url, data, contentType='application/json', 
-             okHandler=None, errHandler=None, method=None):
-        request = QNetworkRequest(QtCore.QUrl(url))
-
-        request.setHeader(QNetworkRequest.ContentTypeHeader, contentType)
-      
+             okHandler=None, errHandler=None, method='POST',
+             priority=PRIORITY_INTERACTIVE, owner=None, timeout=None):
       
         # if body is str, convert it to bytes
         if isinstance(data, str):
             data = data.encode()
     
-        # send request
-        reply = method(request, data)
+        self._requestJson(method, url, data, contentType, okHandler, errHandler, 
+                          priority, owner, timeout)
 
-    
-        # set response callback
-        reply.finished.connect(lambda: self.replyFinished(reply, okHandler, errHandler) )
+    def get(self, url, okHandler=None, errHandler=None, 
+            priority=PRIORITY_INTERACTIVE, owner=None, timeout=None):
+        
+        self._requestJson('GET', url, None, None, okHandler, errHandler, 
+                          priority, owner, timeout)
+
+    def enableBatching(self, prefix, endpoint, windowMs=10, maxBatch=50, 
+                       methods=('GET',), codec=None):
+        """
+        合并 短时间内 同一 url 前缀的 get/post/put 请求， 作为一个请求 发给批量接口，
+        再把结果 分发给 各自的 okHandler/errHandler
+
+        :param prefix: url 前缀， 比如 'https://host/api'， 以它开头的请求 才会合并，
+            发给批量接口的 path 是 url 去掉这个前缀的部分
+        :param endpoint: 批量接口的 url
+        :param windowMs: 收集请求的时间窗口，单位毫秒
+        :param maxBatch: 一次合并的请求数 上限， 达到时 立即发送
+        :param methods: 合并哪些方法的请求， POST/PUT 请求 的 contentType 要和 codec 的相同，
+            指定了 timeout 的请求 不合并
+        :param codec: 批量请求的格式， 缺省为 JsonBatchCodec
+
+        有缓存的 GET， 以及 相同 GET 正在进行的， 不合并， 仍然使用缓存 和 合并到进行中的请求，
+        合并发送的 GET 响应 不写入缓存。
+        批量请求 网络错误时， 每个请求的 errHandler 都收到 {'ret': 1, 'msg': 错误信息}
+        """
+        self._batchers.append(_Batcher(self, prefix, endpoint, windowMs, maxBatch, 
+                                       methods, codec or JsonBatchCodec()))
+
+    def _requestJson(self, method, url, data, contentType, okHandler, errHandler,
+                     priority=PRIORITY_INTERACTIVE, owner=None, timeout=None, batch=True):
+        if batch and timeout is None and not self._bypassesBatch(method, url):
+            for batcher in self._batchers:
+                if batcher.accepts(method, url, contentType):
+                    batcher.add(method, url, data, okHandler, errHandler, priority, owner)
+                    return
+                
+        self._submit(_Job(method, url, data, contentType,
+            _JsonWaiter(self, okHandler, errHandler, owner), priority, owner, timeout))
+
+    def _bypassesBatch(self, method, url):
+        # 有缓存的 GET 要使用缓存 或者 发送条件请求， 相同的 GET 正在进行的 要合并到它，
+        # 批量接口 都做不到， 按普通请求处理
+        return method == 'GET' and (url in self._gets or 
+                                    (self.cache is not None and self.cache.has(url)))
+
+    def fetch(self, url, handler, priority=PRIORITY_BACKGROUND, owner=None, timeout=None):
+        """
+        GET 请求， 不解析响应内容， 比如下载图片
+
+        :param url: 请求的url
+        :param handler: 回调函数， 参数为 (data, error)，
+            data 是响应的 QByteArray， error 为 None 表示成功，否则是错误信息
+        :param priority: 优先级
+        :param owner: 请求所属的 QObject， 被删除时，取消它还在排队的请求，并且不再回调
+        :param timeout: 传输超时，单位秒， None 使用 NAM 的 timeout
+        """
+        self._submit(_Job('GET', url, handler=handler, priority=priority, owner=owner,
+                          timeout=timeout))
+
+    def send(self, method, url, data, contentType, handler,
+             priority=PRIORITY_INTERACTIVE, owner=None, timeout=None):
+        """
+        带请求体的请求， 不解析响应内容， 参见 fetch
+
+        和 post/put 不同， 网络错误 也会回调 handler， 不弹出错误框，
+        适合 调用者 需要自己处理失败的场合， 比如上传图片
+
+        :param method: 'POST' 或者 'PUT'
+        :param handler: 回调函数， 参数为 (data, error)
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        self._submit(_Job(method, url, data, contentType, handler, priority, owner, timeout))
+
+    # 流式下载时， 响应的读缓冲区大小， sink 处理不过来时 暂停接收
+    downloadBufferSize = 1024*1024
+
+    def download(self, url, sink, onFinished=None, onProgress=None, maxBytes=None, 
+                 offset=0, resume=False, priority=PRIORITY_BACKGROUND, owner=None):
+        """
+        流式下载， 收到的数据 分块交给 sink 处理， 不会把整个内容 放在内存里
+
+        :param url: 请求的url
+        :param sink: 接收数据的对象， 可以是
+
+            - 文件路径， NAM 负责打开和关闭文件， 请求开始时 才打开
+            - 有 write 方法的对象， 比如打开的文件
+            - 函数， 参数为 bytes， 比如增量解析器
+
+        :param onFinished: 下载结束时调用， 参数为 error， 为 None 表示成功
+        :param onProgress: 收到数据时调用， 参数为 (received, total)，
+            包括 offset 之前的部分， total 未知时为 -1
+        :param maxBytes: 内容总大小的上限， 超过时中止下载， 以错误结束
+        :param offset: 从这个位置开始下载， 使用 Range 请求头 续传
+        :param resume: sink 为文件路径 并且文件已经存在时， 从文件末尾续传
+        :param priority: 优先级
+        :param owner: 请求所属的 QObject， 被删除时，取消下载，并且不再回调
+        """
+        job = _Job('GET', url, 
+            handler=lambda data, error: onFinished and onFinished(error),
+            priority=priority, owner=owner)
+        job.stream = _Download(sink, offset, resume, maxBytes, onProgress)
+        self._submit(job)
+
+    # asyncio 接口， 需要 asyncio 事件循环 运行在 Qt 事件循环之上， 比如 
+    #   from PySide6 import QtAsyncio
+    #   QtAsyncio.run(main())
+
+    async def aget(self, url, priority=PRIORITY_INTERACTIVE, owner=None, timeout=None):
+        """
+        GET 请求， 返回解析后的 JSON 对象
+
+        网络错误， 或者返回的 ret 不为 0， 抛出 RequestError。
+        超时抛出 asyncio.TimeoutError，
+        超时或者 await 的任务被取消， 请求也会取消
+
+        :param timeout: 超时时间，单位秒， None 表示不限制
+        """
+        return await self._arequest(_Job('GET', url, priority=priority, owner=owner), 
+                                    timeout, True)
+
+    async def apost(self, url, data, contentType='application/json', 
+                    priority=PRIORITY_INTERACTIVE, owner=None, timeout=None):
+        """
+        POST 请求， 返回解析后的 JSON 对象， 参见 aget
+        """
+        return await self._arequest(self._bodyJob('POST', url, data, contentType, priority, owner), 
+                                    timeout, True)
+
+    async def aput(self, url, data, contentType='application/json', 
+                   priority=PRIORITY_INTERACTIVE, owner=None, timeout=None):
+        """
+        PUT 请求， 返回解析后的 JSON 对象， 参见 aget
+        """
+        return await self._arequest(self._bodyJob('PUT', url, data, contentType, priority, owner), 
+                                    timeout, True)
+
+    async def afetch(self, url, priority=PRIORITY_BACKGROUND, owner=None, timeout=None):
+        """
+        GET 请求， 不解析响应内容， 返回 QByteArray， 参见 aget
+        """
+        return await self._arequest(_Job('GET', url, priority=priority, owner=owner), 
+                                    timeout, False)
+
+    @staticmethod
+    async def gather(*aws, limit=None, return_exceptions=False):
+        """
+        并发执行多个 awaitable， 按参数次序返回结果列表， 同 asyncio.gather
+
+        :param limit: 同时进行的数量上限， None 表示不限制
+        :param return_exceptions: 为 True 时， 异常作为结果返回，
+            否则第一个异常 会抛出， 并取消其余的
+        """
+        if limit is not None:
+            semaphore = asyncio.Semaphore(limit)
+            async def limited(aw):
+                async with semaphore:
+                    return await aw
+            aws = [limited(aw) for aw in aws]
+
+        tasks = [asyncio.ensure_future(aw) for aw in aws]
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    def _bodyJob(self, method, url, data, contentType, priority, owner):
+        if isinstance(data, str):
+            data = data.encode()
+        return _Job(method, url, data, contentType, priority=priority, owner=owner)
+
+    async def _arequest(self, job, timeout, parseJson):
+        future = asyncio.get_running_loop().create_future()
+
+        def decoded(retObj, error):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(RequestError(f'json decode error: {error}'))
+            elif retObj['ret'] != 0:
+                future.set_exception(RequestError(retObj.get('msg'), retObj))
+            else:
+                future.set_result(retObj)
+
+        def handler(data, error):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(RequestError(error))
+            elif not parseJson:
+                future.set_result(data)
+            elif self.decodeInThread:
+                self._decodeInThread(bytes(data), decoded, entry[1])
+            else:
+                try:
+                    retObj = json.loads(str(data, 'utf-8'))
+                except ValueError as e:
+                    decoded(None, e)
+                else:
+                    decoded(retObj, None)
+
+        job.handlers[0][0] = handler
+        entry = job.handlers[0]
+        activeJob = self._submit(job)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except BaseException:
+            # 超时 或者 被取消
+            if activeJob is not None:
+                self._dropHandler(activeJob, entry)
+            raise
+
+    def queueDepth(self, host=None):
+        """
+        返回排队中（还没有发出）的请求数
+
+        :param host: 指定 host， 为 None 时返回所有 host 的
+        """
+        if host is None:
+            return self._queued
+        return len({job for _, _, job in self._queues.get(host, []) if job.queued})
+
+    def activeCount(self, host=None):
+        """
+        返回正在进行的请求数
+        """
+        if host is None:
+            return sum(self._active.values())
+        return self._active.get(host, 0)
+
+    def stats(self):
+        """
+        返回统计信息
+        """
+        return {
+            'queued'    : self._queued,
+            'active'    : self.activeCount(),
+            'coalesced' : self.coalesced,
+            'retried'   : self.retried,
+            'rejected'  : self.rejected,
+            'batches'   : self.batches,
+            'batched'   : self.batched,
+            'openHosts' : [origin for origin, breaker in self._breakers.items() 
+                           if breaker.failures >= breaker.threshold],
+            'cache'     : self.cache.stats() if self.cache else None,
+        }
+
+    def _submit(self, job):
+        handler, owner = entry = job.handlers[0]
+        job.submitted = time.perf_counter()
+
+        # host 的熔断器打开了， 直接失败
+        if not self._hostAllows(job.origin):
+            self._rejectLater(job)
+            return None
+
+        if job.method == 'GET' and job.stream is None and self.cache is not None:
+            meta, body = self.cache.lookup(job.url)
+            if meta is not None and self.cache.isFresh(meta):
+                self.cache.hits += 1
+                self.cache.bytesSaved += len(body)
+                # 保持和网络请求一样的 异步回调， owner 已经删除的 不再回调
+                def deliver():
+                    if owner is None or shiboken6.isValid(owner):
+                        handler(QtCore.QByteArray(body), None)
+                QtCore.QTimer.singleShot(0, deliver)
+                return None
+            
+            job.cached = (meta, body) if meta is not None else None
+
+        # 已经有相同的 GET 请求在排队或者进行中，只需要登记回调
+        if job.method == 'GET' and job.stream is None:
+            sameJob = self._gets.get(job.url)
+            if sameJob is not None:
+                self.coalesced += 1
+                sameJob.handlers.append(entry)
+                if owner is not None:
+                    self._trackOwner(sameJob, entry)
+
+                # 新请求的优先级更高， 提前排队位置
+                if sameJob.queued and job.priority < sameJob.priority:
+                    sameJob.priority = job.priority
+                    self._enqueue(sameJob)
+                return sameJob
+            
+            self._gets[job.url] = job
+
+        if owner is not None:
+            self._trackOwner(job, entry)
+
+        self._startOrQueue(job)
+        return job
+
+    def _startOrQueue(self, job):
+        if self._active.get(job.host, 0) < self.maxPerHost:
+            self._start(job)
+            return
+        
+        self._queued += 1
+        job.queued = True
+        self._enqueue(job)
+
+    def _enqueue(self, job):
+        # 同一个 job 提高优先级后 会再次入堆， 旧的项目 出堆时被忽略
+        self._seq += 1
+        heapq.heappush(self._queues.setdefault(job.host, []), 
+                       (job.priority, self._seq, job))
+
+    def _start(self, job):
+        if job.stream is not None:
+            try:
+                job.stream.open()
+            except OSError as e:
+                self._failBeforeStart(job, f'cannot open {job.stream.sink}: {e}')
+                return
+
+        request = QNetworkRequest(QtCore.QUrl(job.url))
+
+        if job.contentType is not None:
+            request.setHeader(QNetworkRequest.ContentTypeHeader, job.contentType)
+
+        # 缓存过期， 发送条件请求
+        if job.cached is not None:
+            meta = job.cached[0]
+            if meta['etag']:
+                request.setRawHeader(b'If-None-Match', meta['etag'].encode())
+            if meta['lastModified']:
+                request.setRawHeader(b'If-Modified-Since', meta['lastModified'].encode())
+
+        if job.stream is not None and job.stream.offset:
+            request.setRawHeader(b'Range', f'bytes={job.stream.offset}-'.encode())
+
+        timeout = self.timeout if job.timeout is None else job.timeout
+        if timeout:
+            request.setTransferTimeout(int(timeout * 1000))
 
-    def get(self, url, okHandler=None, errHandler=None):
-        request = QNetworkRequest(QtCore.QUrl(url))
-      
         # send request
-        reply = self.nam.get(request)
+        if job.method == 'GET':
+            reply = self.nam.get(request)
+        elif job.method == 'POST':
+            reply = self.nam.post(request, job.data)
+        else:
+            reply = self.nam.put(request, job.data)
+
+        job.reply = reply
+        self._active[job.host] = self._active.get(job.host, 0) + 1
+
+        job.started = time.perf_counter()
+        job.startedAt = time.time()
+        job.firstByte = None
+        def headersReceived():
+            if job.firstByte is None:
+                job.firstByte = time.perf_counter()
+        reply.metaDataChanged.connect(headersReceived)
+
+        if job.stream is not None:
+            reply.setReadBufferSize(self.downloadBufferSize)
+            reply.readyRead.connect(lambda: self._readChunk(job, reply))
 
         # set response callback
-        reply.finished.connect(lambda: self.replyFinished(reply, okHandler, errHandler) )
+        reply.finished.connect(lambda: self._onFinished(job))
+
+    def _onFinished(self, job):
+        reply = job.reply
+        job.reply = None
+
+        self._active[job.host] -= 1
+
+        if not job.cancelled:
+            self._record(job, reply)
+
+        if not job.cancelled and self._retryIfTransient(job, reply):
+            reply.deleteLater()
+            self._startNext(job.host)
+            return
+
+        self._startNext(job.host)
+
+        self._finishJob(job)
+
+        if job.stream is not None:
+            self._finishDownload(job, reply)
+            return
+
+        if job.cancelled:
+            reply.deleteLater()
+            return
+
+        if reply.error() != QNetworkReply.NoError:
+            data, error = None, self._errorString(job, reply)
+            self.signals.requestFailed.emit(job.url, error)
+        else:
+            data, error = reply.readAll(), None # return object type is QByteArray
+
+            if job.method == 'GET' and self.cache is not None:
+                data = self._updateCache(job, reply, data)
+
+        reply.deleteLater()
+
+        self._dispatch(job, data, error)
+
+    def _failBeforeStart(self, job, error):
+        # 请求没有发出就失败了， 和网络请求一样 异步回调
+        self._finishJob(job)
+        self.signals.requestFailed.emit(job.url, error)
+
+        def fail():
+            for handler, owner in job.handlers:
+                if handler and (owner is None or shiboken6.isValid(owner)):
+                    handler(None, error)
+        QtCore.QTimer.singleShot(0, fail)
+
+    def _hostAllows(self, origin):
+        breaker = self._breakers.get(origin)
+        return breaker is None or breaker.allow()
+
+    def _rejectLater(self, job):
+        # 和网络请求一样 异步回调
+        self.rejected += 1
+        error = f'{job.origin} is unavailable, request rejected'
+        self.signals.requestFailed.emit(job.url, error)
+
+        def reject():
+            if job.stream is not None:
+                job.stream.close()
+            for handler, owner in job.handlers:
+                if handler and (owner is None or shiboken6.isValid(owner)):
+                    handler(None, error)
+        QtCore.QTimer.singleShot(0, reject)
+
+    def _isTransient(self, job, reply):
+        if job.stream is not None and job.stream.error is not None:
+            return False    # 下载 自己中止的， 比如超过大小上限
+        
+        status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        if status is not None:
+            return status in self.TRANSIENT_STATUS
+        return reply.error() in self.TRANSIENT_ERRORS
+
+    def _retryIfTransient(self, job, reply):
+        # 更新 host 熔断器， 需要重试时 安排重试 并返回 True
+        transient = reply.error() != QNetworkReply.NoError and self._isTransient(job, reply)
+
+        breaker = self._breakers.get(job.origin)
+        if breaker is None:
+            breaker = self._breakers[job.origin] = _HostBreaker(self.breakerThreshold, self.breakerCooldown)
+        breaker.record(not transient)
+
+        if not transient or job.method not in self.IDEMPOTENT_METHODS \
+                or job.attempt >= self.retries:
+            return False
+        
+        # 下载 从已经收到的位置 继续
+        if job.stream is not None:
+            if job.stream.discard:
+                return False
+            job.stream.offset = job.stream.received
+            job.stream.started = False
+
+        delay = min(self.retryDelay * 2 ** job.attempt, self.maxRetryDelay)
+        delay *= random.uniform(0.5, 1.5)
+        job.attempt += 1
+        self.retried += 1
+        QtCore.QTimer.singleShot(int(delay * 1000), lambda: self._retry(job))
+        return True
+
+    def _retry(self, job):
+        if job.cancelled:
+            if job.stream is not None:
+                job.stream.close()
+            return
+        
+        if not self._hostAllows(job.origin):
+            self._finishJob(job)
+            self._rejectLater(job)
+            return
+        
+        job.submitted = time.perf_counter()
+        self._startOrQueue(job)
+
+    def _record(self, job, reply):
+        # 记录 一次请求的 耗时和大小， Qt 没有提供 DNS 和连接 的耗时
+        now = time.perf_counter()
+        error = None
+        if reply.error() != QNetworkReply.NoError:
+            error = self._errorString(job, reply)
+
+        responseBytes = reply.bytesAvailable()
+        if job.stream is not None:
+            responseBytes += job.stream.received - job.stream.offset
+
+        record = {
+            'url'           : job.url,
+            'template'      : urlTemplate(job.url),
+            'method'        : job.method,
+            'status'        : reply.attribute(QNetworkRequest.HttpStatusCodeAttribute),
+            'error'         : error,
+            'attempt'       : job.attempt,
+            'startedAt'     : job.startedAt,
+            'queued'        : job.started - job.submitted,
+            'ttfb'          : None if job.firstByte is None else job.firstByte - job.started,
+            'total'         : now - job.started,
+            'requestBytes'  : len(job.data) if job.data is not None else 0,
+            'responseBytes' : responseBytes,
+        }
+        self.records.append(record)
+
+        if record['queued'] + record['total'] > self.slowThreshold:
+            self.signals.slowRequest.emit(record)
+
+    def endpointStats(self):
+        """
+        按接口 （方法 + url 模板， 参见 urlTemplate） 统计 records 里的请求
+
+        :return: {'GET host/api/x/{id}': {'count', 'errors', 'p50', 'p90', 'p99', 'max',
+            'responseBytes'}, ...}， 时间单位为秒， 是 发出请求 到 请求结束 的时间
+        """
+        groups = {}
+        for record in self.records:
+            groups.setdefault(f"{record['method']} {record['template']}", []).append(record)
+
+        stats = {}
+        for endpoint, records in groups.items():
+            totals = sorted(one['total'] for one in records)
+            stats[endpoint] = {
+                'count'         : len(records),
+                'errors'        : sum(1 for one in records if one['error'] is not None),
+                'p50'           : _percentile(totals, 50),
+                'p90'           : _percentile(totals, 90),
+                'p99'           : _percentile(totals, 99),
+                'max'           : totals[-1],
+                'responseBytes' : sum(one['responseBytes'] for one in records),
+            }
+        return stats
+
+    def dumpHar(self, path):
+        """
+        把 records 里的请求 保存为 HAR 格式的 JSON 文件， 可以用浏览器开发工具 等查看
+        """
+        entries = []
+        for record in self.records:
+            ttfb = record['ttfb'] if record['ttfb'] is not None else record['total']
+            entries.append({
+                'startedDateTime' : datetime.fromtimestamp(record['startedAt']).astimezone().isoformat(),
+                'time'     : (record['queued'] + record['total']) * 1000,
+                'request'  : {
+                    'method'      : record['method'],
+                    'url'         : record['url'],
+                    'httpVersion' : 'HTTP/1.1',
+                    'headers'     : [],
+                    'queryString' : [],
+                    'cookies'     : [],
+                    'headersSize' : -1,
+                    'bodySize'    : record['requestBytes'],
+                },
+                'response' : {
+                    'status'      : record['status'] or 0,
+                    'statusText'  : record['error'] or '',
+                    'httpVersion' : 'HTTP/1.1',
+                    'headers'     : [],
+                    'cookies'     : [],
+                    'content'     : {'size': record['responseBytes'], 'mimeType': ''},
+                    'redirectURL' : '',
+                    'headersSize' : -1,
+                    'bodySize'    : record['responseBytes'],
+                },
+                'cache'    : {},
+                'timings'  : {
+                    'blocked' : record['queued'] * 1000,
+                    'send'    : 0,
+                    'wait'    : ttfb * 1000,
+                    'receive' : (record['total'] - ttfb) * 1000,
+                },
+            })
+
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump({'log': {
+                'version' : '1.2',
+                'creator' : {'name': 'hyqt', 'version': ''},
+                'entries' : entries,
+            }}, f, ensure_ascii=False, indent=1)
+
+    def _errorString(self, job, reply):
+        if reply.error() == QNetworkReply.OperationCanceledError:
+            return 'request timed out'
+        return reply.errorString()
+
+    def _readChunk(self, job, reply):
+        dl = job.stream
+        if job.cancelled or dl.error is not None:
+            return
+        
+        if not dl.started:
+            dl.started = True
+            status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+
+            if status is not None and status >= 400:
+                dl.discard = True
+
+            elif dl.offset and status == 200 and not dl.restart():
+                self._failDownload(job, reply, 'server does not support Range requests')
+                return
+
+            length = reply.header(QNetworkRequest.ContentLengthHeader)
+            if length is not None and not dl.discard:
+                dl.total = dl.offset + int(length)
+                if dl.maxBytes is not None and dl.total > dl.maxBytes:
+                    self._failDownload(job, reply, f'response size {dl.total} exceeds {dl.maxBytes}')
+                    return
+
+        data = reply.readAll()
+        if dl.discard:
+            return
+        
+        dl.received += len(data)
+        if dl.maxBytes is not None and dl.received > dl.maxBytes:
+            self._failDownload(job, reply, f'response size exceeds {dl.maxBytes}')
+            return
+        
+        dl.write(bytes(data))
+        if dl.onProgress:
+            dl.onProgress(dl.received, dl.total)
+
+    def _failDownload(self, job, reply, error):
+        job.stream.error = error
+        reply.abort()
+
+    def _finishDownload(self, job, reply):
+        dl = job.stream
+        # 读取 缓冲区里 剩下的数据
+        if reply.error() == QNetworkReply.NoError:
+            self._readChunk(job, reply)
+        
+        status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        error = dl.error
+        if error is None and reply.error() != QNetworkReply.NoError:
+            # 续传时 文件已经是完整的
+            if not (status == 416 and dl.offset):
+                error = self._errorString(job, reply)
+        
+        if error is not None and not job.cancelled:
+            self.signals.requestFailed.emit(job.url, error)
+
+        dl.close()
+        reply.deleteLater()
+
+        if not job.cancelled:
+            self._dispatch(job, None, error)
+
+    def _updateCache(self, job, reply, data):
+        status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        headers = {bytes(k).decode('latin-1').lower(): bytes(v).decode('latin-1') 
+                   for k, v in reply.rawHeaderPairs()}
+
+        # 服务端内容没有变化， 使用缓存的内容
+        if status == 304 and job.cached is not None:
+            body = job.cached[1]
+            self.cache.revalidated += 1
+            self.cache.bytesSaved += len(body)
+            self.cache.refresh(job.url, headers)
+            return QtCore.QByteArray(body)
+        
+        self.cache.misses += 1
+        if status == 200:
+            self.cache.store(job.url, bytes(data), headers)
+        return data
+
+    def _dispatch(self, job, data, error):
+        # 合并的请求， 结果分发给每个回调， 多个 JSON 回调的 响应只解析一次
+        waiters = [handler for handler, owner in job.handlers if isinstance(handler, _JsonWaiter)]
+        if len(waiters) > 1:
+            self._handleJsonAll(data, error, 
+                [(one.okHandler, one.errHandler, one.owner) for one in waiters])
+
+        for handler, owner in job.handlers:
+            if handler and not (len(waiters) > 1 and isinstance(handler, _JsonWaiter)):
+                handler(data, error)
+
+    def _startNext(self, host):
+        queue = self._queues.get(host)
+        while queue and self._active.get(host, 0) < self.maxPerHost:
+            _, _, job = heapq.heappop(queue)
+            if not job.queued:
+                continue
+            job.queued = False
+            self._queued -= 1
+            self._start(job)
+
+        if not queue:
+            self._queues.pop(host, None)
+
+    def _finishJob(self, job):
+        # 请求结束， 不再接受合并， 不再跟踪 owner
+        if self._gets.get(job.url) is job:
+            del self._gets[job.url]
+
+        for entry in job.handlers:
+            owner = entry[1]
+            if owner is None:
+                continue
+            jobs = self._ownerJobs.get(id(owner))
+            if jobs:
+                jobs[:] = [one for one in jobs if one[0] is not job]
+
+    def _trackOwner(self, job, entry):
+        owner = entry[1]
+        key = id(owner)
+        jobs = self._ownerJobs.get(key)
+        if jobs is None:
+            jobs = self._ownerJobs[key] = []
+            owner.destroyed.connect(lambda *args, key=key: self._cancelOwner(key))
+        jobs.append((job, entry))
+
+    def _cancelOwner(self, key):
+        # owner 被删除， 去掉它的回调， 
+        # 请求的回调都没有了，取消排队的请求， 中止进行中的请求
+        for job, entry in self._ownerJobs.pop(key, []):
+            self._dropHandler(job, entry)
+
+    def _dropHandler(self, job, entry):
+        # 去掉请求的一个回调， 回调都没有了，取消排队的请求， 中止进行中的请求
+        if entry in job.handlers:
+            job.handlers.remove(entry)
+
+        if job.handlers or job.cancelled:
+            return
+        
+        job.cancelled = True
+        if self._gets.get(job.url) is job:
+            del self._gets[job.url]
+
+        if job.reply is not None:
+            job.reply.abort()
+        elif job.queued:
+            job.queued = False
+            self._queued -= 1
 
 
     # define response callback
     def replyFinished(self, reply, okHandler, errHandler):
         if reply.error() != QNetworkReply.NoError:
-            print(reply.errorString())
-            QMessageBox.warning(None, 'error', reply.errorString())
+            self._handleJson(None, reply.errorString(), okHandler, errHandler)
+        else:
+            self._handleJson(reply.readAll(), None, okHandler, errHandler)
+
+    def _handleJson(self, dataBytes, error, okHandler, errHandler, owner=None):
+        self._handleJsonAll(dataBytes, error, [(okHandler, errHandler, owner)])
+
+    def _handleJsonAll(self, dataBytes, error, waiters):
+        # waiters 为 [(okHandler, errHandler, owner), ...]， 
+        # 响应只解析一次， 所有的回调 收到的是 同一个解析结果对象， 回调里 不要修改它
+        if error is not None:
+            print(error)
+            if self.showErrorBox:
+                self._showError(error)
+            return
+
+        def deliver(retObj):
+            for okHandler, errHandler, owner in waiters:
+                if owner is None or shiboken6.isValid(owner):
+                    self._handleRet(retObj, okHandler, errHandler)
+
+        if self.decodeInThread:
+            def decoded(retObj, error):
+                if error is not None:
+                    print('json decode error', error)
+                    return
+                deliver(retObj)
+
+            # 只有一个回调时， 它的 owner 被删除 就不用解析了
+            owner = waiters[0][2] if len(waiters) == 1 else None
+            self._decodeInThread(bytes(dataBytes), decoded, owner)
             return
 
-        dataBytes = reply.readAll() # return object type is QByteArray
         data = str(dataBytes, 'utf-8')  # convert QByteArray to str   
         # print('--------------') 
         # print(data)
 
         retObj = json.loads(data)
+        deliver(retObj)
+
+    def _showError(self, error):
+        # 多个错误 共用一个非模态消息框， 不会堆叠很多对话框
+        if self._errorBox is None:
+            self._errorBox = QMessageBox(QMessageBox.Warning, 'error', '')
+            self._errorBox.setWindowModality(QtCore.Qt.NonModal)
+            self._errorBox.finished.connect(self._resetErrorCount)
+
+        self._errorCount += 1
+        if self._errorCount == 1:
+            self._errorBox.setText(error)
+        else:
+            self._errorBox.setText(f'{error}\n\n(共 {self._errorCount} 个网络错误)')
+        self._errorBox.show()
+        
+    def _resetErrorCount(self, *args):
+        self._errorCount = 0
+
+    def _decodeInThread(self, dataBytes, callback, owner):
+        # 解析完成后 在界面线程中调用 callback(retObj, error)
+        if self._decodePool is None:
+            self._decodePool = ThreadPoolExecutor(2, thread_name_prefix='hyqt-json')
+            self._decodeBridge = _DecodeBridge()
+
+        def decode():
+            text = str(dataBytes, 'utf-8')
+            if len(dataBytes) <= self.streamThreshold:
+                return json.loads(text)
+            
+            if not self.pauseGcWhileDecoding:
+                return decodeJsonStreaming(text)
+
+            _pauseGc()
+            try:
+                return decodeJsonStreaming(text, collectEvery=2000)
+            finally:
+                _resumeGc()
+
+        def done(future):
+            # 在工作线程中调用， 把结果送回界面线程
+            def deliver():
+                if owner is not None and not shiboken6.isValid(owner):
+                    return
+                try:
+                    retObj = future.result()
+                except ValueError as e:
+                    callback(None, e)
+                    return
+                callback(retObj, None)
+
+            self._decodeBridge.decoded.emit(deliver)
+
+        self._decodePool.submit(decode).add_done_callback(done)
+
+    def _handleRet(self, retObj, okHandler, errHandler):
         if retObj['ret'] != 0:
             print('error',retObj['msg'])
             # QMessageBox.warning(None, 'error', retObj['msg'])
@@ -111,7 +1767,3 @@ class NAM:
                 
         elif okHandler:
             okHandler(retObj)
-
-
-
-
@@ -320,7 +320,7 @@ class Selector(QFrame) :
         
         # 如果是单选，且已经有其它选中选项，先去掉该选项
         if not self.multiSelection and self.chosenNames :
-            clearLayout(self.lo_1_1_chosen)
+            clearLayout(self.lo_1_1_chosen, incremental=True)
             self.chosenNames = []
       
 
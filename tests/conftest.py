@@ -0,0 +1,49 @@
+import os, threading
+import pytest
+from http.server import ThreadingHTTPServer
+
+# 测试时 不需要显示窗口
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PySide6.QtWidgets import QApplication
+from PySide6 import QtCore
+
+
+@pytest.fixture(scope='session')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def pump(app, ms=0, until=None):
+    """
+    处理事件， 直到过了 ms 毫秒， 或者 until() 返回 True
+    """
+    timer = QtCore.QElapsedTimer()
+    timer.start()
+    while True:
+        app.processEvents()
+        if until is not None and until():
+            return True
+        if timer.elapsed() >= ms:
+            return until is None
+
+
+@pytest.fixture
+def serve():
+    """
+    启动本地 HTTP 服务， serve(handler类) 返回 'http://127.0.0.1:端口'
+    """
+    servers = []
+
+    def start(handlerClass):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handlerClass)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,48 @@
+import pytest
+
+import hyqt
+from hyqt import Column, Row, Label
+
+
+def test_batch_defers_layout_and_styles(app):
+    with hyqt.batch():
+        label = Label('a', color='#ff0000')
+        row = Row([label, Label('b')])
+        page = Column([row, Label('c')])
+
+        # 创建过程中 暂停布局和刷新， 样式表 还没有设置
+        assert not page.lo.isEnabled() and not row.lo.isEnabled()
+        assert not page.updatesEnabled()
+        assert label.styleSheet() == ''
+
+    assert page.lo.isEnabled() and row.lo.isEnabled()
+    assert page.updatesEnabled() and row.updatesEnabled()
+    assert '#ff0000' in label.styleSheet()
+
+    # 退出时 已经计算了布局， 子控件 有了位置
+    page.resize(400, 300)
+    page.lo.activate()
+    assert row.geometry().height() > 0
+    assert page.children[1].y() > row.y()
+
+
+def test_nested_batch_finishes_at_outermost(app):
+    with hyqt.batch():
+        with hyqt.batch():
+            inner = Column([Label('a', color='#00ff00')])
+        # 内层退出时 不处理
+        assert not inner.lo.isEnabled()
+        assert inner.children[0].styleSheet() == ''
+
+    assert inner.lo.isEnabled()
+    assert '#00ff00' in inner.children[0].styleSheet()
+
+
+def test_batch_finishes_on_error(app):
+    with pytest.raises(RuntimeError):
+        with hyqt.batch():
+            page = Column([Label('a')])
+            raise RuntimeError('build failed')
+
+    assert page.lo.isEnabled() and page.updatesEnabled()
+    assert not hyqt._BatchBuild.active()
@@ -0,0 +1,29 @@
+import pytest
+
+from hyqt import Column, Row, Label, clearLayout
+from conftest import pump
+
+
+def makePage():
+    return Column([Row([Label(f'{i} {j}') for j in range(5)]) for i in range(40)])
+
+
+def test_incremental_clear_finishes(app):
+    page = makePage()
+    finished = []
+    page.clear(incremental=True, budgetMs=0.001, onFinished=lambda: finished.append(1))
+    assert page.children == []
+    assert pump(app, 5000, until=lambda: finished)
+    assert finished == [1]
+
+
+def test_non_positive_budget_rejected(app):
+    page = makePage()
+    for budget in [0, -1]:
+        with pytest.raises(ValueError):
+            page.clear(incremental=True, budgetMs=budget)
+        with pytest.raises(ValueError):
+            clearLayout(page.lo, incremental=True, budgetMs=budget)
+
+    # 出错时 没有清空
+    assert len(page.children) == 40
@@ -0,0 +1,61 @@
+from PySide6.QtWidgets import QWidget
+
+from hyqt import Column, Row, s__
+
+
+def layoutShape(container):
+    # 布局里 item 的序列， 子控件为 控件本身， SpacerItem 为 'stretch'
+    lo = container.lo
+    shape = []
+    for i in range(lo.count()):
+        item = lo.itemAt(i)
+        shape.append(item.widget() if item.widget() is not None else 'stretch')
+    return shape
+
+
+def test_extend_same_as_fresh(app):
+    for justify in ['start', 'center', 'end', 'even', None]:
+        for cls in [Column, Row]:
+            first = [QWidget() for _ in range(3)]
+            more = [QWidget() for _ in range(4)]
+
+            fresh = cls(s__(itemsJustify=justify), first + more)
+            expected = layoutShape(fresh)
+            for w in first + more:
+                fresh.lo.removeWidget(w)
+
+            container = cls(s__(itemsJustify=justify), first)
+            container.extend(more)
+            assert layoutShape(container) == expected, justify
+            assert container.children == first + more
+            assert [container.indexOf(w) for w in first + more] == list(range(7))
+
+
+def test_extend_empty_container(app):
+    for justify in ['start', 'center', 'end', 'even', None]:
+        more = [QWidget() for _ in range(3)]
+        fresh = Column(s__(itemsJustify=justify), more)
+        expected = layoutShape(fresh)
+        for w in more:
+            fresh.lo.removeWidget(w)
+
+        container = Column(s__(itemsJustify=justify), [])
+        container.extend(more)
+        assert layoutShape(container) == expected, justify
+
+
+def test_extend_keeps_existing_items(app, monkeypatch):
+    col = Column(s__(itemsJustify='even'), [QWidget() for _ in range(100)])
+    calls = []
+    monkeypatch.setattr(col, '_fillLayout', lambda children: calls.append(len(children)))
+
+    col.extend([QWidget(), QWidget()])
+    assert calls == []
+    assert len(col.children) == 102
+
+
+def test_extend_with_stretch(app):
+    a, b, c = QWidget(), QWidget(), QWidget()
+    col = Column(s__(itemsJustify=None), [a])
+    col.extend([b, 'stretch', c])
+    assert layoutShape(col) == [a, b, 'stretch', c]
@@ -0,0 +1,53 @@
+import random
+
+from PySide6.QtWidgets import QWidget
+
+from hyqt import Column, Row, s__
+
+
+def check(container):
+    for idx, child in enumerate(container.children):
+        assert container.indexOf(child) == idx
+
+
+def test_index_after_random_edits(app):
+    rng = random.Random(3)
+    for cls, justify in [(Column, None), (Row, 'even'), (Column, 'center')]:
+        container = cls(s__(itemsJustify=justify), [QWidget() for _ in range(20)])
+        outside = QWidget()
+
+        for _ in range(300):
+            op = rng.random()
+            if op < 0.3:
+                container.insert(rng.randrange(len(container.children) + 1), QWidget())
+            elif op < 0.6 and container.children:
+                container.remove(rng.choice(container.children))
+            elif op < 0.7:
+                container.append(QWidget())
+            else:
+                # 只查找， 不修改
+                child = rng.choice(container.children) if container.children else outside
+                assert container.children[container.indexOf(child)] is child
+
+            if rng.random() < 0.1:
+                check(container)
+
+        check(container)
+        assert container.indexOf(outside) == -1
+
+
+def test_index_after_direct_change(app):
+    col = Column([QWidget() for _ in range(5)])
+    check(col)
+
+    # 直接修改 children， 位置记录过时， 仍然要找到
+    col.children.reverse()
+    check(col)
+
+
+def test_removed_child_not_found(app):
+    col = Column([QWidget() for _ in range(5)])
+    child = col.children[2]
+    col.remove(child)
+    assert col.indexOf(child) == -1
+    check(col)
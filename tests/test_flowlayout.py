@@ -0,0 +1,120 @@
+from PySide6 import QtCore
+from PySide6.QtWidgets import QWidget, QPushButton, QSizePolicy
+
+from hyqt import FlowLayout
+from conftest import pump
+
+
+class Box(QWidget):
+    # sizeHint 为 创建时指定的大小
+    def __init__(self, width, height):
+        super().__init__()
+        self.hint = QtCore.QSize(width, height)
+
+    def sizeHint(self):
+        return self.hint
+
+
+def makeFlow(app, widths, width=300, **kwargs):
+    host = QWidget()
+    flow = FlowLayout(host, margin=0, hspacing=10, vspacing=5, **kwargs)
+    buttons = []
+    for w in widths:
+        button = QPushButton('x')
+        button.setFixedSize(w, 20)
+        flow.addWidget(button)
+        buttons.append(button)
+    host.resize(width, 200)
+    host.show()
+    pump(app)
+    return host, flow, buttons
+
+
+def positions(buttons):
+    return [(b.x(), b.y()) for b in buttons]
+
+
+def test_wrap_and_height_for_width(app):
+    host, flow, buttons = makeFlow(app, [100, 100, 100, 100])
+    assert positions(buttons) == [(0, 0), (110, 0), (0, 25), (110, 25)]
+    assert flow.heightForWidth(300) == 45
+    assert flow.heightForWidth(500) == 20
+
+
+def test_size_change_relayouts(app):
+    host, flow, buttons = makeFlow(app, [100, 100, 100, 100])
+
+    # 后面的 item 变大， 前面的行 不变， 后面的行 重新分行
+    buttons[2].setFixedSize(250, 20)
+    pump(app)
+    assert positions(buttons) == [(0, 0), (110, 0), (0, 25), (0, 50)]
+
+    buttons[2].setFixedSize(100, 20)
+    pump(app)
+    assert positions(buttons) == [(0, 0), (110, 0), (0, 25), (110, 25)]
+
+
+def test_margin_change_moves_items(app):
+    host, flow, buttons = makeFlow(app, [100, 100])
+    assert positions(buttons) == [(0, 0), (110, 0)]
+
+    flow.setContentsMargins(40, 40, 40, 40)
+    pump(app)
+    assert positions(buttons) == [(40, 40), (150, 40)]
+
+    flow.setContentsMargins(0, 0, 0, 0)
+    pump(app)
+    assert positions(buttons) == [(0, 0), (110, 0)]
+
+
+def test_justify(app):
+    # 第一行 剩余宽度 300 - 100*2 - 10 = 90
+    for justify, xs in [('start', [0, 110]), (None, [0, 110]), ('center', [45, 155]),
+                        ('end', [90, 200]), ('even', [0, 200])]:
+        host, flow, buttons = makeFlow(app, [100, 100, 100], itemsJustify=justify)
+        # 第一行 两个， 第二行 一个
+        assert [b.x() for b in buttons[:2]] == xs, justify
+        assert buttons[2].y() == 25
+
+
+def test_align(app):
+    for align, ys in [('top', [0, 0]), ('center', [0, 10]), ('bottom', [0, 20])]:
+        host, flow, buttons = makeFlow(app, [100, 100], itemsAlign=align)
+        buttons[1].setFixedSize(100, 10)
+        buttons[0].setFixedSize(100, 30)
+        pump(app)
+        assert [b.y() for b in buttons] == ys, align
+
+
+def growFlow(app, policies, factors, **kwargs):
+    host = QWidget()
+    flow = FlowLayout(host, margin=0, hspacing=10, vspacing=5, **kwargs)
+    boxes = []
+    for policy, factor in zip(policies, factors):
+        box = Box(50, 20)
+        box.setSizePolicy(policy, QSizePolicy.Fixed)
+        box._hy_stretchFactor = factor
+        flow.addWidget(box)
+        boxes.append(box)
+    host.resize(300, 200)
+    host.show()
+    pump(app)
+    return host, flow, boxes
+
+
+def test_grow(app):
+    host, flow, boxes = growFlow(app, [QSizePolicy.Expanding] * 3, [1, 2, 0], itemsJustify='even')
+
+    # 剩余宽度 300 - 50*3 - 10*2 = 130， 按 1:2 分， 有扩展的行 itemsJustify 无效
+    assert [b.width() for b in boxes] == [50 + 43, 50 + 86, 50]
+    assert [b.x() for b in boxes] == [0, 103, 249]
+    assert flow.expandingDirections() == QtCore.Qt.Horizontal
+
+
+def test_no_grow_without_expanding(app):
+    # 只设置了 stretchFactor， 没有 hExpanding 的 不扩展， itemsJustify 有效
+    host, flow, boxes = growFlow(app, [QSizePolicy.Maximum, QSizePolicy.Preferred, QSizePolicy.Maximum], 
+                                 [1, 1, 0], itemsJustify='end')
+
+    assert [b.width() for b in boxes] == [50, 50, 50]
+    assert [b.x() for b in boxes] == [130, 190, 250]
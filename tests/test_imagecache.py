@@ -0,0 +1,63 @@
+import time, threading
+from http.server import BaseHTTPRequestHandler
+
+from PySide6 import QtCore, QtGui
+
+from hyqt.utils import NAM
+from hyqt.richedit import ImageCache
+from conftest import pump
+
+
+def pngBytes(width=64, height=48):
+    image = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor('red'))
+    buffer = QtCore.QBuffer()
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    return bytes(buffer.data())
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = 0
+    lock = threading.Lock()
+    body = pngBytes()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with type(self).lock:
+            type(self).requests += 1
+        time.sleep(0.2)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+def test_coalesced_not_hits(app, serve):
+    Handler.requests = 0
+    base = serve(Handler)
+    nam = NAM()
+    cache = ImageCache(directory='')
+
+    results = []
+    for _ in range(3):
+        cache.fetch(base + '/a.png', 1.0, lambda image, error: results.append((image, error)), nam=nam)
+
+    assert pump(app, 5000, lambda: len(results) == 3)
+    assert all(image is not None and error is None for image, error in results)
+    assert Handler.requests == 1
+
+    stats = cache.stats()
+    assert stats['misses'] == 1
+    assert stats['coalesced'] == 2
+    assert stats['hits'] == 0
+    assert stats['hitRate'] == 0
+
+    # 之后从内存获取的 才算命中
+    assert cache.get(base + '/a.png', 1.0) is not None
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['hitRate'] == 1 / 4
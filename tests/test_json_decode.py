@@ -0,0 +1,91 @@
+import gc, json, time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from hyqt.utils import NAM, decodeJsonStreaming
+from conftest import pump
+
+
+BIG = json.dumps({'ret': 0, 'items': [{'id': i, 'tags': ['a', 'b']} for i in range(20000)]})
+
+
+def test_streaming_same_as_loads():
+    for text in [BIG, '[]', '[1, [2, 3], {"a": []}]', ' {"a": [1], "b": {"c": [2]}} ', '"x"']:
+        assert decodeJsonStreaming(text) == json.loads(text)
+    with pytest.raises(ValueError):
+        decodeJsonStreaming('[1, 2')
+
+
+def decodeMany(app, nam, count):
+    nam.streamThreshold = 1024
+    results = []
+    for i in range(count):
+        nam._decodeInThread(BIG.encode(), lambda retObj, error: results.append(error), None)
+    assert pump(app, 20000, until=lambda: len(results) == count)
+    assert results == [None] * count
+
+
+def test_gc_untouched_by_default(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(gc, 'disable', lambda: calls.append('disable'))
+    decodeMany(app, NAM(decodeInThread=True), 4)
+    assert calls == []
+    assert gc.isenabled()
+
+
+def test_concurrent_decodes_restore_gc(app):
+    nam = NAM(decodeInThread=True, pauseGcWhileDecoding=True)
+    for _ in range(3):
+        decodeMany(app, nam, 6)
+        assert gc.isenabled()
+
+
+def test_disabled_gc_stays_disabled(app):
+    nam = NAM(decodeInThread=True, pauseGcWhileDecoding=True)
+    gc.disable()
+    try:
+        decodeMany(app, nam, 4)
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests += 1
+        time.sleep(0.2)
+        body = json.dumps({'ret': 0, 'path': self.path}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.mark.parametrize('inThread', [False, True])
+def test_coalesced_get_decoded_once(app, serve, monkeypatch, inThread):
+    JsonHandler.requests = 0
+    base = serve(JsonHandler)
+    nam = NAM(retries=0, decodeInThread=inThread)
+
+    decodes = []
+    loads = json.loads
+    monkeypatch.setattr(json, 'loads', lambda *args, **kwargs: decodes.append(1) or loads(*args, **kwargs))
+
+    results = []
+    for _ in range(3):
+        nam.get(base + '/same', results.append)
+    assert pump(app, 5000, until=lambda: len(results) == 3)
+
+    assert JsonHandler.requests == 1
+    assert nam.coalesced == 2
+    assert len(decodes) == 1
+    # 所有的回调 收到同一个解析结果
+    assert results[0] == {'ret': 0, 'path': '/same'}
+    assert results[1] is results[0] and results[2] is results[0]
@@ -0,0 +1,99 @@
+import json, time, asyncio, threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from hyqt.utils import NAM, RequestError
+
+
+class Handler(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    @classmethod
+    def reset(cls):
+        cls.active = cls.peak = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            if self.path == '/slow':
+                time.sleep(1)
+            elif self.path.startswith('/item/'):
+                time.sleep(0.05)
+            if self.path == '/bad':
+                retObj = {'ret': 1, 'msg': 'not allowed'}
+            else:
+                retObj = {'ret': 0, 'path': self.path}
+            body = json.dumps(retObj).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            # 客户端超时 取消了请求
+            pass
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+def run(app, coro, seconds=5):
+    async def main():
+        # 在 asyncio 循环里 处理 Qt 事件， 代替 QtAsyncio
+        task = asyncio.ensure_future(coro)
+        deadline = time.monotonic() + seconds
+        while not task.done() and time.monotonic() < deadline:
+            app.processEvents()
+            await asyncio.sleep(0.005)
+        return await task
+    return asyncio.run(main())
+
+
+def test_aget_returns_json(app, serve):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    assert run(app, nam.aget(base + '/ok')) == {'ret': 0, 'path': '/ok'}
+
+
+def test_afetch_returns_raw_bytes(app, serve):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    data = run(app, nam.afetch(base + '/ok'))
+    assert json.loads(bytes(data)) == {'ret': 0, 'path': '/ok'}
+
+
+def test_aget_ret_error_raises(app, serve):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    with pytest.raises(RequestError) as info:
+        run(app, nam.aget(base + '/bad'))
+    assert str(info.value) == 'not allowed'
+    assert info.value.retObj == {'ret': 1, 'msg': 'not allowed'}
+
+
+def test_aget_timeout_cancels_request(app, serve):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    with pytest.raises(asyncio.TimeoutError):
+        run(app, nam.aget(base + '/slow', timeout=0.1))
+    assert nam.activeCount() == 0
+    assert nam.queueDepth() == 0
+
+
+def test_gather_keeps_order_and_limit(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    paths = [f'/item/{i}' for i in range(6)]
+    results = run(app, NAM.gather(*(nam.aget(base + p) for p in paths), limit=2))
+    assert [r['path'] for r in results] == paths
+    assert Handler.peak <= 2
@@ -0,0 +1,118 @@
+import json, time, threading
+from http.server import BaseHTTPRequestHandler
+
+from hyqt.utils import NAM, ResponseCache
+from conftest import pump
+
+
+class Handler(BaseHTTPRequestHandler):
+    # 收到的请求 [(method, path, 批量请求里的 path 列表)]
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, retObj, status=200, headers={}):
+        body = json.dumps(retObj).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.lock:
+            self.requests.append(('GET', self.path, None))
+        if '/slow/' in self.path:
+            time.sleep(0.3)
+        self.reply({'ret': 0, 'path': self.path}, headers={'Cache-Control': 'max-age=60'})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        paths = [one['path'] for one in body['requests']]
+        with self.lock:
+            self.requests.append(('POST', self.path, paths))
+
+        if self.path == '/batchfail':
+            self.reply({'ret': 1, 'msg': 'down'}, status=500)
+            return
+        self.reply({'ret': 0, 'responses': [{'ret': 0, 'path': '/api' + path, 'batched': True}
+                                            for path in paths]})
+
+    @classmethod
+    def reset(cls):
+        cls.requests = []
+
+
+def makeNam(base, endpoint='/batch', cache=None):
+    Handler.reset()
+    nam = NAM(retries=0, cache=cache)
+    nam.showErrorBox = False
+    nam.enableBatching(base + '/api', base + endpoint, windowMs=20)
+    return nam
+
+
+def test_gets_are_batched(app, serve):
+    base = serve(Handler)
+    nam = makeNam(base)
+
+    results = []
+    for path in ['/api/a', '/api/b', '/api/a', '/api/c']:
+        nam.get(base + path, okHandler=results.append)
+
+    assert pump(app, 5000, until=lambda: len(results) == 4)
+    assert Handler.requests == [('POST', '/batch', ['/a', '/b', '/c'])]
+    assert sorted(one['path'] for one in results) == ['/api/a', '/api/a', '/api/b', '/api/c']
+    assert nam.stats()['batches'] == 1
+
+
+def test_cached_get_not_batched(app, serve):
+    base = serve(Handler)
+    nam = makeNam(base, cache=ResponseCache())
+
+    fetched = []
+    nam.fetch(base + '/api/cached', lambda data, error: fetched.append(error))
+    assert pump(app, 5000, until=lambda: fetched)
+
+    results = []
+    nam.get(base + '/api/cached', okHandler=results.append)
+    nam.get(base + '/api/other', okHandler=results.append)
+    assert pump(app, 5000, until=lambda: len(results) == 2)
+    pump(app, 100)
+
+    # 有缓存的 直接使用缓存， 剩下的一个 不需要合并
+    assert Handler.requests == [('GET', '/api/cached', None), ('GET', '/api/other', None)]
+    assert nam.cache.stats()['hits'] == 1
+    assert {one['path'] for one in results} == {'/api/cached', '/api/other'}
+
+
+def test_inflight_get_not_batched(app, serve):
+    base = serve(Handler)
+    nam = makeNam(base)
+
+    fetched, results = [], []
+    nam.fetch(base + '/api/slow/1', lambda data, error: fetched.append(error))
+    nam.get(base + '/api/slow/1', okHandler=results.append)
+    nam.get(base + '/api/x', okHandler=results.append)
+    nam.get(base + '/api/y', okHandler=results.append)
+
+    assert pump(app, 5000, until=lambda: fetched and len(results) == 3)
+    gets = [one for one in Handler.requests if one[0] == 'GET']
+    assert gets == [('GET', '/api/slow/1', None)]
+    assert ('POST', '/batch', ['/x', '/y']) in Handler.requests
+    assert nam.coalesced == 1
+
+
+def test_batch_failure_reaches_every_errhandler(app, serve):
+    base = serve(Handler)
+    nam = makeNam(base, endpoint='/batchfail')
+
+    failed, ok = [], []
+    for path in ['/api/a', '/api/b', '/api/c']:
+        nam.get(base + path, okHandler=ok.append, errHandler=failed.append)
+
+    assert pump(app, 5000, until=lambda: len(failed) == 3)
+    assert ok == []
+    assert all(one['ret'] == 1 and one['msg'] for one in failed)
@@ -0,0 +1,98 @@
+import threading
+from http.server import BaseHTTPRequestHandler
+
+from hyqt.utils import NAM, ResponseCache
+from conftest import pump
+
+
+class Handler(BaseHTTPRequestHandler):
+    # 收到的 (path, If-None-Match)
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        etag = self.headers.get('If-None-Match')
+        with cls.lock:
+            cls.requests.append((self.path, etag))
+
+        headers = {}
+        if self.path == '/fresh':
+            headers['Cache-Control'] = 'max-age=60'
+        elif self.path == '/etag':
+            headers['Cache-Control'] = 'no-cache'
+            headers['ETag'] = '"v1"'
+            if etag == '"v1"':
+                self.send_response(304)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                return
+        elif self.path == '/nostore':
+            headers['Cache-Control'] = 'no-store'
+
+        body = f'body of {self.path}'.encode()
+        self.send_response(200)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def fetchOne(app, nam, url):
+    results = []
+    nam.fetch(url, lambda data, error: results.append((bytes(data), error)))
+    assert pump(app, 5000, until=lambda: results)
+    return results[0]
+
+
+def test_fresh_response_from_cache(app, serve):
+    Handler.requests = []
+    base = serve(Handler)
+    nam = NAM(cache=ResponseCache(), retries=0)
+
+    assert fetchOne(app, nam, base + '/fresh') == (b'body of /fresh', None)
+    assert fetchOne(app, nam, base + '/fresh') == (b'body of /fresh', None)
+
+    assert [path for path, _ in Handler.requests] == ['/fresh']
+    assert nam.cache.stats()['hits'] == 1
+
+
+def test_etag_revalidated(app, serve):
+    Handler.requests = []
+    base = serve(Handler)
+    nam = NAM(cache=ResponseCache(), retries=0)
+
+    assert fetchOne(app, nam, base + '/etag') == (b'body of /etag', None)
+    # no-cache 每次都要校验， 304 时 使用缓存的内容
+    assert fetchOne(app, nam, base + '/etag') == (b'body of /etag', None)
+
+    assert Handler.requests == [('/etag', None), ('/etag', '"v1"')]
+    stats = nam.cache.stats()
+    assert stats['revalidated'] == 1
+    assert stats['bytesSaved'] == len(b'body of /etag')
+
+
+def test_no_store_not_cached(app, serve):
+    Handler.requests = []
+    base = serve(Handler)
+    nam = NAM(cache=ResponseCache(), retries=0)
+
+    fetchOne(app, nam, base + '/nostore')
+    fetchOne(app, nam, base + '/nostore')
+    assert len(Handler.requests) == 2
+    assert nam.cache.stats()['entries'] == 0
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+    cache.store('http://host/a', b'hello', {'cache-control': 'max-age=60', 'etag': '"x"'})
+
+    again = ResponseCache(directory=str(tmp_path))
+    meta, body = again.lookup('http://host/a')
+    assert body == b'hello'
+    assert meta['etag'] == '"x"' and again.isFresh(meta)
@@ -0,0 +1,107 @@
+import os, time
+from http.server import BaseHTTPRequestHandler
+
+import shiboken6
+from PySide6 import QtCore
+
+from hyqt.utils import NAM
+from conftest import pump
+
+
+BODY = bytes(range(256)) * 4000
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/slow'):
+            time.sleep(0.3)
+
+        data = BODY
+        rangeHeader = self.headers.get('Range')
+        if rangeHeader:
+            data = BODY[int(rangeHeader[6:-1]):]
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def test_download_to_file(app, serve, tmp_path):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    path = str(tmp_path / 'a.bin')
+
+    errors = []
+    nam.download(base + '/file', path, onFinished=errors.append)
+    assert pump(app, 5000, until=lambda: errors)
+    assert errors == [None]
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+
+    # 续传
+    with open(path, 'r+b') as f:
+        f.truncate(1000)
+    errors = []
+    nam.download(base + '/file', path, onFinished=errors.append, resume=True)
+    assert pump(app, 5000, until=lambda: errors)
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+
+
+def test_cancel_queued_download_leaves_file_alone(app, serve, tmp_path):
+    base = serve(Handler)
+    nam = NAM(maxPerHost=1, retries=0)
+
+    existing = tmp_path / 'existing.bin'
+    existing.write_bytes(b'old content')
+    missing = tmp_path / 'missing.bin'
+
+    results = []
+    nam.fetch(base + '/slow/block', lambda data, error: results.append(error))
+
+    owner = QtCore.QObject()
+    called = []
+    nam.download(base + '/file', str(existing), onFinished=called.append, owner=owner)
+    nam.download(base + '/file', str(missing), onFinished=called.append, owner=owner)
+    queued = [job for queue in nam._queues.values() for _, _, job in queue]
+    assert len(queued) == 2
+
+    shiboken6.delete(owner)
+    assert pump(app, 5000, until=lambda: results)
+    pump(app, 200)
+
+    assert called == []
+    assert existing.read_bytes() == b'old content'
+    assert not missing.exists()
+    assert all(job.stream.file is None for job in queued)
+
+
+def test_cancel_active_download_closes_file(app, serve, tmp_path):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+
+    owner = QtCore.QObject()
+    nam.download(base + '/slow/file', str(tmp_path / 'b.bin'), owner=owner)
+    job = next(iter(nam._ownerJobs.values()))[0][0]
+    assert job.stream.file is not None
+
+    shiboken6.delete(owner)
+    assert pump(app, 5000, until=lambda: job.stream.file.closed)
+
+
+def test_unopenable_path_reports_error(app, serve, tmp_path):
+    base = serve(Handler)
+    nam = NAM(maxPerHost=1, retries=0)
+
+    errors = []
+    nam.download(base + '/file', str(tmp_path / 'no' / 'such' / 'dir.bin'), 
+                 onFinished=errors.append)
+    nam.download(base + '/file', str(tmp_path / 'ok.bin'), onFinished=errors.append)
+    assert pump(app, 5000, until=lambda: len(errors) == 2)
+    assert errors[0].startswith('cannot open') and errors[1] is None
+    assert os.path.getsize(tmp_path / 'ok.bin') == len(BODY)
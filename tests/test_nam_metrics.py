@@ -0,0 +1,105 @@
+import json, time
+from http.server import BaseHTTPRequestHandler
+
+from hyqt.utils import NAM, urlTemplate
+from conftest import pump
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        if self.path.startswith('/slow'):
+            time.sleep(0.2)
+
+        status = 404 if self.path == '/missing' else 200
+        body = b'x' * 1000
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = respond
+
+
+def fetchAll(app, nam, urls):
+    results = []
+    for url in urls:
+        nam.fetch(url, lambda data, error: results.append(error))
+    assert pump(app, 5000, until=lambda: len(results) == len(urls))
+    return results
+
+
+def test_url_template():
+    assert urlTemplate('https://host/api/user/123?id=5&name=x') == 'host/api/user/{id}?id=&name='
+    assert urlTemplate('http://host/api/list') == 'host/api/list'
+
+
+def test_request_recorded(app, serve):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    fetchAll(app, nam, [base + '/slow/7'])
+
+    record, = nam.records
+    assert record['method'] == 'GET'
+    assert record['template'] == '127.0.0.1/slow/{id}'
+    assert record['status'] == 200
+    assert record['error'] is None
+    assert record['responseBytes'] == 1000
+    assert record['requestBytes'] == 0
+    assert record['ttfb'] is not None and record['ttfb'] <= record['total']
+    assert record['total'] >= 0.2
+
+
+def test_request_bytes_recorded(app, serve):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    done = []
+    nam.send('POST', base + '/upload', b'y' * 300, 'application/octet-stream', 
+             lambda data, error: done.append(error))
+    assert pump(app, 5000, until=lambda: done)
+
+    record, = nam.records
+    assert record['method'] == 'POST'
+    assert record['requestBytes'] == 300
+
+
+def test_endpoint_stats(app, serve):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    fetchAll(app, nam, [base + '/item/1', base + '/item/2', base + '/missing'])
+
+    stats = nam.endpointStats()
+    item = stats['GET 127.0.0.1/item/{id}']
+    assert item['count'] == 2 and item['errors'] == 0
+    assert item['responseBytes'] == 2000
+    assert item['p50'] <= item['max']
+    assert stats['GET 127.0.0.1/missing']['errors'] == 1
+
+
+def test_slow_request_signal(app, serve):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    nam.slowThreshold = 0.1
+    slow = []
+    nam.signals.slowRequest.connect(lambda record: slow.append(record['url']))
+
+    fetchAll(app, nam, [base + '/fast', base + '/slow/1'])
+    assert slow == [base + '/slow/1']
+
+
+def test_dump_har(app, serve, tmp_path):
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    fetchAll(app, nam, [base + '/item/1', base + '/missing'])
+
+    path = tmp_path / 'requests.har'
+    nam.dumpHar(str(path))
+    entries = json.loads(path.read_text(encoding='utf8'))['log']['entries']
+    assert sorted(one['response']['status'] for one in entries) == [200, 404]
+    assert all(one['response']['bodySize'] == 1000 for one in entries)
@@ -0,0 +1,117 @@
+import time, threading
+from http.server import BaseHTTPRequestHandler
+
+from hyqt.utils import NAM
+from conftest import pump
+
+
+class Handler(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    # (method, path) 列表
+    requests = []
+    # /flaky 前几次 返回 503
+    failFirst = 0
+
+    @classmethod
+    def reset(cls, failFirst=0):
+        cls.requests = []
+        cls.failFirst = failFirst
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self):
+        cls = type(self)
+        with cls.lock:
+            cls.requests.append((self.command, self.path))
+            count = len(cls.requests)
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        status = 200
+        if self.path == '/down' or (self.path == '/flaky' and count <= cls.failFirst):
+            status = 503
+        elif self.path == '/slow':
+            time.sleep(2)
+
+        body = b'{"ret": 0}'
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass
+
+    do_GET = do_POST = respond
+
+
+def fetchOne(app, nam, url, seconds=5):
+    results = []
+    nam.fetch(url, lambda data, error: results.append(error))
+    assert pump(app, seconds * 1000, until=lambda: results)
+    return results[0]
+
+
+def test_transient_error_retried(app, serve):
+    Handler.reset(failFirst=2)
+    base = serve(Handler)
+    nam = NAM(retries=2, retryDelay=0.01)
+
+    assert fetchOne(app, nam, base + '/flaky') is None
+    assert Handler.requests == [('GET', '/flaky')] * 3
+    assert nam.stats()['retried'] == 2
+
+
+def test_retries_exhausted(app, serve):
+    Handler.reset(failFirst=5)
+    base = serve(Handler)
+    nam = NAM(retries=1, retryDelay=0.01)
+
+    assert fetchOne(app, nam, base + '/flaky') is not None
+    assert len(Handler.requests) == 2
+
+
+def test_post_not_retried(app, serve):
+    Handler.reset(failFirst=5)
+    base = serve(Handler)
+    nam = NAM(retries=2, retryDelay=0.01)
+
+    errors = []
+    nam.send('POST', base + '/flaky', '{}', 'application/json', 
+             lambda data, error: errors.append(error))
+    assert pump(app, 5000, until=lambda: errors)
+    assert errors[0] is not None
+    assert Handler.requests == [('POST', '/flaky')]
+
+
+def test_transfer_timeout(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    nam = NAM(timeout=0.2, retries=0)
+
+    start = time.monotonic()
+    assert fetchOne(app, nam, base + '/slow') is not None
+    assert time.monotonic() - start < 1.5
+
+
+def test_breaker_rejects_after_threshold(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    nam = NAM(retries=0, breakerThreshold=2, breakerCooldown=60)
+
+    assert fetchOne(app, nam, base + '/down') is not None
+    assert fetchOne(app, nam, base + '/down') is not None
+    assert len(Handler.requests) == 2
+
+    # 熔断器打开， 请求 直接失败， 不会发到服务端
+    error = fetchOne(app, nam, base + '/ok')
+    assert 'unavailable' in error
+    assert len(Handler.requests) == 2
+
+    stats = nam.stats()
+    assert stats['rejected'] == 1
+    assert stats['openHosts'] == [base]
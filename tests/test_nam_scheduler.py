@@ -0,0 +1,171 @@
+import gc, time, threading
+from http.server import BaseHTTPRequestHandler
+
+import shiboken6
+from PySide6 import QtCore
+
+from hyqt.utils import NAM
+from conftest import pump
+
+
+class Handler(BaseHTTPRequestHandler):
+    # 收到的请求 path， 和 同时处理的请求数
+    paths = []
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.paths.append(self.path)
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+
+        if self.path.startswith('/slow'):
+            time.sleep(0.3)
+
+        with cls.lock:
+            cls.active -= 1
+
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def reset(cls):
+        cls.paths = []
+        cls.active = cls.peak = 0
+
+
+def fetchAll(nam, base, paths, results, **kwargs):
+    for path in paths:
+        nam.fetch(base + path, lambda data, error, path=path: results.append((path, error)),
+                  **kwargs)
+
+
+def test_per_host_limit(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    nam = NAM(maxPerHost=2, retries=0)
+
+    results = []
+    fetchAll(nam, base, [f'/slow/{i}' for i in range(6)], results)
+    assert nam._active[QtCore.QUrl(base).host()] == 2
+    assert nam.stats()['queued'] == 4
+
+    assert pump(app, 5000, until=lambda: len(results) == 6)
+    assert Handler.peak == 2
+    assert all(error is None for _, error in results)
+    assert nam.stats()['queued'] == 0
+
+
+def test_priority_order(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    nam = NAM(maxPerHost=1, retries=0)
+
+    results = []
+    fetchAll(nam, base, ['/slow/block'], results)
+    fetchAll(nam, base, ['/bg1'], results, priority=NAM.PRIORITY_BACKGROUND)
+    fetchAll(nam, base, ['/normal'], results, priority=NAM.PRIORITY_NORMAL)
+    fetchAll(nam, base, ['/bg2'], results, priority=NAM.PRIORITY_BACKGROUND)
+    fetchAll(nam, base, ['/ui'], results, priority=NAM.PRIORITY_INTERACTIVE)
+
+    assert pump(app, 5000, until=lambda: len(results) == 5)
+    # 相同优先级的 先到先发
+    assert Handler.paths == ['/slow/block', '/ui', '/normal', '/bg1', '/bg2']
+
+
+def test_coalesced_get(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    nam = NAM(retries=0)
+
+    results = []
+    fetchAll(nam, base, ['/slow/same', '/slow/same'], results)
+    assert pump(app, 5000, until=lambda: len(results) == 2)
+    assert Handler.paths == ['/slow/same']
+    assert nam.coalesced == 1
+
+
+def test_owner_destroyed_cancels_queued(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    nam = NAM(maxPerHost=1, retries=0)
+
+    owner = QtCore.QObject()
+    results = []
+    fetchAll(nam, base, ['/slow/block'], results)
+    fetchAll(nam, base, ['/queued'], results, owner=owner)
+    assert nam.stats()['queued'] == 1
+
+    shiboken6.delete(owner)
+    assert nam.stats()['queued'] == 0
+
+    fetchAll(nam, base, ['/after'], results)
+    assert pump(app, 5000, until=lambda: len(results) == 2)
+    pump(app, 200)
+    assert [path for path, _ in results] == ['/slow/block', '/after']
+    assert '/queued' not in Handler.paths
+
+
+def test_owner_destroyed_aborts_active(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    nam = NAM(retries=0)
+    host = QtCore.QUrl(base).host()
+
+    owner = QtCore.QObject()
+    results = []
+    fetchAll(nam, base, ['/slow/active'], results, owner=owner)
+    assert pump(app, 2000, until=lambda: Handler.paths)
+
+    shiboken6.delete(owner)
+    assert pump(app, 2000, until=lambda: nam._active.get(host) == 0)
+    pump(app, 500)
+    assert results == []
+
+
+def test_shared_get_survives_one_owner(app, serve):
+    # 合并的请求， 一个 owner 被删除， 另一个 仍然收到结果
+    Handler.reset()
+    base = serve(Handler)
+    nam = NAM(retries=0)
+
+    gone, kept = QtCore.QObject(), QtCore.QObject()
+    results = []
+    nam.fetch(base + '/slow/shared', lambda d, e: results.append('gone'), owner=gone)
+    nam.fetch(base + '/slow/shared', lambda d, e: results.append('kept'), owner=kept)
+    shiboken6.delete(gone)
+
+    assert pump(app, 5000, until=lambda: results)
+    pump(app, 100)
+    assert results == ['kept']
+
+
+def test_release_nam(app, serve):
+    # 回调里 或者 请求进行中 释放 NAM， 不会崩溃
+    Handler.reset()
+    base = serve(Handler)
+
+    results = []
+    nam = NAM(retries=0)
+    fetchAll(nam, base, ['/done'], results)
+    assert pump(app, 5000, until=lambda: results)
+    del nam
+    gc.collect()
+    pump(app, 50)
+
+    nam = NAM(retries=0)
+    fetchAll(nam, base, ['/slow/inflight'], results)
+    del nam
+    gc.collect()
+    assert pump(app, 5000, until=lambda: len(results) == 2)
+    pump(app, 50)
+    assert results == [('/done', None), ('/slow/inflight', None)]
@@ -0,0 +1,61 @@
+import pytest
+import shiboken6
+from PySide6 import QtCore
+
+from hyqt import Column, Label
+
+
+def rows(*ids):
+    return [{'id': i, 'name': f'name {i}'} for i in ids]
+
+
+def reconcile(col, items, built):
+    def build(item):
+        built.append(item['id'])
+        return Label(item['name'])
+
+    col.reconcile(items, key=lambda r: r['id'], build=build,
+                  update=lambda label, r: label.setText(r['name']))
+
+
+def test_reconcile_reuses_keyed_children(app):
+    col = Column([])
+    built = []
+    reconcile(col, rows(1, 2, 3), built)
+    assert built == [1, 2, 3]
+    one, two, three = col.children
+
+    # 2 去掉， 3 和 1 交换次序， 新增 4， 1 的内容改变
+    items = rows(3, 1, 4)
+    items[1]['name'] = 'renamed'
+    built.clear()
+    reconcile(col, items, built)
+
+    assert built == [4]
+    assert col.children[:2] == [three, one]
+    assert one.text() == 'renamed'
+    assert [col.lo.indexOf(child) for child in col.children] == \
+        sorted(col.lo.indexOf(child) for child in col.children)
+    assert [col.indexOf(child) for child in col.children] == [0, 1, 2]
+
+    # 去掉的子控件 被删除
+    QtCore.QCoreApplication.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+    assert not shiboken6.isValid(two)
+
+
+def test_reconcile_unchanged_keeps_layout(app, monkeypatch):
+    col = Column([])
+    built = []
+    reconcile(col, rows(1, 2), built)
+
+    calls = []
+    monkeypatch.setattr(col, '_setChildren', lambda *args: calls.append(args))
+    reconcile(col, rows(1, 2), built)
+    assert calls == []
+    assert built == [1, 2]
+
+
+def test_reconcile_duplicate_key(app):
+    col = Column([])
+    with pytest.raises(ValueError):
+        reconcile(col, rows(1, 1), [])
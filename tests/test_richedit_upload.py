@@ -0,0 +1,244 @@
+import re, json, time, struct, asyncio, threading
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from PySide6 import QtCore, QtGui
+from PySide6.QtCore import QMimeData, QUrl
+from PySide6.QtWidgets import QApplication
+
+from hyqt.utils import NAM
+from hyqt.richedit import BaseTextEdit, UploadedImages
+from conftest import pump
+
+
+class Handler(BaseHTTPRequestHandler):
+    # 收到的文件名 和 内容， 和 同时处理的请求数
+    names = []
+    bodies = []
+    active = 0
+    peak = 0
+    failing = False
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        cls = type(self)
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        name = parse_qs(urlparse(self.path).query)['file_name'][0]
+        with cls.lock:
+            cls.names.append(name)
+            cls.bodies.append(body)
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+
+        time.sleep(0.1)
+
+        with cls.lock:
+            cls.active -= 1
+
+        if cls.failing:
+            ret = {'ret': 1, 'msg': 'disk full'}
+        else:
+            ret = {'ret': 0, 'url': f'/upload/{name}'}
+        body = json.dumps(ret).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def reset(cls, failing=False):
+        cls.names = []
+        cls.bodies = []
+        cls.active = cls.peak = 0
+        cls.failing = failing
+
+
+def makeEditor(base, colors, uploadedImages=None):
+    # colors 中 相同的颜色 内容相同
+    te = BaseTextEdit(uploadedImages=uploadedImages)
+    te.uploadUrl = base + '/api/upload'
+    te.nam = NAM()
+    html = ''
+    for i, color in enumerate(colors):
+        image = QtGui.QImage(40, 30, QtGui.QImage.Format_RGB32)
+        image.fill(QtGui.QColor(color))
+        te.document().addResource(QtGui.QTextDocument.ImageResource, f'tmp_{i}', image)
+        html += f'<p><img src="tmp_{i}" /></p>'
+    te.setHtml(html)
+
+    te.setHtmlCalls = 0
+    setHtml = te.setHtml
+    def countingSetHtml(html):
+        te.setHtmlCalls += 1
+        setHtml(html)
+    te.setHtml = countingSetHtml
+
+    te.progress, te.finished, te.failed = [], [], []
+    te.uploadProgress.connect(lambda done, total: te.progress.append((done, total)))
+    te.uploadFinished.connect(te.finished.append)
+    te.uploadFailed.connect(te.failed.append)
+    return te
+
+
+COLORS = ['red', 'green', 'blue', 'yellow', 'red', 'black', 'green']
+
+
+def test_upload_limit_and_dedup(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    te = makeEditor(base, COLORS, UploadedImages())
+
+    te.saveTmpResourcesToServer(limit=2)
+    assert pump(app, 5000, lambda: te.finished)
+
+    assert te.finished == [True]
+    assert te.saveTmpResourcesStatus == 'finished'
+    # 内容相同的图片 只上传一份
+    assert len(Handler.names) == 5
+    assert Handler.peak <= 2
+    assert te.progress[-1] == (7, 7)
+    # 全部完成后 一次性更新 html
+    assert te.setHtmlCalls == 1
+    assert 'src="tmp_' not in te.toCleanHtml()
+    assert te.toCleanHtml().count('/upload/') == 7
+
+    # 共用同一个记录的编辑框， 不再重复上传
+    Handler.reset()
+    other = makeEditor(base, COLORS, te.uploadedImages)
+    other.saveTmpResourcesToServer()
+    assert pump(app, 5000, lambda: other.finished)
+    assert other.finished == [True]
+    assert Handler.names == []
+
+
+def test_upload_failure_no_dialog(app, serve):
+    Handler.reset(failing=True)
+    base = serve(Handler)
+    te = makeEditor(base, ['red', 'green'], UploadedImages())
+
+    te.saveTmpResourcesToServer()
+    assert pump(app, 5000, lambda: te.finished)
+
+    assert te.finished == [False]
+    assert te.failed == ['disk full']
+    assert te.saveTmpResourcesStatus == 'failed'
+    assert QApplication.activeModalWidget() is None
+    # 失败时 不修改文档
+    assert te.setHtmlCalls == 0
+    assert 'tmp_0' in te.toCleanHtml()
+
+
+def test_uploaded_images_lru():
+    store = UploadedImages(maxSize=2)
+    store.put(('u', 'a'), '/a')
+    store.put(('u', 'b'), '/b')
+    assert store.get(('u', 'a')) == '/a'
+    store.put(('u', 'c'), '/c')
+
+    assert len(store) == 2
+    assert store.get(('u', 'b')) is None
+    assert store.get(('u', 'a')) == '/a'
+    assert store.get(('u', 'c')) == '/c'
+
+
+def test_async_upload(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    te = makeEditor(base, ['red', 'green', 'red'], UploadedImages())
+
+    async def main():
+        # 在 asyncio 循环里 处理 Qt 事件， 代替 QtAsyncio
+        task = asyncio.ensure_future(te.asaveTmpResourcesToServer(limit=2, timeout=5))
+        deadline = time.monotonic() + 5
+        while not task.done() and time.monotonic() < deadline:
+            app.processEvents()
+            await asyncio.sleep(0.005)
+        return await task
+
+    assert asyncio.run(main()) is True
+    assert len(Handler.names) == 2
+    assert te.toCleanHtml().count('/upload/') == 3
+
+
+def test_async_upload_uses_upload_limit(app, serve):
+    Handler.reset()
+    base = serve(Handler)
+    te = makeEditor(base, ['red', 'green', 'blue'], UploadedImages())
+    te.uploadLimit = 1
+
+    async def main():
+        task = asyncio.ensure_future(te.asaveTmpResourcesToServer())
+        deadline = time.monotonic() + 5
+        while not task.done() and time.monotonic() < deadline:
+            app.processEvents()
+            await asyncio.sleep(0.005)
+        return await task
+
+    assert asyncio.run(main()) is True
+    assert len(Handler.names) == 3
+    assert Handler.peak == 1
+
+
+def dropFile(te, path):
+    mime = QMimeData()
+    mime.setUrls([QUrl.fromLocalFile(str(path))])
+    te.insertFromMimeData(mime)
+
+
+def imageResources(te):
+    doc = te.document()
+    names = re.findall(r'<img src="(tmp_.+?)"', te.toCleanHtml())
+    return [doc.resource(QtGui.QTextDocument.ImageResource, name) for name in names]
+
+
+def test_dropped_file_uploaded_full_size(app, serve, tmp_path):
+    Handler.reset()
+    base = serve(Handler)
+    te = makeEditor(base, [], UploadedImages())
+
+    path = tmp_path / 'wide.png'
+    image = QtGui.QImage(2000, 100, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor('orange'))
+    image.save(str(path))
+
+    dropFile(te, path)
+    assert pump(app, 5000, lambda: not te.imagesDecoding)
+    # 显示的图片 按显示宽度解码
+    assert imageResources(te)[0].width() < 2000
+
+    te.saveTmpResourcesToServer()
+    assert pump(app, 5000, lambda: te.finished)
+    assert te.finished == [True]
+
+    # 上传的是原图
+    uploaded = QtGui.QImage.fromData(Handler.bodies[0])
+    assert (uploaded.width(), uploaded.height()) == (2000, 100)
+
+
+def test_dropped_file_placeholder_rotated(app, serve, tmp_path):
+    base = serve(Handler)
+    te = makeEditor(base, [], UploadedImages())
+
+    # 300x100 的 JPEG， EXIF 方向为 顺时针旋转 90 度， 显示为 100x300
+    plain = tmp_path / 'plain.jpg'
+    image = QtGui.QImage(300, 100, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor('purple'))
+    image.save(str(plain))
+    tiff = b'MM\x00\x2a' + struct.pack('>IH', 8, 1) + struct.pack('>HHIHH', 0x0112, 3, 1, 6, 0) \
+        + struct.pack('>I', 0)
+    app1 = b'Exif\x00\x00' + tiff
+    data = plain.read_bytes()
+    path = tmp_path / 'rotated.jpg'
+    path.write_bytes(data[:2] + b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1 + data[2:])
+
+    dropFile(te, path)
+    placeholder = imageResources(te)[0]
+    assert (placeholder.width(), placeholder.height()) == (100, 300)
+
+    assert pump(app, 5000, lambda: not te.imagesDecoding)
+    image = imageResources(te)[0]
+    assert (image.width(), image.height()) == (100, 300)
@@ -0,0 +1,134 @@
+import time, threading
+from http.server import BaseHTTPRequestHandler
+
+from PySide6 import QtCore, QtGui
+
+from hyqt.utils import NAM
+from hyqt.richedit import ImageCache, RichTextBrowser
+from conftest import pump
+
+
+def pngBytes(width, height):
+    image = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor('green'))
+    buffer = QtCore.QBuffer()
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    return bytes(buffer.data())
+
+
+class Handler(BaseHTTPRequestHandler):
+    # 收到的请求 path， 前 failures 个请求 返回 404， 每个请求 等待 delay 秒
+    paths = []
+    failures = 0
+    delay = 0
+    lock = threading.Lock()
+    body = pngBytes(120, 90)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.paths.append(self.path)
+            failed = len(cls.paths) <= cls.failures
+        time.sleep(cls.delay)
+
+        if failed:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    @classmethod
+    def reset(cls, failures=0, delay=0):
+        cls.paths = []
+        cls.failures = failures
+        cls.delay = delay
+
+
+def loaded(browser, name):
+    image = browser.document().resource(QtGui.QTextDocument.ImageResource, name)
+    return image is not None and image.width() == 120
+
+
+def newBrowser(**kwargs):
+    ImageCache.single_instance = ImageCache(directory='')
+    browser = RichTextBrowser(nam=NAM(), **kwargs)
+    browser.resize(600, 400)
+    return browser
+
+
+def closeBrowser(app, browser):
+    browser.deleteLater()
+    app.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+    ImageCache.single_instance = None
+
+
+def test_failed_image_retried(app, serve):
+    Handler.reset(failures=1)
+    name = serve(Handler) + '/a.png'
+    html = f'<p>文字</p><img src="{name}" />'
+    browser = newBrowser()
+
+    browser.setHtml2(html)
+    assert pump(app, 5000, lambda: len(Handler.paths) == 1)
+    pump(app, 200)
+    assert not loaded(browser, name)
+
+    # 下载失败的 占位图片 不算已经有的图片， 再次显示时 重新下载
+    browser.setHtml2(html)
+    assert pump(app, 5000, lambda: loaded(browser, name))
+    assert len(Handler.paths) == 2
+
+    # 下载成功后 不再下载
+    browser.setHtml2(html)
+    pump(app, 200)
+    assert len(Handler.paths) == 2
+
+    closeBrowser(app, browser)
+
+
+def test_lazy_pending_kept_across_setHtml2(app, serve):
+    Handler.reset()
+    name = serve(Handler) + '/b.png'
+    html = f'<p>文字</p><img src="{name}" />'
+    browser = newBrowser(lazyImages=True)
+
+    # 显示之前 设置两次， 第二次 不能丢掉 第一次还没有下载的图片
+    browser.setHtml2(html)
+    browser.setHtml2(html)
+    assert name in browser.lazyPending
+
+    browser.show()
+    assert pump(app, 5000, lambda: loaded(browser, name))
+    assert len(Handler.paths) == 1
+
+    closeBrowser(app, browser)
+
+
+def test_loading_image_not_fetched_again(app, serve):
+    Handler.reset(delay=0.3)
+    name = serve(Handler) + '/c.png'
+    html = f'<p>文字</p><img src="{name}" />'
+    browser = newBrowser(lazyImages=True)
+
+    browser.setHtml2(html)
+    browser.show()
+    assert pump(app, 5000, lambda: name in browser.imagesLoading)
+
+    # 正在下载时 再次设置， 不再放入 lazyPending， 下载完成后 替换占位图片
+    browser.setHtml2(html)
+    assert name not in browser.lazyPending
+    assert pump(app, 5000, lambda: loaded(browser, name))
+    pump(app, 100)
+    assert len(Handler.paths) == 1
+
+    closeBrowser(app, browser)
@@ -0,0 +1,79 @@
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from PySide6 import QtCore, QtGui
+
+from hyqt.utils import NAM
+from hyqt.richedit import ImageCache, RichTextBrowser
+from conftest import pump
+
+
+def pngBytes(width, height):
+    image = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor('blue'))
+    buffer = QtCore.QBuffer()
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    return bytes(buffer.data())
+
+
+class Handler(BaseHTTPRequestHandler):
+    body = pngBytes(200, 300)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+def imagesArrived(browser, names):
+    doc = browser.document()
+    return all(doc.resource(QtGui.QTextDocument.ImageResource, name).width() == 200 for name in names) \
+        and not browser.imagePatcher.timer.isActive()
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_image_lines_not_squeezed(app, serve, lazy):
+    ImageCache.single_instance = ImageCache(directory='')
+    base = serve(Handler)
+    names = [f'{base}/{i}.png' for i in range(3)]
+    html = ''.join(f'<p>第 {i} 段文字</p><img src="{name}" />' for i, name in enumerate(names))
+
+    browser = RichTextBrowser(html, nam=NAM(), lazyImages=lazy)
+    browser.resize(600, 400)
+    browser.show()
+    assert pump(app, 5000, lambda: imagesArrived(browser, names))
+    pump(app, 50)
+
+    # 图片所在的行 不能被压扁， 下一段 要在图片的下面
+    doc = browser.document()
+    docLayout = doc.documentLayout()
+    imageBlocks = 0
+    block = doc.begin()
+    while block.isValid():
+        if '\ufffc' in block.text():
+            imageBlocks += 1
+            top = docLayout.blockBoundingRect(block).top()
+            if block.next().isValid():
+                assert docLayout.blockBoundingRect(block.next()).top() >= top + 300
+        block = block.next()
+    assert imageBlocks == 3
+
+    # 图片到达后的布局 和 一开始就有图片、 没有设置行距的文档 一样高度
+    reference = QtGui.QTextDocument()
+    reference.setDefaultFont(doc.defaultFont())
+    reference.setTextWidth(doc.textWidth())
+    for name in names:
+        reference.addResource(QtGui.QTextDocument.ImageResource, name,
+                              doc.resource(QtGui.QTextDocument.ImageResource, name))
+    reference.setHtml(html)
+    assert doc.size().height() >= reference.size().height() - 3 * 20
+
+    browser.deleteLater()
+    app.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+    ImageCache.single_instance = None
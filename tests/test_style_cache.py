@@ -0,0 +1,33 @@
+import hyqt
+from hyqt import Label, setStyleCacheSize, styleCacheInfo
+
+
+def test_same_style_args_cached(app):
+    setStyleCacheSize(16)
+    first = Label('a', color='red', fontSize=13, padding='2px')
+    second = Label('b', color='red', fontSize=13, padding='2px')
+    Label('c', color='blue')
+
+    info = styleCacheInfo()
+    assert (info.hits, info.misses, info.currsize) == (1, 2, 2)
+    # 缓存的样式 和 新生成的 一样， 只有 选择器里 随机的 objectName 不同
+    assert first.styleSheet().split('{', 1)[1] == second.styleSheet().split('{', 1)[1]
+    assert 'color: red' in first.styleSheet()
+
+
+def test_cache_size_limit(app):
+    setStyleCacheSize(2)
+    try:
+        for size in range(10, 15):
+            Label('a', fontSize=size)
+        assert styleCacheInfo().currsize == 2
+    finally:
+        setStyleCacheSize(1024)
+
+
+def test_unhashable_args_not_cached(app):
+    setStyleCacheSize(16)
+    style, hoverStyle, hp, vp = hyqt._styleText(padding=['1px', '2px'])
+    assert "padding: ['1px', '2px']" in style
+    info = styleCacheInfo()
+    assert info.currsize == 0
@@ -0,0 +1,62 @@
+import pytest
+from PySide6 import QtGui
+from PySide6.QtWidgets import QApplication
+
+from hyqt import Column, Label, StyleRegistry
+from conftest import pump
+
+
+@pytest.fixture
+def registry():
+    StyleRegistry.enable()
+    yield StyleRegistry
+    StyleRegistry.enable(False)
+
+
+def textColor(widget):
+    widget.ensurePolished()
+    return widget.palette().color(QtGui.QPalette.WindowText).name()
+
+
+def test_same_style_one_rule(app, registry):
+    labels = [Label(f'a{i}', color='#ff0000') for i in range(5)]
+    host = Column(labels)
+    host.show()
+    pump(app)
+
+    names = {label.property(registry.propName) for label in labels}
+    assert len(names) == 1
+    name = names.pop()
+
+    # 控件自己 没有样式表， 规则只在 顶层窗口上 安装一次
+    assert all(label.styleSheet() == '' for label in labels)
+    assert host.styleSheet().count(f'="{name}"]') == 1
+    assert QApplication.instance().styleSheet() == ''
+    assert textColor(labels[0]) == '#ff0000'
+
+
+def test_new_style_appended_per_window(app, registry):
+    first = Column([Label('a', color='#00ff00')])
+    first.show()
+    pump(app)
+    before = first.styleSheet()
+
+    # 后来加入的 新样式 追加在后面， 原有的规则不变
+    late = Label('b', color='#0000ff')
+    first.append(late)
+    pump(app)
+    assert first.styleSheet().startswith(before)
+    assert f'="{late.property(registry.propName)}"]' in first.styleSheet()
+    assert textColor(late) == '#0000ff'
+
+    # 另一个窗口 只安装 它用到的规则
+    second = Column([Label('c', color='#00ff00')])
+    second.show()
+    pump(app)
+    assert f'="{late.property(registry.propName)}"]' not in second.styleSheet()
+
+
+def test_disabled_uses_own_stylesheet(app):
+    label = Label('a', color='#123456')
+    assert label.property(StyleRegistry.propName) is None
+    assert '#123456' in label.styleSheet()
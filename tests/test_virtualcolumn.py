@@ -0,0 +1,106 @@
+from PySide6.QtWidgets import QWidget
+from PySide6 import QtCore
+
+from hyqt import VirtualColumn
+from conftest import pump
+
+
+class Row(QWidget):
+    def __init__(self, item):
+        super().__init__()
+        self.item = item
+
+    def sizeHint(self):
+        return QtCore.QSize(100, self.item['h'])
+
+
+def setItem(row, item):
+    row.item = item
+    row.updateGeometry()
+
+
+def makeColumn(app, heights, rowHeight=30):
+    items = [{'h': h} for h in heights]
+    vc = VirtualColumn(items, build=Row, update=setItem, rowHeight=rowHeight, overscan=2)
+    vc.resize(300, 600)
+    vc.show()
+    pump(app)
+    return vc
+
+
+def checkFilled(vc):
+    # 显示的行 连续， 位置和测量的高度一致， 并且填满可视区域
+    viewTop = vc.verticalScrollBar().value()
+    viewBottom = viewTop + vc.viewport().height()
+    indexes = sorted(vc._visible)
+    assert indexes == list(range(indexes[0], indexes[-1] + 1))
+
+    offsets = vc._getOffsets()
+    for i in indexes:
+        geo = vc._visible[i].geometry()
+        assert geo.top() == offsets[i]
+        assert geo.height() == vc.items[i]['h']
+
+    first, last = indexes[0], indexes[-1]
+    assert offsets[first] <= viewTop or first == 0
+    assert offsets[last + 1] >= viewBottom or last == len(vc.items) - 1
+    return indexes
+
+
+def test_short_rows_fill_viewport(app):
+    vc = makeColumn(app, [12] * 1000)
+    indexes = checkFilled(vc)
+    assert vc._visible[indexes[-1]].geometry().bottom() >= 600
+
+    vc.verticalScrollBar().setValue(3000)
+    pump(app)
+    checkFilled(vc)
+
+
+def test_tall_rows_are_not_overbuilt(app):
+    vc = makeColumn(app, [200] * 1000)
+    indexes = checkFilled(vc)
+    # 600px 的可视区域 只需要 3 行， 加上上下 overscan
+    assert len(indexes) <= 3 + 1 + 2 * 2
+
+    vc.verticalScrollBar().setValue(50000)
+    pump(app)
+    indexes = checkFilled(vc)
+    assert len(indexes) <= 3 + 1 + 2 * 2
+
+
+def test_mixed_rows(app):
+    vc = makeColumn(app, [8 if i % 3 else 150 for i in range(3000)])
+    for value in [0, 777, 20000, 99999]:
+        vc.verticalScrollBar().setValue(value)
+        pump(app)
+        checkFilled(vc)
+    assert vc._canvas.height() == vc._getOffsets()[-1] - vc._spacing + vc._paddings[3]
+
+
+def test_insert_remove_keep_visible_rows(app):
+    vc = makeColumn(app, [12] * 100 + [90] * 100)
+
+    edits = [
+        lambda: vc.insert(3, {'h': 40}),
+        lambda: vc.remove(vc.items[10]),
+        lambda: vc.removeAt(0),
+        lambda: vc.append({'h': 5}),
+    ]
+    for edit in edits:
+        before = {id(vc.items[i]): w for i, w in vc._visible.items()}
+        edit()
+        indexes = checkFilled(vc)
+
+        # 编辑前后 都显示的数据， 行控件没有重建
+        kept = [i for i in indexes if id(vc.items[i]) in before]
+        assert len(kept) >= len(indexes) - 2
+        for i in kept:
+            assert vc._visible[i] is before[id(vc.items[i])]
+
+        # 平移后的位置 和 重新计算的一致
+        shifted = vc._getOffsets()
+        vc._offsets = None
+        assert vc._getOffsets() == shifted
+
+    assert len(vc.items) == 200
@@ -0,0 +1,90 @@
+import pytest
+from PySide6 import QtCore
+
+from hyqt import Column, Label, Button, WidgetPool
+from conftest import pump
+
+
+@pytest.fixture
+def pool():
+    WidgetPool.enable()
+    WidgetPool.hits = WidgetPool.misses = 0
+    yield WidgetPool
+    WidgetPool.enable(False)
+    WidgetPool.clear()
+
+
+def deletePending(app):
+    app.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+
+
+def test_pooled_widgets_survive_page_deletion(app, pool):
+    host = Column([])
+    host.show()
+    page = Column([Label('a', color='red'), Button('b', border='none')])
+    host.append(page)
+    pump(app)
+
+    page.clear(recycle=True)
+    host.remove(page, deleteAlso=True)
+    deletePending(app)
+    assert pool.size() == 2
+
+    label = Label('c', color='red')
+    button = Button('d', border='none')
+    assert pool.stats()['hits'] == 2
+    assert label.text() == 'c' and button.text() == 'd'
+
+    # 加入显示中的容器之前 不显示
+    assert not label.isVisible() and not button.isVisible()
+
+    page = Column([label, button])
+    host.append(page)
+    pump(app)
+    assert label.isVisible() and button.isVisible()
+    assert label.window() is host
+
+
+def test_remove_recycle(app, pool):
+    host = Column([Label('a', color='blue')])
+    host.show()
+    pump(app)
+
+    label = host.children[0]
+    host.remove(label, recycle=True)
+    assert not label.isVisible()
+    assert label.parentWidget() is not host
+
+    again = Label('b', color='blue')
+    assert again is label
+    host.append(again)
+    pump(app)
+    assert again.isVisible() and again.text() == 'b'
+
+
+def test_different_style_not_shared(app, pool):
+    host = Column([Label('a', color='blue')])
+    host.clear(recycle=True)
+    assert Label('b', color='green') is not None
+    assert pool.stats()['hits'] == 0
+
+
+def test_qt_property_kwargs_not_pooled(app, pool):
+    host = Column([Label('x', color='red', wordWrap=True)])
+    wrapped = host.children[0]
+    assert wrapped.wordWrap()
+
+    # 带 Qt 属性参数 创建的控件 不放入回收池， 不会把 wordWrap 带给后来的控件
+    host.clear(recycle=True)
+    assert pool.size() == 0
+    label = Label('w', color='red')
+    assert label is not wrapped and not label.wordWrap()
+
+    # 回收池里有相同样式的控件时， 带 Qt 属性参数的 也能正常创建
+    host = Column([label])
+    host.clear(recycle=True)
+    assert pool.size() == 1
+    again = Label('y', color='red', wordWrap=True)
+    assert again is not label
+    assert again.wordWrap() and again.text() == 'y'
+    assert pool.size() == 1